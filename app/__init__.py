@@ -16,5 +16,21 @@
 #  ├── config.py       - 配置文件，存储系统参数
 #  ├── wechat_handler.py - 微信消息处理模块
 #  ├── db_manager.py   - 数据库操作模块
+#  ├── db_pool.py      - 数据库连接池模块
 #  ├── recommendation_engine.py - 推荐算法模块
-#  └── utils.py        - 工具函数模块 
\ No newline at end of file
+#  ├── rating_matrix.py - 内存评分矩阵模块
+#  ├── rating_versions.py - 评分版本模块（多进程部署时让所有工作进程发现新评分）
+#  ├── snapshot_store.py - 按版本存储、内存映射加载的数组快照模块
+#  ├── similarity.py   - 用户相似度批量计算模块
+#  ├── neighbor_index.py - 离线预计算的Top-K邻居索引模块
+#  ├── item_similarity.py - 离线预计算的电影相似度表模块
+#  ├── movie_catalog.py - 内存电影目录模块
+#  ├── title_index.py  - 电影标题倒排索引模块
+#  ├── title_matcher.py - 容错标题匹配模块（错别字、繁简体、拼音首字母）
+#  ├── search_log_writer.py - 搜索记录异步批量写入模块
+#  ├── rating_importer.py - 外部评分数据批量导入工具
+#  ├── server.py       - 多进程服务模块（预先fork的cheroot工作进程）
+#  ├── metrics.py      - 性能指标模块（耗时直方图，Prometheus文本格式输出）
+#  ├── async_reply.py  - 异步回复模块（推荐超过微信回复时限时转为后台生成）
+#  ├── message_dedup.py - 消息去重模块（微信重试的消息返回第一次处理的回复）
+#  └── utils.py        - 工具函数模块（LRU缓存、请求合并等）
\ No newline at end of file
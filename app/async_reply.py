@@ -0,0 +1,479 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 异步回复模块：耗时的请求在回复时限内没有完成时先回复提示，结果在后台生成后再交给用户
+#
+# 微信服务器等待被动回复的时间为5秒，超时后会重试（最多3次），同一个请求被重复计算。
+# 推荐计算交给后台线程池，请求线程最多等待到回复时限：
+#   - 时限内完成：直接回复结果
+#   - 超时：回复提示消息，计算继续进行；完成后结果保存在回复存储中，用户下次发送"推荐"时直接返回，
+#     启用客服消息时改为主动推送给用户
+# 计算期间同一用户再次请求时不会重复计算。多进程部署时回复存储使用所有工作进程共享的SQLite文件，
+# 用户的下一条消息由其他工作进程处理时也能取到结果
+
+import os
+import time
+import logging
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from app import metrics
+from app.config import ASYNC_REPLY_CONFIG
+
+logger = logging.getLogger(__name__)
+
+ASYNC_REPLIES = metrics.counter(
+    'async_reply_total',
+    '需要在回复时限内完成的请求，按结果分类：inline 时限内完成，deferred 超时后转为后台生成，'
+    'coalesced 合并到正在进行的计算，served 下次请求时返回结果，stale 结果生成后用户又评分而丢弃，'
+    'pushed 通过客服消息推送，busy 后台任务已满时直接计算',
+    labels=('result',)
+)
+
+############################################################
+# 回复存储
+# 每个用户最多一条记录：状态（'pending' 计算中 / 'ready' 已生成）、回复内容、更新时间、
+# 版本（计算开始时调用方给出的版本，例如用户的评分版本，用于判断已生成的回复是否过时）
+# 每个存储提供：
+#   get(key, now)              -> (状态, 内容, 版本) 或 None，过期的记录视为不存在
+#   put(key, status, content, now, version=None)
+#   pop_ready(key, now)        -> (已生成的回复内容, 版本)（同时删除记录）或 None
+#   delete(key)
+#   ready_keys(now)            -> 有已生成的回复的全部用户
+############################################################
+class MemoryReplyStore:
+    """
+    进程内回复存储，只在单进程（'dev'模式）下能保证用户的下一条消息取到结果
+    """
+
+    def __init__(self, pending_timeout=60, result_ttl=600):
+        """
+        Args:
+            pending_timeout (float): 计算中的记录的有效期（秒），超过后视为计算已失败
+            result_ttl (float): 已生成的回复的保留时间（秒）
+        """
+        self.pending_timeout = pending_timeout
+        self.result_ttl = result_ttl
+        self._entries = {}  # 用户 -> (状态, 内容, 更新时间, 版本)
+        self._lock = threading.Lock()
+
+    def _valid(self, entry, now):
+        status, _, updated_at, _ = entry
+        ttl = self.pending_timeout if status == 'pending' else self.result_ttl
+        return now - updated_at < ttl
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or not self._valid(entry, now):
+            return None
+        return entry[0], entry[1], entry[3]
+
+    def put(self, key, status, content, now, version=None):
+        with self._lock:
+            # 顺便清理过期记录，存储不会随用户数无限增长
+            if len(self._entries) >= 1000 and key not in self._entries:
+                for old_key in [k for k, entry in self._entries.items() if not self._valid(entry, now)]:
+                    del self._entries[old_key]
+            self._entries[key] = (status, content, now, version)
+
+    def pop_ready(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != 'ready':
+                return None
+            del self._entries[key]
+        return (entry[1], entry[3]) if self._valid(entry, now) else None
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def ready_keys(self, now):
+        with self._lock:
+            return [key for key, entry in self._entries.items() if entry[0] == 'ready' and self._valid(entry, now)]
+
+class SQLiteReplyStore:
+    """
+    多进程共享的回复存储：所有工作进程读写同一个SQLite数据库文件
+    """
+
+    def __init__(self, path, pending_timeout=60, result_ttl=600, busy_timeout=1.0):
+        """
+        Args:
+            path (str): 数据库文件路径
+            pending_timeout (float): 计算中的记录的有效期（秒），超过后视为计算已失败
+            result_ttl (float): 已生成的回复的保留时间（秒）
+            busy_timeout (float): 等待其他进程释放写锁的最长时间（秒）
+        """
+        self.path = path
+        self.pending_timeout = pending_timeout
+        self.result_ttl = result_ttl
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # 每个线程一个连接；fork出的子进程不使用从父进程继承的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS async_replies ("
+            "  user_key TEXT PRIMARY KEY,"
+            "  status TEXT NOT NULL,"
+            "  content TEXT,"
+            "  updated_at REAL NOT NULL,"
+            "  version INTEGER"
+            ") WITHOUT ROWID"
+        )
+        # 早期版本创建的表没有version列（记录只保留result_ttl秒，补上列即可）
+        if 'version' not in [row[1] for row in conn.execute("PRAGMA table_info(async_replies)")]:
+            conn.execute("ALTER TABLE async_replies ADD COLUMN version INTEGER")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _expired_before(self, status, now):
+        return now - (self.pending_timeout if status == 'pending' else self.result_ttl)
+
+    def get(self, key, now):
+        row = self._connection().execute(
+            "SELECT status, content, updated_at, version FROM async_replies WHERE user_key = ?", (key,)
+        ).fetchone()
+        if row is None or row[2] < self._expired_before(row[0], now):
+            return None
+        return row[0], row[1], row[3]
+
+    def put(self, key, status, content, now, version=None):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO async_replies (user_key, status, content, updated_at, version) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, status, content, now, version)
+        )
+        # 清理过期记录：已生成的回复保留时间最长，早于该时间的记录都已过期
+        conn.execute("DELETE FROM async_replies WHERE updated_at < ?",
+                     (now - max(self.pending_timeout, self.result_ttl),))
+
+    def pop_ready(self, key, now):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT content, updated_at, version FROM async_replies WHERE user_key = ? AND status = 'ready'",
+                (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM async_replies WHERE user_key = ?", (key,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None or row[1] < self._expired_before('ready', now):
+            return None
+        return row[0], row[2]
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM async_replies WHERE user_key = ?", (key,))
+
+    def ready_keys(self, now):
+        # 记录在result_ttl后过期，表中只有最近的少量记录
+        rows = self._connection().execute(
+            "SELECT user_key FROM async_replies WHERE status = 'ready' AND updated_at >= ?",
+            (self._expired_before('ready', now),)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+def create_store(config):
+    """
+    按配置创建回复存储
+
+    Args:
+        config (dict): ASYNC_REPLY_CONFIG格式的配置
+
+    Returns:
+        MemoryReplyStore or SQLiteReplyStore: 回复存储
+    """
+    store = config.get('store', 'memory')
+    if store == 'memory':
+        return MemoryReplyStore(config['pending_timeout'], config['result_ttl'])
+    if store == 'sqlite':
+        return SQLiteReplyStore(config['sqlite_path'], config['pending_timeout'], config['result_ttl'])
+    raise ValueError(f"未知的异步回复存储: {store}")
+
+############################################################
+# 客服消息
+############################################################
+class CustomerServiceSender:
+    """
+    客服消息发送（替身实现）
+
+    正式实现需要公众号的AppID和AppSecret获取access_token，再调用客服消息接口
+    POST https://api.weixin.qq.com/cgi-bin/message/custom/send?access_token=ACCESS_TOKEN
+    （用户48小时内与公众号有过互动时可以发送）。config.py中的AppID和AppSecret目前未启用，
+    这里只记录日志并保留最近发送的消息，供调试和基准测试检查
+    """
+
+    def __init__(self, keep=100):
+        self.sent = []  # 最近发送的 (用户openid, 内容)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def send_text(self, openid, content):
+        """
+        向用户发送文本客服消息
+
+        Returns:
+            bool: 是否发送成功
+        """
+        logger.info(f"发送客服消息给用户 {openid}，长度 {len(content)}")
+        with self._lock:
+            self.sent.append((openid, content))
+            del self.sent[:-self.keep]
+        return True
+
+############################################################
+# 带回复时限的后台计算
+############################################################
+class _Job:
+    """一个用户正在后台进行的计算"""
+    __slots__ = ('future', 'lock', 'claimed', 'version')
+
+    def __init__(self, future, version=None):
+        self.future = future
+        self.lock = threading.Lock()
+        self.claimed = False  # 结果已由请求线程直接回复
+        self.version = version  # 计算开始时的版本，随结果一起保存
+
+class AsyncReplier:
+    """
+    在回复时限内等待后台计算，超时后把结果转交给回复存储或客服消息
+    """
+
+    def __init__(self, store, workers=4, max_pending=100, sender=None, ready_hint_interval=1.0):
+        """
+        Args:
+            store: 回复存储
+            workers (int): 后台计算线程数
+            max_pending (int): 本进程最多同时进行的后台计算数，超出时在请求线程中直接计算
+            sender (CustomerServiceSender, optional): 指定时超时的结果通过客服消息推送，否则等待用户下次请求
+            ready_hint_interval (float): has_ready重新读取"有已生成回复的用户"列表的间隔（秒）
+        """
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self.sender = sender
+        self.ready_hint_interval = ready_hint_interval
+        self._executor = None
+        self._jobs = {}  # 用户 -> _Job
+        self._lock = threading.Lock()
+        # 可能有已生成回复的用户（每隔ready_hint_interval秒从存储重新读取），不在其中的用户不必查询存储
+        self._ready_hint = frozenset()
+        self._ready_hint_at = float('-inf')
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='async-reply')
+        return self._executor
+
+    def run(self, key, func, deadline, version=None):
+        """
+        执行func()，最多等待到deadline
+
+        同一用户已有计算在进行时（包括其他工作进程中的计算）不重复计算，等待已有的计算
+
+        Args:
+            key (str): 用户标识
+            func (callable): 无参数、返回回复内容的函数
+            deadline (float): 回复时限（time.monotonic()时间）
+            version (int, optional): 计算开始前读取的版本，与超时后保存的结果一起保存，
+                take_ready/has_ready给出的版本与其不同时结果视为过时
+
+        Returns:
+            tuple: (是否已完成, 回复内容)；未完成时内容为None
+        """
+        job = self._jobs.get(key)
+        if job is None:
+            # 其他工作进程正在为该用户计算；存储的读写不在self._lock内进行，不让其他用户的请求等待磁盘I/O
+            try:
+                entry = self.store.get(key, time.time())
+            except Exception as e:
+                logger.error(f"查询用户 {key} 的异步回复记录失败: {e}")
+                entry = None
+            if entry is not None and entry[0] == 'pending':
+                ASYNC_REPLIES.inc('coalesced')
+                return False, None
+        with self._lock:
+            job = self._jobs.get(key)
+            coalesced = job is not None
+            if job is None and len(self._jobs) < self.max_pending:
+                # 先登记再写入计算中的记录：登记之后本进程中同一用户的请求等待这次计算
+                job = self._jobs[key] = _Job(Future(), version)
+        if job is None:
+            # 后台计算已满，退回到在请求线程中直接计算
+            ASYNC_REPLIES.inc('busy')
+            return True, func()
+        if coalesced:
+            ASYNC_REPLIES.inc('coalesced')
+        else:
+            # 计算结束（包括提交失败）时由回调移出登记并写入结果，登记不会残留
+            job.future.add_done_callback(lambda future: self._on_done(key, job))
+            self._start(key, job, func)
+
+        done, _ = wait([job.future], timeout=max(0.0, deadline - time.monotonic()))
+        if not done:
+            ASYNC_REPLIES.inc('deferred')
+            return False, None
+        with job.lock:
+            # 由本次请求直接回复。完成回调持有job.lock写入结果并移出登记，所以这里：
+            #   - 计算仍在登记中：回调尚未执行，删除计算中的记录，回调看到claimed后不再写入
+            #   - 已移出登记：回调已写入结果，只取走已生成的结果；该用户可能已开始新的计算，其计算中的记录不能删除
+            job.claimed = True
+            try:
+                if self._jobs.get(key) is job:
+                    self.store.delete(key)
+                else:
+                    self.store.pop_ready(key, time.time())
+            except Exception as e:
+                logger.error(f"删除用户 {key} 的异步回复记录失败: {e}")
+        ASYNC_REPLIES.inc('inline')
+        return True, job.future.result()
+
+    def _start(self, key, job, func):
+        """写入计算中的记录并提交后台计算，计算结果转交给job.future"""
+        try:
+            self.store.put(key, 'pending', None, time.time())
+        except Exception as e:
+            # 只影响其他工作进程合并同一用户的请求，计算照常进行
+            logger.error(f"写入用户 {key} 的计算中记录失败: {e}")
+
+        def execute():
+            try:
+                job.future.set_result(func())
+            except BaseException as e:
+                job.future.set_exception(e)
+
+        try:
+            self._get_executor().submit(execute)
+        except Exception as e:
+            logger.error(f"提交用户 {key} 的后台计算失败: {e}")
+            job.future.set_exception(e)
+
+    def _on_done(self, key, job):
+        with job.lock:
+            if job.claimed:
+                # 请求线程已直接回复并处理了存储中的记录
+                self._forget(key, job)
+                return
+            content = None
+            pushed = False
+            try:
+                content = job.future.result()
+            except Exception as e:
+                logger.error(f"用户 {key} 的后台计算失败: {e}")
+            if content is not None and self.sender is not None:
+                try:
+                    pushed = self.sender.send_text(key, content)
+                except Exception as e:
+                    logger.error(f"推送用户 {key} 的后台计算结果失败: {e}")
+                if pushed:
+                    ASYNC_REPLIES.inc('pushed')
+            # 先写入存储再移出登记：登记期间同一用户不会开始新的计算，写入不会覆盖新计算的记录
+            if self._jobs.get(key) is job:
+                try:
+                    if content is None or pushed:
+                        self.store.delete(key)
+                    else:
+                        self.store.put(key, 'ready', content, time.time(), job.version)
+                        self._ready_hint = self._ready_hint | {key}
+                except Exception as e:
+                    logger.error(f"保存用户 {key} 的后台计算结果失败: {e}")
+            self._forget(key, job)
+
+    def _forget(self, key, job):
+        with self._lock:
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def take_ready(self, key, version=None):
+        """
+        取出用户已生成的回复（取出后删除）
+
+        Args:
+            key (str): 用户标识
+            version (int, optional): 当前的版本，与计算开始时的版本不同（例如用户之后又评分了）时
+                丢弃已生成的回复
+
+        Returns:
+            str or None: 回复内容，没有已生成的回复或回复已过时时返回None
+        """
+        entry = self.store.pop_ready(key, time.time())
+        if entry is None:
+            return None
+        content, ready_version = entry
+        if ready_version != version:
+            ASYNC_REPLIES.inc('stale')
+            return None
+        ASYNC_REPLIES.inc('served')
+        return content
+
+    def has_ready(self, key, get_version=None):
+        """
+        用户是否有已生成、尚未取走且没有过时的回复
+
+        每条普通消息都会调用，不为每条消息查询存储：先检查可能有已生成回复的用户列表，
+        该列表每隔ready_hint_interval秒整体读取一次（其他工作进程生成的回复最多延迟这么久才会被提示），
+        只有列表中的用户才查询存储确认
+
+        Args:
+            key (str): 用户标识
+            get_version (callable, optional): 返回当前版本的函数，只在用户有已生成的回复时调用
+        """
+        now = time.monotonic()
+        if now - self._ready_hint_at >= self.ready_hint_interval:
+            self._ready_hint_at = now
+            self._ready_hint = frozenset(self.store.ready_keys(time.time()))
+        if key not in self._ready_hint:
+            return False
+        entry = self.store.get(key, time.time())
+        if entry is None or entry[0] != 'ready':
+            return False
+        version = get_version() if get_version is not None else None
+        return entry[2] == version
+
+    def abandon_pending(self):
+        """
+        删除本进程未完成计算的计算中记录（工作进程退出前调用），
+        其他工作进程收到这些用户的请求时会重新计算，而不是一直等待到pending_timeout
+        """
+        with self._lock:
+            keys = list(self._jobs)
+            self._jobs.clear()
+        for key in keys:
+            try:
+                self.store.delete(key)
+            except Exception as e:
+                logger.error(f"删除用户 {key} 的计算中记录失败: {e}")
+
+    def _reset_after_fork(self):
+        # 线程池和进行中的计算不会被fork到子进程
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._ready_hint_at = float('-inf')
+
+# 全局异步回复实例，后台线程池在首次使用时创建
+async_replier = AsyncReplier(
+    create_store(ASYNC_REPLY_CONFIG),
+    workers=ASYNC_REPLY_CONFIG['workers'],
+    max_pending=ASYNC_REPLY_CONFIG['max_pending'],
+    sender=CustomerServiceSender() if ASYNC_REPLY_CONFIG['customer_service'] else None,
+    ready_hint_interval=ASYNC_REPLY_CONFIG['ready_hint_interval']
+)
+os.register_at_fork(after_in_child=async_replier._reset_after_fork)
@@ -3,6 +3,10 @@
 # Mindsnap团队的电影推荐系统分团队 
 # 配置文件：存储系统运行所需的全局配置参数
 
+import os  # 用于拼接数据文件路径
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # 项目根目录
+
 ############################################################
 # 数据库配置
 # 这些参数用于建立与MySQL数据库的连接
@@ -16,6 +20,19 @@ DB_CONFIG = {
     'cursorclass': 'pymysql.cursors.DictCursor'  # 使用字典游标，查询结果将以字典形式返回，可通过字段名访问值
 }
 
+############################################################
+# 数据库连接池配置
+# 所有数据库操作共用连接池中的连接，避免每次查询都重新建立连接
+############################################################
+DB_POOL_CONFIG = {
+    'max_size': 10,  # 连接池最大连接数，应不超过MySQL的max_connections并为其他客户端预留余量
+    'acquire_timeout': 5,  # 连接全部被占用时，获取连接的最长等待时间（秒）
+    'max_idle_time': 300,  # 连接最长空闲时间（秒），应小于MySQL的wait_timeout，避免使用已被服务器断开的连接
+    'max_lifetime': 3600,  # 连接最长存活时间（秒），到期后关闭重建，防止长连接积累服务端资源
+    'reap_interval': 60  # 后台回收空闲连接的检查间隔（秒）
+}
+USER_ID_CACHE_SIZE = 100000  # 进程内缓存的openid到用户ID映射的最大数量，超出时淘汰最久未活跃的用户
+
 ############################################################
 # 微信公众号配置
 # 用于与微信公众平台进行安全通信
@@ -32,4 +49,159 @@ WECHAT_TOKEN = "HelloMindsnap"  # 微信公众号开发者配置中的Token，
 DEFAULT_RECOMMENDATIONS_COUNT = 3  # 默认一次返回的推荐电影数量，影响用户体验（太多会使消息过长）
 MAX_SEARCH_RESULTS = 3  # 模糊搜索时返回的最大结果数，防止搜索结果过多导致微信消息超长
 SIMILAR_USERS_COUNT = 10  # 协同过滤算法中寻找的相似用户数量，影响推荐多样性和准确性
-MIN_COMMON_RATINGS = 2  # 判断用户相似度时至少需要的共同评分电影数，值越大相似度计算越准确但可用邻居越少 
\ No newline at end of file
+MIN_COMMON_RATINGS = 2  # 判断用户相似度时至少需要的共同评分电影数，值越大相似度计算越准确但可用邻居越少
+RECOMMENDATION_ALGORITHM = 'user_cf'  # 综合推荐使用的协同过滤算法：'user_cf'（基于用户）或 'item_cf'（基于物品）
+
+############################################################
+# 内存评分矩阵配置
+# 新评分先写入增量日志，积累到一定数量后再合并进主矩阵
+############################################################
+RATING_MATRIX_COMPACT_THRESHOLD = 1000  # 增量日志中的评分条数达到该值时，在后台线程中合并进主矩阵
+RATING_MATRIX_COMPACT_INTERVAL = 600  # 距上次合并超过该时间（秒）且有新评分时，也会触发合并
+RATING_MATRIX_VERIFY_AFTER_COMPACT = True  # 合并完成后是否与ratings表做一致性校验，并修复不一致的用户
+RATING_MATRIX_LOAD_CHUNK_SIZE = 50000  # 从数据库加载评分矩阵时每次读取的评分行数（服务端游标分块读取）
+RATING_MATRIX_SNAPSHOT_DIR = os.path.join(PROJECT_ROOT, 'data', 'rating_matrix')  # 多进程模式下评分矩阵快照的存储目录
+# 各进程检查评分矩阵、邻居索引、电影相似度表是否发布了新版本的间隔（秒）
+SNAPSHOT_CHECK_INTERVAL = 5
+
+############################################################
+# 评分版本配置
+# 每次评分更新该用户的版本号（全局递增序号），其他工作进程据此发现自己没有处理到的评分
+# 'memory'：版本保存在进程内存中，只在单进程（'dev'模式）下可用
+# 'sqlite'：版本保存在所有工作进程共享的SQLite文件中，多进程部署时使用
+############################################################
+RATING_VERSION_CONFIG = {
+    'store': 'sqlite',  # 版本存储：'memory' 或 'sqlite'
+    'sqlite_path': os.path.join(PROJECT_ROOT, 'data', 'rating_versions.db')  # 'sqlite'存储的数据库文件
+}
+
+############################################################
+# 邻居索引配置
+# 离线预计算每个用户的Top-K相似用户，推荐时直接查询，无需实时计算相似度
+############################################################
+NEIGHBOR_INDEX_DIR = os.path.join(PROJECT_ROOT, 'data', 'neighbor_index')  # 邻居索引文件的存储目录
+NEIGHBOR_INDEX_REFRESH_INTERVAL = 3600  # 后台定时重建邻居索引的间隔（秒）
+NEIGHBOR_INDEX_REFRESH_AFTER_RATINGS = 500  # 自上次构建以来新增的评分数达到该值时，提前触发重建
+
+############################################################
+# 基于物品的协同过滤配置
+# 电影之间的相似度相对稳定，离线预计算并只保留每部电影最相似的Top-K部电影
+############################################################
+ITEM_SIMILARITY_DIR = os.path.join(PROJECT_ROOT, 'data', 'item_similarity')  # 电影相似度表的存储目录
+ITEM_SIMILARITY_TOP_K = 50  # 每部电影保留的相似电影数，越大推荐覆盖面越广，但存储和查询开销越大
+ITEM_SIMILARITY_MIN_COMMON = 5  # 判断电影相似度时至少需要的共同评分用户数
+ITEM_SIMILARITY_REFRESH_INTERVAL = 86400  # 后台重建电影相似度表的间隔（秒）
+
+############################################################
+# 推荐结果缓存配置
+# 用户评分没有变化时，重复请求"推荐"直接使用缓存的协同过滤结果（基于内容的补充每次重新选择）
+############################################################
+RECOMMENDATION_CACHE_SIZE = 10000  # 最多缓存的用户数，超出时淘汰最久未请求推荐的用户
+RECOMMENDATION_CACHE_TTL = 300  # 推荐结果的有效期（秒），过期后重新计算；与SERVER_CONFIG['refresh_interval']相当
+# 评分矩阵切换到新版本快照、邻居索引或电影相似度表重建后是否清空推荐结果缓存
+RECOMMENDATION_CACHE_CLEAR_ON_REBUILD = True
+
+############################################################
+# 电影目录缓存配置
+# 电影数据很少变化，启动时将展示所需的字段加载到内存，搜索和推荐不再逐条查询数据库
+############################################################
+MOVIE_CATALOG_REFRESH_INTERVAL = 600  # 后台重新加载电影目录的间隔（秒），电影数据被外部修改后最迟在该时间后生效
+
+############################################################
+# 请求合并配置
+# 多个用户同时发出相同的请求（例如同时搜索热门电影）时只执行一次，其他请求等待并共享结果
+############################################################
+SINGLE_FLIGHT_CONFIG = {
+    'max_waiters': 50,  # 每个正在执行的请求最多的等待者数量，超出时自行执行
+    'wait_timeout': 3,  # 等待相同请求完成的最长时间（秒），超时后自行执行，应小于微信的5秒回复时限
+    'search_result_ttl': 5,  # 数据库标题搜索结果在完成后的保留时间（秒），0表示只合并同时进行的请求
+    'search_cache_size': 1000  # 最多保留结果的搜索关键词数量
+}
+
+############################################################
+# 搜索记录写入配置
+# 搜索记录先放入内存队列，由后台线程批量写入数据库，不占用用户请求的响应时间
+############################################################
+SEARCH_LOG_CONFIG = {
+    'batch_size': 200,  # 每批最多写入的记录数，队列中积累到该数量时立即写入
+    'flush_interval': 2,  # 距上次写入超过该时间（秒）且有待写入记录时也会写入
+    'max_queue_size': 10000,  # 队列最大长度，数据库写入跟不上时最多积压的记录数
+    'overflow_policy': 'drop',  # 队列已满时的处理方式：'drop' 丢弃新记录；'block' 等待队列有空位
+    'block_timeout': 0.05  # overflow_policy为'block'时最长等待时间（秒），超时后仍丢弃，避免阻塞用户请求
+}
+
+############################################################
+# 速率限制配置
+# 'memory'：计数保存在进程内存中，只在单进程（'dev'模式）下准确
+# 'sqlite'：计数保存在所有工作进程共享的SQLite文件中（滑动窗口计数算法），多进程部署时使用
+############################################################
+RATE_LIMIT_CONFIG = {
+    'backend': 'sqlite',  # 存储后端：'memory' 或 'sqlite'
+    'max_requests': 10,  # 时间窗口内每个用户最多的请求数
+    'time_window': 60,  # 时间窗口（秒）
+    'sqlite_path': os.path.join(PROJECT_ROOT, 'data', 'rate_limit.db'),  # 'sqlite'后端的数据库文件，也可以放在/dev/shm下
+    'evict_interval': 60  # 清理空闲用户计数的间隔（秒），空闲用户不会一直占用内存或数据库空间
+}
+
+############################################################
+# 异步回复配置
+# 微信服务器等待被动回复5秒，超时后重试。推荐在回复时限内没有完成时先回复提示消息，
+# 结果在后台生成，用户下次发送"推荐"时直接返回（或通过客服消息推送）
+# 'memory'：回复存储在进程内存中，只在单进程（'dev'模式）下可用
+# 'sqlite'：回复存储在所有工作进程共享的SQLite文件中，多进程部署时使用
+############################################################
+ASYNC_REPLY_CONFIG = {
+    'enabled': True,  # 是否启用，关闭时推荐在请求线程中同步计算
+    'reply_budget': 4.0,  # 从开始处理消息起的回复时限（秒），比微信的5秒少，留出网络传输和构建回复的时间
+    'workers': 4,  # 每个进程的后台计算线程数
+    'max_pending': 100,  # 每个进程最多同时进行的后台计算数，超出时在请求线程中直接计算
+    'pending_timeout': 60,  # 计算中状态的有效期（秒），超过后视为计算失败，用户再次请求时重新计算
+    'result_ttl': 600,  # 已生成的推荐结果的保留时间（秒），超过后用户再次请求时重新计算
+    # 其他消息附带"推荐已生成"提示时，各进程重新读取有已生成结果的用户列表的间隔（秒），不为每条消息查询存储
+    'ready_hint_interval': 1.0,
+    'store': 'sqlite',  # 回复存储：'memory' 或 'sqlite'
+    'sqlite_path': os.path.join(PROJECT_ROOT, 'data', 'async_reply.db'),  # 'sqlite'存储的数据库文件
+    'customer_service': False  # 是否通过客服消息主动推送超时的结果（需要AppID和AppSecret，当前为只记录日志的替身实现）
+}
+
+############################################################
+# 消息去重配置
+# 微信服务器5秒内没有收到回复时会重新发送同一条消息，重复的消息直接返回第一次处理的回复
+# 'memory'：去重表保存在进程内存中，只在单进程（'dev'模式）下可用
+# 'sqlite'：去重表保存在所有工作进程共享的SQLite文件中，多进程部署时使用
+############################################################
+MESSAGE_DEDUP_CONFIG = {
+    'enabled': True,  # 是否启用
+    'ttl': 30,  # 已处理消息的回复保留时间（秒），微信的3次重试在约15秒内完成
+    'pending_timeout': 15,  # 处理中记录的有效期（秒），超过后视为处理进程已退出，重试的消息重新处理
+    'store': 'sqlite',  # 去重表存储：'memory' 或 'sqlite'
+    'sqlite_path': os.path.join(PROJECT_ROOT, 'data', 'message_dedup.db'),  # 'sqlite'存储的数据库文件
+    'poll_interval': 0.05  # 等待其他工作进程处理同一条消息时查询去重表的间隔（秒）
+}
+
+############################################################
+# 性能指标配置
+# 消息处理各阶段、数据库查询和推荐计算的耗时统计，通过 /metrics 以Prometheus文本格式输出
+############################################################
+METRICS_CONFIG = {
+    'directory': os.path.join(PROJECT_ROOT, 'data', 'metrics'),  # 多进程模式下各工作进程写入指标快照的目录
+    'flush_interval': 5,  # 工作进程写入指标快照的间隔（秒），/metrics输出的其他进程数据最多落后该时间
+    'allowed_ips': ['127.0.0.1', '::1']  # 允许访问 /metrics 的客户端IP，空列表表示不限制
+}
+
+############################################################
+# 服务进程配置
+# 'prefork'：主进程加载推荐数据后fork多个工作进程，每个进程多线程处理请求（生产部署）
+# 'dev'：web.py内置的开发服务器，单进程，用于本地调试
+############################################################
+SERVER_CONFIG = {
+    'mode': 'prefork',  # 服务模式：'prefork' 或 'dev'
+    'host': '0.0.0.0',  # 监听地址
+    'workers': max(2, os.cpu_count() or 1),  # 工作进程数，默认与CPU核数相同（至少2个）
+    'threads': 10,  # 每个工作进程处理请求的线程数
+    'graceful_timeout': 10,  # 停止或重载时等待工作进程处理完当前请求的最长时间（秒）
+    'reload_interval': 3600,  # 自动平滑重载（重新加载全部数据并替换工作进程）的间隔（秒），0表示只在收到SIGHUP时重载
+    # 主进程刷新评分矩阵快照（及按需重建邻居索引）的间隔（秒），工作进程不重启，直接切换到新版本；0表示不刷新
+    'refresh_interval': 300,
+    'backlog': 128  # 监听队列长度
+}
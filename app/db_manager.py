@@ -7,8 +7,18 @@
 # 导入必要的库
 ############################################################
 import pymysql  # MySQL数据库连接库
+import functools  # 保留被计时的数据库函数的名称和文档
 import logging  # 日志库，用于记录系统运行信息
-from app.config import DB_CONFIG  # 导入数据库配置信息
+import os  # 注册fork后的连接池重置函数
+import threading  # 线程库，用于保护全局连接池的初始化
+import time  # 时间库，用于连接失败后的重试等待
+from contextlib import contextmanager  # 上下文管理器装饰器，用于自动归还连接
+from app.config import DB_CONFIG, DB_POOL_CONFIG  # 导入数据库及连接池配置信息
+from app.config import USER_ID_CACHE_SIZE  # openid到用户ID缓存的容量
+from app.config import SINGLE_FLIGHT_CONFIG  # 相同搜索请求的合并配置
+from app.db_pool import ConnectionPool  # 数据库连接池
+from app.utils import LRUCache, SingleFlight  # LRU缓存，用于缓存openid到用户ID的映射；请求合并
+from app import metrics  # 性能指标，统计每个数据库函数的查询次数和耗时
 
 ############################################################
 # 配置日志系统
@@ -17,15 +27,30 @@ from app.config import DB_CONFIG  # 导入数据库配置信息
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
 
+_IN_QUERY_BATCH_SIZE = 500  # 批量查询时每条 IN (...) 语句最多包含的ID数
+CATALOG_PLOT_SUMMARY_CHARS = 61  # 电影目录中保留的剧情简介字符数
+
+# openid -> 用户ID 缓存，用户ID创建后不会改变，因此不设过期时间
+_user_id_cache = LRUCache(max_size=USER_ID_CACHE_SIZE)
+
+# 标题搜索的请求合并：多个用户同时搜索同一个标题时只查询一次数据库，结果短暂保留
+_search_flight = SingleFlight(
+    max_waiters=SINGLE_FLIGHT_CONFIG['max_waiters'],
+    wait_timeout=SINGLE_FLIGHT_CONFIG['wait_timeout'],
+    result_ttl=SINGLE_FLIGHT_CONFIG['search_result_ttl'],
+    max_size=SINGLE_FLIGHT_CONFIG['search_cache_size']
+)
+
 ############################################################
 # 数据库连接管理
 ############################################################
 def get_db_connection():
     """
-    创建并返回MySQL数据库连接对象
+    创建并返回新的MySQL数据库连接对象
     
     根据config.py中的DB_CONFIG配置信息建立与MySQL数据库的连接
     处理特殊情况：如果cursorclass是字符串形式，需要转换为实际的类
+    业务代码不应直接调用此函数，而是通过db_connection()从连接池获取连接
     
     Returns:
         pymysql.connections.Connection: 数据库连接对象
@@ -47,23 +72,21 @@ def get_db_connection():
                 if config['cursorclass'] == 'pymysql.cursors.DictCursor':
                     config['cursorclass'] = pymysql.cursors.DictCursor
             
-            # 添加连接超时和自动重连配置
+            # 添加连接超时配置
             config.update({
                 'connect_timeout': 10,  # 连接超时10秒
                 'read_timeout': 30,     # 读取超时30秒
                 'write_timeout': 30,    # 写入超时30秒
-                'autocommit': False,    # 禁用自动提交，手动控制事务
-                'ping': True           # 启用连接保活
+                # 连接会被连接池反复复用，开启自动提交，避免只读查询留下未结束的事务
+                # （可重复读隔离级别下，未结束的事务会让后续查询一直看到旧数据）
+                # 需要多条语句组成事务时，显式调用conn.begin()并在结束时commit()
+                'autocommit': True
             })
             
             # 使用配置信息创建数据库连接
+            # 连接可用性由连接池在取出连接时检查，这里不再额外执行测试查询
             conn = pymysql.connect(**config)
             
-            # 测试连接是否正常
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT 1")
-                cursor.fetchone()
-            
             logger.info("数据库连接成功")
             return conn
             
@@ -76,7 +99,6 @@ def get_db_connection():
                 raise
             
             # 等待一段时间后重试
-            import time
             time.sleep(1)
             
         except Exception as e:
@@ -84,9 +106,173 @@ def get_db_connection():
             logger.error(f"数据库连接失败: {e}")
             raise
 
+# 全局连接池实例，首次使用时创建
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """
+    获取全局数据库连接池，首次调用时按DB_POOL_CONFIG创建
+    
+    Returns:
+        ConnectionPool: 全局连接池
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(get_db_connection, **DB_POOL_CONFIG)
+    return _pool
+
+def init_pool(connect_func=None, **options):
+    """
+    重新创建全局连接池，关闭旧连接池中的空闲连接
+    
+    用于切换数据源（例如基准测试使用的本地替身数据库）或调整连接池参数
+    
+    Args:
+        connect_func (callable, optional): 创建连接的函数，默认使用get_db_connection
+        **options: 连接池参数，未指定的项使用DB_POOL_CONFIG中的配置
+        
+    Returns:
+        ConnectionPool: 新的全局连接池
+    """
+    global _pool
+    pool_options = DB_POOL_CONFIG.copy()
+    pool_options.update(options)
+    with _pool_lock:
+        old_pool = _pool
+        _pool = ConnectionPool(connect_func or get_db_connection, **pool_options)
+    if old_pool is not None:
+        old_pool.close()
+    return _pool
+
+def close_pool():
+    """
+    关闭全局连接池，下次使用时重新创建
+    
+    多进程部署时主进程在fork工作进程之前调用，主进程加载数据用过的连接不会被子进程继承使用
+    """
+    global _pool
+    with _pool_lock:
+        old_pool, _pool = _pool, None
+    if old_pool is not None:
+        old_pool.close()
+
+def _reset_pool_after_fork():
+    """
+    fork后在子进程中丢弃继承的连接池
+    
+    继承的连接与父进程共用同一个socket，子进程不能使用，也不能关闭（关闭会发送COM_QUIT断开父进程的连接），
+    只丢弃引用，子进程首次访问数据库时创建自己的连接池
+    """
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+@contextmanager
+def db_connection():
+    """
+    从连接池获取数据库连接的上下文管理器，退出时自动归还连接
+    
+    用法:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+    
+    Raises:
+        PoolExhaustedError: 连接池已满且等待超时
+    """
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        DB_CONNECTION_WAIT_SECONDS.observe(time.perf_counter() - start)
+        yield _TimedConnection(conn)
+
+############################################################
+# 数据库性能指标
+# 公开的数据函数用@_timed记录整体耗时，函数内通过db_connection()执行的每条SQL语句
+# 按该函数名分别统计次数和耗时（db_query_seconds_count即查询次数）
+############################################################
+DB_CALL_SECONDS = metrics.histogram(
+    'db_call_seconds', '数据库函数的耗时（秒），包括获取连接和处理结果', labels=('function',)
+)
+DB_QUERY_SECONDS = metrics.histogram(
+    'db_query_seconds', '单条SQL语句的执行耗时（秒），按执行该语句的数据库函数分类', labels=('function',)
+)
+DB_CONNECTION_WAIT_SECONDS = metrics.histogram(
+    'db_connection_wait_seconds', '从连接池获取连接的耗时（秒），包括新建连接和等待空闲连接'
+)
+
+_call_context = threading.local()  # 当前线程正在执行的数据库函数名
+
+def _timed(func):
+    """记录数据库函数的耗时，函数内执行的SQL语句按该函数名统计"""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_call_context, 'function', None)
+        _call_context.function = name
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DB_CALL_SECONDS.observe(time.perf_counter() - start, name)
+            _call_context.function = outer
+    return wrapper
+
+class _TimedCursor:
+    """记录execute/executemany耗时的游标代理，其余属性和方法直接转给原游标"""
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, getattr(_call_context, 'function', None) or 'other')
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - start, getattr(_call_context, 'function', None) or 'other')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._cursor.__exit__(*exc_info)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _TimedConnection:
+    """创建_TimedCursor的连接代理，其余属性和方法直接转给原连接"""
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
 ############################################################
 # 用户相关函数
 ############################################################
+@_timed
 def get_user_by_openid(openid):
     """
     根据微信openid查询用户信息
@@ -100,22 +286,21 @@ def get_user_by_openid(openid):
         dict or None: 用户记录字典，包含用户的所有字段信息；如果不存在则返回None
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 执行查询SQL
-            sql = "SELECT * FROM users WHERE openid = %s"
-            cursor.execute(sql, (openid,))
-            # 获取查询结果
-            result = cursor.fetchone()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接，退出with代码块时自动归还
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 执行查询SQL
+                sql = "SELECT * FROM users WHERE openid = %s"
+                cursor.execute(sql, (openid,))
+                # 获取查询结果
+                result = cursor.fetchone()
         return result
     except Exception as e:
         # 记录错误信息
         logger.error(f"查询用户失败 (openid: {openid}): {e}")
         return None
 
+@_timed
 def create_user(openid, nickname=None):
     """
     创建新用户
@@ -132,36 +317,34 @@ def create_user(openid, nickname=None):
     Raises:
         Exception: 创建用户失败时抛出异常
     """
-    conn = None
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 执行插入SQL
-            sql = "INSERT INTO users (openid, nickname) VALUES (%s, %s)"
-            cursor.execute(sql, (openid, nickname))
-        # 提交事务
-        conn.commit()
-        # 获取刚插入的用户ID
-        user_id = cursor.lastrowid
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 执行插入SQL
+                sql = "INSERT INTO users (openid, nickname) VALUES (%s, %s)"
+                cursor.execute(sql, (openid, nickname))
+                # 获取刚插入的用户ID
+                user_id = cursor.lastrowid
+            # 提交事务
+            conn.commit()
         # 记录成功信息
         logger.info(f"创建新用户成功 (ID: {user_id}, openid: {openid})")
         return user_id
     except Exception as e:
         # 记录错误信息
         logger.error(f"创建用户失败 (openid: {openid}): {e}")
-        # 确保数据库连接被关闭
-        if conn:
-            conn.close()
         raise
 
+@_timed
 def get_user_id_by_openid(openid):
     """
     根据openid获取用户ID，如果用户不存在则先创建
     
     这是一个便捷函数，用于获取或创建用户ID，是大多数功能的前置操作
+    已解析过的openid直接从进程内缓存返回，不访问数据库；
+    缓存未命中时用一条 INSERT ... ON DUPLICATE KEY UPDATE 语句完成"查找或创建"，
+    两个请求同时为同一个新用户创建记录时也不会触发唯一键冲突
     
     Args:
         openid (str): 微信用户的唯一标识OpenID
@@ -169,18 +352,81 @@ def get_user_id_by_openid(openid):
     Returns:
         int: 用户ID
     """
-    # 先尝试查找用户
-    user = get_user_by_openid(openid)
-    if user:
-        # 用户存在，返回ID
-        return user['id']
-    else:
-        # 用户不存在，创建新用户并返回ID
-        return create_user(openid)
+    user_id = _user_id_cache.get(openid)
+    if user_id is None:
+        user_id = upsert_user(openid)
+        _user_id_cache.set(openid, user_id)
+    return user_id
+
+@_timed
+def upsert_user(openid):
+    """
+    查找或创建用户，一次数据库往返返回用户ID
+    
+    用户已存在时 ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id) 不修改任何数据，
+    只是把已有用户的ID设为本次的LAST_INSERT_ID，因此两种情况下cursor.lastrowid都是该用户的ID
+    （InnoDB对已存在的用户仍会占用一个自增值，users.id可能出现间隔，不影响使用）
+    
+    Args:
+        openid (str): 微信用户的唯一标识OpenID
+        
+    Returns:
+        int: 用户ID
+        
+    Raises:
+        Exception: 数据库操作失败时抛出异常
+    """
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                sql = "INSERT INTO users (openid) VALUES (%s) ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID(id)"
+                cursor.execute(sql, (openid,))
+                user_id = cursor.lastrowid
+                # 影响行数为1表示新插入，为0表示用户已存在
+                if cursor.rowcount == 1:
+                    logger.info(f"创建新用户成功 (ID: {user_id}, openid: {openid})")
+        return user_id
+    except Exception as e:
+        logger.error(f"查找或创建用户失败 (openid: {openid}): {e}")
+        raise
+
+@_timed
+def upsert_users(openids):
+    """
+    批量查找或创建用户（数据导入时使用）
+    
+    每批先用一条多行 INSERT IGNORE 创建不存在的用户，再用一条 IN 查询取回全部用户ID
+    
+    Args:
+        openids (iterable): OpenID列表
+        
+    Returns:
+        dict: {openid: 用户ID}
+        
+    Raises:
+        Exception: 数据库操作失败时抛出异常
+    """
+    unique_openids = list(dict.fromkeys(openids))
+    user_ids = {}
+    if not unique_openids:
+        return user_ids
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            for start in range(0, len(unique_openids), _IN_QUERY_BATCH_SIZE):
+                batch = unique_openids[start:start + _IN_QUERY_BATCH_SIZE]
+                cursor.executemany("INSERT IGNORE INTO users (openid) VALUES (%s)", [(openid,) for openid in batch])
+                if cursor.rowcount:
+                    logger.info(f"批量创建新用户 {cursor.rowcount} 个")
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(f"SELECT id, openid FROM users WHERE openid IN ({placeholders})", batch)
+                for row in cursor.fetchall():
+                    user_ids[row['openid']] = row['id']
+    return user_ids
 
 ############################################################
 # 电影相关函数
 ############################################################
+@_timed
 def get_movie_by_id(movie_id):
     """
     根据电影ID查询电影详细信息
@@ -194,22 +440,98 @@ def get_movie_by_id(movie_id):
         dict or None: 电影记录字典，包含电影的所有字段信息；如果不存在则返回None
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 执行查询SQL
-            sql = "SELECT * FROM movies WHERE id = %s"
-            cursor.execute(sql, (movie_id,))
-            # 获取查询结果
-            result = cursor.fetchone()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 执行查询SQL
+                sql = "SELECT * FROM movies WHERE id = %s"
+                cursor.execute(sql, (movie_id,))
+                # 获取查询结果
+                result = cursor.fetchone()
         return result
     except Exception as e:
         # 记录错误信息
         logger.error(f"查询电影失败 (ID: {movie_id}): {e}")
         return None
 
+@_timed
+def get_movies_by_ids(movie_ids):
+    """
+    根据电影ID列表批量查询电影详细信息
+
+    使用一条 IN (...) 查询取回所有电影，代替逐个调用get_movie_by_id；
+    ID很多时按批次查询，每批一条SQL，共用同一个连接
+
+    Args:
+        movie_ids (list): 电影ID列表
+
+    Returns:
+        list: 电影记录字典列表，顺序与movie_ids一致；不存在的电影被跳过，重复的ID只返回一次
+    """
+    # 去重并保持原顺序
+    unique_ids = list(dict.fromkeys(movie_ids))
+    if not unique_ids:
+        return []
+    try:
+        movies_by_id = {}
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                for start in range(0, len(unique_ids), _IN_QUERY_BATCH_SIZE):
+                    batch = unique_ids[start:start + _IN_QUERY_BATCH_SIZE]
+                    # 动态生成SQL参数占位符，如 IN (%s, %s, %s)
+                    placeholders = ', '.join(['%s'] * len(batch))
+                    sql = f"SELECT * FROM movies WHERE id IN ({placeholders})"
+                    cursor.execute(sql, batch)
+                    for movie in cursor.fetchall():
+                        movies_by_id[movie['id']] = movie
+        # IN查询不保证返回顺序，按请求的顺序重新排列
+        return [movies_by_id[movie_id] for movie_id in unique_ids if movie_id in movies_by_id]
+    except Exception as e:
+        # 记录错误信息
+        logger.error(f"批量查询电影失败 (IDs: {unique_ids}): {e}")
+        return []
+
+@_timed
+def get_catalog_movies(movie_ids=None):
+    """
+    查询电影目录（只包含展示和推荐需要的字段）
+
+    不读取actors、directors等大字段，剧情简介只取前CATALOG_PLOT_SUMMARY_CHARS个字符
+    （展示时最多显示60个字符，多取一个字符用于判断是否需要加省略号）
+
+    Args:
+        movie_ids (list, optional): 只查询这些电影，默认查询全部电影
+
+    Returns:
+        list: 电影记录字典列表
+
+    Raises:
+        Exception: 查询失败时抛出异常
+    """
+    sql = (
+        "SELECT id, title, douban_rating, rating_count, release_date, genres, "
+        f"LEFT(plot_summary, {CATALOG_PLOT_SUMMARY_CHARS}) AS plot_summary FROM movies"
+    )
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                if movie_ids is None:
+                    cursor.execute(sql)
+                    return cursor.fetchall()
+                result = []
+                movie_ids = list(movie_ids)
+                for start in range(0, len(movie_ids), _IN_QUERY_BATCH_SIZE):
+                    batch = movie_ids[start:start + _IN_QUERY_BATCH_SIZE]
+                    placeholders = ', '.join(['%s'] * len(batch))
+                    cursor.execute(f"{sql} WHERE id IN ({placeholders})", batch)
+                    result.extend(cursor.fetchall())
+                return result
+    except Exception as e:
+        logger.error(f"查询电影目录失败: {e}")
+        raise
+
+@_timed
 def search_movies_by_title_exact(title):
     """
     精确匹配电影标题
@@ -223,22 +545,24 @@ def search_movies_by_title_exact(title):
         list: 匹配的电影记录列表，可能包含多个同名电影
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
+        # 同时搜索同一标题的请求共享一次查询
+        return list(_search_flight.do(('exact', title), _query_movies_by_title_exact, title))
+    except Exception as e:
+        # 记录错误信息
+        logger.error(f"精确搜索电影失败 (title: {title}): {e}")
+        return []
+
+def _query_movies_by_title_exact(title):
+    # 从连接池获取数据库连接
+    with db_connection() as conn:
         with conn.cursor() as cursor:
             # 执行精确匹配查询SQL
             sql = "SELECT * FROM movies WHERE title = %s"
             cursor.execute(sql, (title,))
             # 获取所有匹配结果
-            result = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
-        return result
-    except Exception as e:
-        # 记录错误信息
-        logger.error(f"精确搜索电影失败 (title: {title}): {e}")
-        return []
+            return cursor.fetchall()
 
+@_timed
 def search_movies_by_title_fuzzy(title, limit=5):
     """
     模糊匹配电影标题
@@ -254,21 +578,31 @@ def search_movies_by_title_fuzzy(title, limit=5):
         list: 匹配的电影记录列表
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
+        # 同时搜索同一关键词的请求共享一次查询
+        return list(_search_flight.do(('fuzzy', title, limit), _query_movies_by_title_fuzzy, title, limit))
+    except Exception as e:
+        # 记录错误信息
+        logger.error(f"模糊搜索电影失败 (title: {title}): {e}")
+        return []
+
+def _query_movies_by_title_fuzzy(title, limit):
+    # 从连接池获取数据库连接
+    with db_connection() as conn:
         with conn.cursor() as cursor:
             # 执行模糊匹配查询SQL，按豆瓣评分排序
             sql = "SELECT * FROM movies WHERE title LIKE %s ORDER BY douban_rating DESC LIMIT %s"
             cursor.execute(sql, (f'%{title}%', limit))
             # 获取所有匹配结果
-            result = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
-        return result
-    except Exception as e:
-        # 记录错误信息
-        logger.error(f"模糊搜索电影失败 (title: {title}): {e}")
-        return []
+            return cursor.fetchall()
+
+def get_search_flight_stats():
+    """
+    获取标题搜索请求合并的统计信息
+
+    Returns:
+        dict: 执行、共享、缓存命中、超出上限和等待超时次数，以及正在进行的查询数
+    """
+    return _search_flight.stats()
 
 def get_movie_details_for_display(movie_records, max_movies_to_display=3, max_total_chars=580):
     """
@@ -384,11 +718,53 @@ def get_movie_details_for_display(movie_records, max_movies_to_display=3, max_to
 ############################################################
 # 评分相关函数
 ############################################################
+# 评分变更监听函数列表，评分写入数据库成功后依次调用
+# 用于让内存中的评分矩阵、缓存等数据随评分变化立即更新，而不需要重新加载
+_rating_listeners = []
+
+def add_rating_listener(listener):
+    """
+    注册评分变更监听函数
+
+    Args:
+        listener (callable): 监听函数，参数为 (user_id, movie_id, score)
+    """
+    if listener not in _rating_listeners:
+        _rating_listeners.append(listener)
+
+def _notify_rating_listeners(user_id, movie_id, score):
+    """
+    通知所有监听函数评分已变更，单个监听函数出错不影响其他监听函数和评分结果
+    """
+    for listener in _rating_listeners:
+        try:
+            listener(user_id, movie_id, score)
+        except Exception as e:
+            logger.error(f"评分变更监听函数执行失败 (用户ID: {user_id}, 电影ID: {movie_id}): {e}")
+
+def _clamp_score(score):
+    """验证评分范围并自动调整到0-10"""
+    score = float(score)
+    if score < 0:
+        return 0.0
+    if score > 10:
+        return 10.0
+    return score
+
+# 评分写入语句：用户已评价过该电影时（uniq_user_movie_rating冲突）改为更新评分
+_RATING_UPSERT_SQL = (
+    "INSERT INTO ratings (user_id, movie_id, score) VALUES (%s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE score = VALUES(score), rated_at = NOW()"
+)
+
+@_timed
 def add_or_update_rating(user_id, movie_id, score):
     """
     添加或更新用户对电影的评分
     
-    如果用户之前已对该电影评分，则更新评分；否则添加新评分
+    如果用户之前已对该电影评分，则更新评分；否则添加新评分。
+    一条 INSERT ... ON DUPLICATE KEY UPDATE 语句完成，影响行数为1表示新增，为2表示更新
+    （评分与评分时间都没有变化时为0，按更新计）
     
     Args:
         user_id (int): 用户ID
@@ -396,49 +772,83 @@ def add_or_update_rating(user_id, movie_id, score):
         score (float): 评分 (0-10)
         
     Returns:
-        bool: 成功返回True，失败返回False
+        dict: 成功返回 {'inserted': 新增数, 'updated': 更新数}，失败返回None
     """
-    conn = None
     try:
-        # 验证评分范围并自动调整
-        score = float(score)
-        if score < 0:
-            score = 0
-        elif score > 10:
-            score = 10
+        score = _clamp_score(score)
         
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 检查评分是否已存在
-            check_sql = "SELECT id FROM ratings WHERE user_id = %s AND movie_id = %s"
-            cursor.execute(check_sql, (user_id, movie_id))
-            existing_rating = cursor.fetchone()
-            
-            if existing_rating:
-                # 更新已有评分
-                update_sql = "UPDATE ratings SET score = %s, rated_at = NOW() WHERE user_id = %s AND movie_id = %s"
-                cursor.execute(update_sql, (score, user_id, movie_id))
-                logger.info(f"更新评分 (用户ID: {user_id}, 电影ID: {movie_id}, 评分: {score})")
-            else:
-                # 添加新评分
-                insert_sql = "INSERT INTO ratings (user_id, movie_id, score) VALUES (%s, %s, %s)"
-                cursor.execute(insert_sql, (user_id, movie_id, score))
-                logger.info(f"添加评分 (用户ID: {user_id}, 电影ID: {movie_id}, 评分: {score})")
-        
-        # 提交事务
-        conn.commit()
-        # 关闭数据库连接
-        conn.close()
-        return True
+        # 从连接池获取数据库连接（自动提交，单条语句即为一个事务）
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(_RATING_UPSERT_SQL, (user_id, movie_id, score))
+                inserted = cursor.rowcount == 1
+        if inserted:
+            logger.info(f"添加评分 (用户ID: {user_id}, 电影ID: {movie_id}, 评分: {score})")
+        else:
+            logger.info(f"更新评分 (用户ID: {user_id}, 电影ID: {movie_id}, 评分: {score})")
+        # 评分已写入数据库，通知内存数据同步更新
+        _notify_rating_listeners(user_id, movie_id, score)
+        return {'inserted': int(inserted), 'updated': int(not inserted)}
     except Exception as e:
         # 记录错误信息
         logger.error(f"评分失败 (用户ID: {user_id}, 电影ID: {movie_id}): {e}")
-        # 确保数据库连接被关闭
-        if conn:
-            conn.close()
-        return False
+        return None
+
+@_timed
+def add_or_update_ratings(ratings):
+    """
+    批量添加或更新评分（数据导入、一条消息评价多部电影时使用）
+    
+    同一用户对同一电影的多条评分只保留最后一条。每批最多_IN_QUERY_BATCH_SIZE条，
+    合并为一条多行 INSERT ... ON DUPLICATE KEY UPDATE 语句，每批单独提交；
+    某一批失败时已提交的批次不回滚，返回值只统计已提交的评分。
+    
+    多行语句的影响行数为 新增数 + 2 × 更新数，据此计算新增和更新的数量
+    （评分与评分时间都没有变化的行影响行数为0，这种情况下新增数会偏大，仅在同一秒内重复提交相同评分时出现）
+    
+    Args:
+        ratings (iterable): [(user_id, movie_id, score), ...]
+        
+    Returns:
+        dict: {'inserted': 新增数, 'updated': 更新数, 'failed': 写入失败的评分数}
+        
+    Raises:
+        ValueError: 评分不是数字时抛出异常
+    """
+    latest = {}
+    for user_id, movie_id, score in ratings:
+        latest[(user_id, movie_id)] = _clamp_score(score)
+    rows = [(user_id, movie_id, score) for (user_id, movie_id), score in latest.items()]
+    result = {'inserted': 0, 'updated': 0, 'failed': 0}
+    if not rows:
+        return result
+
+    committed = []
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            for start in range(0, len(rows), _IN_QUERY_BATCH_SIZE):
+                batch = rows[start:start + _IN_QUERY_BATCH_SIZE]
+                try:
+                    # executemany把本批评分合并为一条多行INSERT语句
+                    cursor.executemany(_RATING_UPSERT_SQL, batch)
+                    affected = cursor.rowcount
+                except Exception as e:
+                    logger.error(f"批量评分失败 ({len(batch)} 条): {e}")
+                    result['failed'] += len(batch)
+                    continue
+                inserted = min(len(batch), max(0, 2 * len(batch) - affected))
+                result['inserted'] += inserted
+                result['updated'] += len(batch) - inserted
+                committed.extend(batch)
 
+    # 归还数据库连接后再通知内存数据同步更新
+    for user_id, movie_id, score in committed:
+        _notify_rating_listeners(user_id, movie_id, score)
+
+    logger.info(f"批量评分完成: 新增 {result['inserted']} 条, 更新 {result['updated']} 条, 失败 {result['failed']} 条")
+    return result
+
+@_timed
 def get_user_ratings(user_id):
     """
     获取特定用户的所有评分记录
@@ -452,22 +862,21 @@ def get_user_ratings(user_id):
         list: 评分记录列表，每条记录包含movie_id和score字段
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 执行查询SQL
-            sql = "SELECT movie_id, score FROM ratings WHERE user_id = %s"
-            cursor.execute(sql, (user_id,))
-            # 获取所有评分记录
-            result = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 执行查询SQL
+                sql = "SELECT movie_id, score FROM ratings WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                # 获取所有评分记录
+                result = cursor.fetchall()
         return result
     except Exception as e:
         # 记录错误信息
         logger.error(f"获取用户评分失败 (用户ID: {user_id}): {e}")
         return []
 
+@_timed
 def get_all_user_ratings():
     """
     获取所有用户的评分数据，用于协同过滤算法
@@ -480,15 +889,13 @@ def get_all_user_ratings():
               格式: {user_id1: [{'movie_id': X, 'score': Y}, ...], user_id2: [...], ...}
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 查询所有评分记录
-            sql = "SELECT user_id, movie_id, score FROM ratings"
-            cursor.execute(sql)
-            all_ratings = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 查询所有评分记录
+                sql = "SELECT user_id, movie_id, score FROM ratings"
+                cursor.execute(sql)
+                all_ratings = cursor.fetchall()
         
         # 按用户ID组织数据
         # 构建字典：{用户ID: [{电影ID, 评分}, ...], ...}
@@ -509,6 +916,60 @@ def get_all_user_ratings():
         logger.error(f"获取所有评分数据失败: {e}")
         return {}
 
+def iter_rating_rows(chunk_size=50000):
+    """
+    分块流式读取全部评分记录，用于构建内存评分矩阵
+    
+    使用服务端游标（SSCursor）：结果集留在MySQL服务端，每次只取chunk_size行到客户端，
+    客户端内存占用与评分总数无关。评分以DOUBLE返回（score + 0E0），不为每行创建Decimal对象。
+    读取期间一直占用一个连接，调用方应尽快处理完每块数据
+    
+    Args:
+        chunk_size (int): 每块的行数
+        
+    Yields:
+        list: [(user_id, movie_id, score), ...]，每块最多chunk_size行
+        
+    Raises:
+        Exception: 查询失败时抛出异常
+    """
+    try:
+        with db_connection() as conn:
+            with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute("SELECT user_id, movie_id, score + 0E0 FROM ratings")
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    except Exception as e:
+        logger.error(f"流式读取评分记录失败: {e}")
+        raise
+
+@_timed
+def get_rating_summary_by_user():
+    """
+    按用户汇总评分数量和评分总和，用于校验内存评分矩阵与ratings表是否一致
+
+    Returns:
+        list: 汇总结果列表，格式: [(user_id, 评分数量, 评分总和), ...]
+
+    Raises:
+        Exception: 查询失败时抛出异常
+    """
+    try:
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor(pymysql.cursors.Cursor) as cursor:
+                sql = "SELECT user_id, COUNT(*), SUM(score) FROM ratings GROUP BY user_id"
+                cursor.execute(sql)
+                result = cursor.fetchall()
+        return list(result)
+    except Exception as e:
+        logger.error(f"汇总用户评分失败: {e}")
+        raise
+
+@_timed
 def get_movies_rated_by_user(user_id):
     """
     获取用户已评分的电影ID列表
@@ -522,15 +983,13 @@ def get_movies_rated_by_user(user_id):
         list: 用户已评分的电影ID列表
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 查询用户已评分的电影ID
-            sql = "SELECT movie_id FROM ratings WHERE user_id = %s"
-            cursor.execute(sql, (user_id,))
-            results = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 查询用户已评分的电影ID
+                sql = "SELECT movie_id FROM ratings WHERE user_id = %s"
+                cursor.execute(sql, (user_id,))
+                results = cursor.fetchall()
         
         # 提取电影ID列表
         movie_ids = [row['movie_id'] for row in results]
@@ -543,6 +1002,7 @@ def get_movies_rated_by_user(user_id):
 ############################################################
 # 推荐辅助函数
 ############################################################
+@_timed
 def get_movies_for_content_based_recommendation(exclude_movie_ids=None, limit=100):
     """
     获取一批用于内容推荐的电影（高评分电影，排除用户已看过的）
@@ -557,26 +1017,24 @@ def get_movies_for_content_based_recommendation(exclude_movie_ids=None, limit=10
         list: 电影记录列表，按豆瓣评分降序排序
     """
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            if exclude_movie_ids and len(exclude_movie_ids) > 0:
-                # 排除指定的电影ID
-                # 动态生成SQL参数占位符，如 IN (%s, %s, %s)
-                placeholders = ', '.join(['%s'] * len(exclude_movie_ids))
-                sql = f"SELECT * FROM movies WHERE id NOT IN ({placeholders}) ORDER BY douban_rating DESC LIMIT %s"
-                # 参数列表：先是排除的电影ID列表，再加上limit
-                params = exclude_movie_ids + [limit]
-                cursor.execute(sql, params)
-            else:
-                # 不需要排除任何电影，直接查询
-                sql = "SELECT * FROM movies ORDER BY douban_rating DESC LIMIT %s"
-                cursor.execute(sql, (limit,))
-            
-            # 获取查询结果
-            result = cursor.fetchall()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                if exclude_movie_ids and len(exclude_movie_ids) > 0:
+                    # 排除指定的电影ID
+                    # 动态生成SQL参数占位符，如 IN (%s, %s, %s)
+                    placeholders = ', '.join(['%s'] * len(exclude_movie_ids))
+                    sql = f"SELECT * FROM movies WHERE id NOT IN ({placeholders}) ORDER BY douban_rating DESC LIMIT %s"
+                    # 参数列表：先是排除的电影ID列表，再加上limit
+                    params = exclude_movie_ids + [limit]
+                    cursor.execute(sql, params)
+                else:
+                    # 不需要排除任何电影，直接查询
+                    sql = "SELECT * FROM movies ORDER BY douban_rating DESC LIMIT %s"
+                    cursor.execute(sql, (limit,))
+                
+                # 获取查询结果
+                result = cursor.fetchall()
         return result
     except Exception as e:
         # 记录错误信息
@@ -586,6 +1044,7 @@ def get_movies_for_content_based_recommendation(exclude_movie_ids=None, limit=10
 ############################################################
 # 搜索记录相关函数
 ############################################################
+@_timed
 def log_search_query(user_id, search_query):
     """
     记录用户搜索查询（可选功能）
@@ -599,23 +1058,42 @@ def log_search_query(user_id, search_query):
     Returns:
         bool: 成功返回True，失败返回False
     """
-    conn = None
     try:
-        # 获取数据库连接
-        conn = get_db_connection()
-        with conn.cursor() as cursor:
-            # 插入搜索记录
-            sql = "INSERT INTO search_logs (user_id, search_query) VALUES (%s, %s)"
-            cursor.execute(sql, (user_id, search_query))
-        # 提交事务
-        conn.commit()
-        # 关闭数据库连接
-        conn.close()
+        # 从连接池获取数据库连接
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                # 插入搜索记录
+                sql = "INSERT INTO search_logs (user_id, search_query) VALUES (%s, %s)"
+                cursor.execute(sql, (user_id, search_query))
+            # 提交事务
+            conn.commit()
         return True
     except Exception as e:
         # 记录错误信息
         logger.error(f"记录搜索查询失败 (用户ID: {user_id}, 查询: {search_query}): {e}")
-        # 确保数据库连接被关闭
-        if conn:
-            conn.close()
-        return False
\ No newline at end of file
+        return False
+
+@_timed
+def insert_search_logs(records):
+    """
+    批量写入搜索记录（供后台搜索记录写入线程使用）
+    
+    PyMySQL的executemany会把 INSERT ... VALUES 语句合并成一条多行INSERT发送，
+    一批记录只需一次数据库往返
+    
+    Args:
+        records (list): [(user_id, search_query, search_time), ...]
+        
+    Returns:
+        int: 写入的记录数
+        
+    Raises:
+        Exception: 写入失败时抛出异常
+    """
+    if not records:
+        return 0
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            sql = "INSERT INTO search_logs (user_id, search_query, search_time) VALUES (%s, %s, %s)"
+            cursor.executemany(sql, records)
+    return len(records)
@@ -0,0 +1,302 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 数据库连接池模块：复用数据库连接，避免每次查询都重新建立TCP连接和认证握手
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class PoolExhaustedError(Exception):
+    """连接池中的连接全部被占用，且在等待超时时间内没有连接归还"""
+
+class _PooledConnection:
+    """
+    连接池内部使用的连接包装，记录连接的创建时间和最后归还时间
+    """
+    __slots__ = ('conn', 'created_at', 'last_used_at')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+def _ping(conn):
+    """
+    默认的连接健康检查：向服务器发送一次ping，连接失效时抛出异常
+    """
+    conn.ping(reconnect=False)
+
+class ConnectionPool:
+    """
+    线程安全的有界数据库连接池
+
+    - 连接数上限为max_size，全部占用时请求方最多等待acquire_timeout秒
+    - 取出连接时做健康检查，失效连接直接丢弃并重新获取
+    - 空闲超过max_idle_time或存活超过max_lifetime的连接会被回收
+    - 后台回收线程每隔reap_interval秒清理一次空闲连接
+    """
+
+    def __init__(self, connect_func, max_size=10, acquire_timeout=5, max_idle_time=300,
+                 max_lifetime=3600, reap_interval=60, ping_func=_ping):
+        """
+        初始化连接池（不会预先建立连接，连接在首次使用时按需创建）
+
+        Args:
+            connect_func (callable): 创建新连接的函数，无参数，返回连接对象
+            max_size (int): 连接池最大连接数（包括使用中和空闲的连接）
+            acquire_timeout (float): 获取连接的最长等待时间（秒）
+            max_idle_time (float): 连接最长空闲时间（秒），超过后被回收
+            max_lifetime (float): 连接最长存活时间（秒），超过后被回收
+            reap_interval (float): 后台回收线程的运行间隔（秒），0表示不启动回收线程
+            ping_func (callable): 健康检查函数，接收连接对象，连接失效时抛出异常
+        """
+        if max_size < 1:
+            raise ValueError("max_size必须大于0")
+        self.connect_func = connect_func
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle_time = max_idle_time
+        self.max_lifetime = max_lifetime
+        self.reap_interval = reap_interval
+        self.ping_func = ping_func
+
+        self._idle = []  # 空闲连接栈，后进先出，优先复用最近归还的连接
+        self._size = 0   # 当前已建立的连接总数（使用中 + 空闲 + 正在创建）
+        self._in_use = {}  # 使用中的连接，id(conn) -> _PooledConnection
+        self._cond = threading.Condition(threading.Lock())
+        self._closed = False
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+
+        # 统计信息，便于评估连接池大小是否合适
+        self._stats = {
+            'created': 0,         # 累计创建的连接数
+            'discarded': 0,       # 累计丢弃的连接数（失效、超时、超龄）
+            'acquired': 0,        # 累计取出连接次数
+            'waits': 0,           # 因连接池已满而等待的次数
+            'timeouts': 0,        # 等待超时次数
+            'health_failures': 0  # 健康检查失败次数
+        }
+
+    ############################################################
+    # 连接获取与归还
+    ############################################################
+    def acquire(self):
+        """
+        从连接池取出一个可用连接
+
+        Returns:
+            连接对象
+
+        Raises:
+            PoolExhaustedError: 等待超时仍没有可用连接
+            Exception: 创建新连接失败时抛出connect_func的异常
+        """
+        self._ensure_reaper()
+        deadline = time.monotonic() + self.acquire_timeout
+
+        while True:
+            item = None
+            create = False
+            with self._cond:
+                if self._closed:
+                    raise PoolExhaustedError("连接池已关闭")
+
+                waited = False
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolExhaustedError(
+                            f"等待数据库连接超时 ({self.acquire_timeout}秒)，连接池已满 (max_size={self.max_size})"
+                        )
+                    if not waited:
+                        self._stats['waits'] += 1
+                        waited = True
+                    self._cond.wait(remaining)
+                    if self._closed:
+                        raise PoolExhaustedError("连接池已关闭")
+
+                if self._idle:
+                    item = self._idle.pop()
+                else:
+                    # 先占用名额再在锁外建立连接，避免建连期间阻塞其他线程
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self.connect_func()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                    self._stats['acquired'] += 1
+                self._track(_PooledConnection(conn))
+                return conn
+
+            # 复用空闲连接前检查是否超龄、超时以及是否仍然可用
+            now = time.monotonic()
+            if self._expired(item, now):
+                self._discard(item.conn)
+                continue
+            try:
+                self.ping_func(item.conn)
+            except Exception as e:
+                logger.warning(f"数据库连接健康检查失败，已丢弃该连接: {e}")
+                with self._cond:
+                    self._stats['health_failures'] += 1
+                self._discard(item.conn)
+                continue
+
+            with self._cond:
+                self._stats['acquired'] += 1
+            self._track(item)
+            return item.conn
+
+    def release(self, conn, discard=False):
+        """
+        将连接归还到连接池
+
+        Args:
+            conn: 通过acquire取出的连接对象
+            discard (bool): 为True时关闭该连接而不是放回池中（例如连接已损坏）
+        """
+        item = self._untrack(conn)
+        if item is None:
+            item = _PooledConnection(conn)
+
+        if discard or self._closed or self._expired(item, time.monotonic(), check_idle=False):
+            self._discard(conn)
+            return
+
+        item.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(item)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        以上下文管理器的方式使用连接，退出时自动归还
+
+        代码块内抛出异常时会先回滚事务，回滚失败说明连接已损坏，直接丢弃
+
+        用法:
+            with pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(...)
+        """
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    ############################################################
+    # 连接回收
+    ############################################################
+    def reap(self):
+        """
+        回收空闲超时和超龄的空闲连接
+
+        Returns:
+            int: 本次回收的连接数
+        """
+        now = time.monotonic()
+        with self._cond:
+            expired = [item for item in self._idle if self._expired(item, now)]
+            if not expired:
+                return 0
+            self._idle = [item for item in self._idle if not self._expired(item, now)]
+        for item in expired:
+            self._discard(item.conn)
+        logger.info(f"连接池回收了 {len(expired)} 个空闲连接")
+        return len(expired)
+
+    def close(self):
+        """
+        关闭连接池：停止回收线程并关闭所有空闲连接，使用中的连接在归还时关闭
+        """
+        self._reaper_stop.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for item in idle:
+            self._discard(item.conn)
+
+    def stats(self):
+        """
+        获取连接池的当前状态和累计统计信息
+
+        Returns:
+            dict: 包括size（连接总数）、idle（空闲数）、in_use（使用中）以及各项累计计数
+        """
+        with self._cond:
+            result = dict(self._stats)
+            result['size'] = self._size
+            result['idle'] = len(self._idle)
+            result['in_use'] = self._size - len(self._idle)
+            result['max_size'] = self.max_size
+        return result
+
+    ############################################################
+    # 内部辅助函数
+    ############################################################
+    def _expired(self, item, now, check_idle=True):
+        if self.max_lifetime and now - item.created_at > self.max_lifetime:
+            return True
+        if check_idle and self.max_idle_time and now - item.last_used_at > self.max_idle_time:
+            return True
+        return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats['discarded'] += 1
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _track(self, item):
+        with self._cond:
+            self._in_use[id(item.conn)] = item
+
+    def _untrack(self, conn):
+        with self._cond:
+            return self._in_use.pop(id(conn), None)
+
+    def _ensure_reaper(self):
+        if self._reaper is not None or not self.reap_interval:
+            return
+        with self._cond:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name='db-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._reaper_stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"连接池回收空闲连接失败: {e}")
@@ -0,0 +1,135 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 电影相似度模块：离线预计算每部电影最相似的Top-K部电影，供基于物品的协同过滤直接查询
+
+############################################################
+# 导入必要的库
+############################################################
+import logging  # 日志库
+import threading  # 后台刷新线程
+import time  # 定时刷新
+from app import rating_matrix  # 内存评分矩阵模块
+from app import snapshot_store  # 检查其他进程发布的新版本
+from app.neighbor_index import NeighborIndex, build_neighbor_index  # 复用邻居索引的构建和存储格式
+from app.config import (
+    ITEM_SIMILARITY_DIR,
+    ITEM_SIMILARITY_TOP_K,
+    ITEM_SIMILARITY_MIN_COMMON,
+    ITEM_SIMILARITY_REFRESH_INTERVAL,
+    SNAPSHOT_CHECK_INTERVAL
+)  # 电影相似度表配置
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+# 电影相似度与用户相似度使用同一个公式，只是把评分矩阵转置过来：
+#   差异值 area = Σ(score_user_i_movie_a - score_user_i_movie_b)^2 / 共同评分用户数
+#   相似度 similarity = 1 / (1 + area)
+# 相似度表的存储格式与邻居索引相同（每部电影的Top-K相似电影ID和相似度），
+# 只保留Top-K使表的大小与电影数成线性关系，而不是电影数的平方
+
+############################################################
+# 全局电影相似度表
+############################################################
+_table = None
+_table_lock = threading.Lock()
+_refresher = None
+_watcher = None  # 检查其他进程是否发布了新版本相似度表
+_rebuild_listeners = []  # 相似度表重建完成后需要通知的回调函数
+
+def add_rebuild_listener(listener):
+    """
+    注册相似度表重建监听函数，每次新表生效后调用 listener(table)
+
+    Args:
+        listener (callable): 回调函数
+    """
+    _rebuild_listeners.append(listener)
+
+def _notify_rebuild_listeners(table):
+    for listener in list(_rebuild_listeners):
+        try:
+            listener(table)
+        except Exception as e:
+            logger.error(f"电影相似度表重建监听函数执行失败: {e}")
+
+def load_item_similarity(directory=ITEM_SIMILARITY_DIR):
+    """
+    从磁盘加载电影相似度表，此后定期检查该目录是否发布了新版本
+
+    Returns:
+        NeighborIndex or None: 磁盘上没有相似度表时返回None
+    """
+    global _table, _watcher
+    _watcher = snapshot_store.GenerationWatcher(directory, SNAPSHOT_CHECK_INTERVAL)
+    try:
+        table = NeighborIndex.load(directory)
+    except Exception as e:
+        logger.error(f"加载电影相似度表失败: {e}")
+        return None
+    if table is not None:
+        _table = table
+        logger.info(f"电影相似度表加载完成: 版本 {table.meta.get('generation')}, {len(table.user_ids)} 部电影")
+    return table
+
+def rebuild_item_similarity(directory=ITEM_SIMILARITY_DIR):
+    """
+    基于当前评分矩阵重新计算电影相似度表，写入磁盘后原子地替换当前的表
+
+    Returns:
+        NeighborIndex: 新的电影相似度表
+    """
+    global _table, _watcher
+    item_matrix = rating_matrix.get_rating_matrix().transposed()
+    table = build_neighbor_index(item_matrix, k=ITEM_SIMILARITY_TOP_K, min_common=ITEM_SIMILARITY_MIN_COMMON)
+    table.save(directory)
+    table = NeighborIndex.load(directory) or table
+    _table = table
+    if _watcher is None or _watcher.directory != directory:
+        _watcher = snapshot_store.GenerationWatcher(directory, SNAPSHOT_CHECK_INTERVAL)
+    logger.info(f"电影相似度表重建完成: {len(table.user_ids)} 部电影, 耗时 {table.meta.get('build_seconds')} 秒")
+    _notify_rebuild_listeners(table)
+    return table
+
+def get_item_similarity():
+    """
+    获取电影相似度表，首次调用时从磁盘加载，磁盘上没有时立即构建；
+    其他进程（多进程模式下的主进程）发布了新版本时，切换为新版本
+
+    Returns:
+        NeighborIndex: 电影相似度表
+    """
+    global _table
+    if _table is not None:
+        watcher = _watcher
+        generation = watcher.check(_table.meta.get('generation')) if watcher is not None else None
+        if generation is not None:
+            try:
+                _table = NeighborIndex.load(watcher.directory, generation)
+                logger.info(f"切换到新版本电影相似度表: {generation}")
+                _notify_rebuild_listeners(_table)
+            except Exception as e:
+                logger.error(f"加载电影相似度表版本 {generation} 失败: {e}")
+        return _table
+    with _table_lock:
+        if _table is None and load_item_similarity() is None:
+            rebuild_item_similarity()
+    return _table
+
+def start_refresher(directory=ITEM_SIMILARITY_DIR, interval=ITEM_SIMILARITY_REFRESH_INTERVAL):
+    """启动后台刷新线程，每隔interval秒重建一次电影相似度表"""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    _refresher = threading.Thread(
+        target=_refresh_loop, args=(directory, interval), name='item-similarity-refresher', daemon=True
+    )
+    _refresher.start()
+
+def _refresh_loop(directory, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            rebuild_item_similarity(directory)
+        except Exception as e:
+            logger.error(f"电影相似度表重建失败: {e}")
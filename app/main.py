@@ -10,6 +10,7 @@ import web  # web.py框架，提供Web服务器和路由功能
 import sys  # 系统模块，用于访问命令行参数和Python路径
 import os   # 操作系统接口，用于文件路径操作
 import logging  # 日志模块，记录系统运行信息
+import time  # 时间模块，用于判断索引是否需要重建
 
 ############################################################
 # 设置Python导入路径，确保可以正确导入项目模块
@@ -23,7 +24,15 @@ sys.path.insert(0, project_root)
 # 导入项目内部模块
 ############################################################
 from app import wechat_handler  # 导入微信消息处理模块
-from app.config import WECHAT_TOKEN  # 导入微信Token配置
+from app import rating_matrix  # 导入内存评分矩阵模块，用于启动时预加载
+from app import neighbor_index  # 导入邻居索引模块，用于启动时加载并定时刷新
+from app import item_similarity  # 导入电影相似度模块，使用基于物品的协同过滤时启动时加载
+from app import movie_catalog  # 导入电影目录模块，用于启动时预加载
+from app import metrics  # 导入性能指标模块，/metrics 输出各阶段耗时统计
+from app.config import WECHAT_TOKEN, RECOMMENDATION_ALGORITHM  # 导入微信Token和推荐算法配置
+from app.config import SERVER_CONFIG, NEIGHBOR_INDEX_REFRESH_INTERVAL, ITEM_SIMILARITY_REFRESH_INTERVAL  # 服务进程和索引重建配置
+from app.config import NEIGHBOR_INDEX_REFRESH_AFTER_RATINGS  # 邻居索引按新增评分数提前重建的阈值
+from app.config import METRICS_CONFIG  # 性能指标配置
 
 ############################################################
 # 配置日志系统
@@ -37,7 +46,11 @@ logger = logging.getLogger(__name__)
 # 定义URL路由
 ############################################################
 # 将根路径'/'映射到WeChatInterface类，用于处理所有微信服务器的请求
-urls = ('/', 'WeChatInterface')
+# '/metrics'映射到MetricsInterface类，以Prometheus文本格式输出性能指标
+urls = (
+    '/', 'WeChatInterface',
+    '/metrics', 'MetricsInterface'
+)
 
 ############################################################
 # 微信接口处理类定义
@@ -117,6 +130,90 @@ class WeChatInterface:
             logger.error(f"处理用户消息异常: {e}")
             return "处理用户消息异常"
 
+############################################################
+# 性能指标接口
+############################################################
+class MetricsInterface:
+    """
+    性能指标接口
+
+    GET请求以Prometheus文本格式返回消息处理各阶段、数据库查询和推荐计算的耗时直方图，
+    多进程模式下为所有工作进程的汇总。只允许METRICS_CONFIG['allowed_ips']中的地址访问
+    """
+
+    def GET(self):
+        allowed_ips = METRICS_CONFIG['allowed_ips']
+        if allowed_ips and web.ctx.ip not in allowed_ips:
+            logger.warning(f"拒绝来自 {web.ctx.ip} 的指标请求")
+            raise web.forbidden()
+        try:
+            body = metrics.render()
+        except Exception as e:
+            logger.error(f"输出性能指标失败: {e}")
+            raise web.internalerror()
+        web.header('Content-Type', metrics.CONTENT_TYPE)
+        return body
+
+############################################################
+# 多进程模式下的共享数据加载
+############################################################
+def _is_stale(index, max_age):
+    """索引不存在，或构建时间早于max_age秒之前"""
+    return index is None or time.time() - index.meta.get('built_at', 0) >= max_age
+
+def load_shared_data(reload=False):
+    """
+    在多进程模式的主进程中加载推荐数据，fork后由所有工作进程共享
+
+    多进程模式下不启动各模块的后台刷新线程（线程不会被fork到工作进程中），
+    电影目录的刷新改为主进程定期重新调用本函数并替换工作进程；
+    评分矩阵、邻居索引和电影相似度表另外由refresh_shared_data定期发布新版本，工作进程不需要重启
+
+    Args:
+        reload (bool): 是否为平滑重载（首次启动时优先使用磁盘上已有的索引）
+    """
+    try:
+        movie_catalog.load_movie_catalog()
+    except Exception as e:
+        logger.error(f"电影目录加载失败: {e}")
+
+    refresh_shared_data(reload)
+
+def refresh_shared_data(reload=True):
+    """
+    在多进程模式下刷新评分矩阵快照，按需重建邻居索引和电影相似度表（由主进程fork出的刷新进程调用）
+
+    评分矩阵从数据库重新加载后发布为新版本快照，邻居索引和电影相似度表同样按版本写入磁盘；
+    工作进程以内存映射方式共享这些文件，并在检查到新版本时自行切换，不需要重启。
+    工作进程不启动邻居索引的刷新线程，索引构建后所有工作进程累计的评分数（共享的评分版本）达到阈值时，
+    由主进程在这里提前重建
+
+    Args:
+        reload (bool): 是否已加载过数据（首次启动时优先使用磁盘上已有的索引）
+    """
+    try:
+        rating_matrix.load_rating_matrix()
+        rating_matrix.publish_rating_matrix()
+    except Exception as e:
+        logger.error(f"评分矩阵加载失败: {e}")
+
+    try:
+        index = neighbor_index.get_neighbor_index() if reload else neighbor_index.load_neighbor_index()
+        pending_ratings = neighbor_index.ratings_since_build(index) if index is not None else None
+        if _is_stale(index, NEIGHBOR_INDEX_REFRESH_INTERVAL) or \
+                (pending_ratings is not None and pending_ratings >= NEIGHBOR_INDEX_REFRESH_AFTER_RATINGS):
+            neighbor_index.rebuild_neighbor_index()
+    except Exception as e:
+        logger.error(f"邻居索引加载失败: {e}")
+
+    if RECOMMENDATION_ALGORITHM == 'item_cf':
+        try:
+            table = item_similarity.get_item_similarity()
+            if _is_stale(table, ITEM_SIMILARITY_REFRESH_INTERVAL):
+                item_similarity.rebuild_item_similarity()
+        except Exception as e:
+            logger.error(f"电影相似度表加载失败: {e}")
+
 ############################################################
 # 应用入口
 ############################################################
@@ -147,6 +244,61 @@ if __name__ == "__main__":
     # web.py 0.62版本通过命令行参数形式指定端口
     sys.argv.append(str(port_to_listen))
     
+    if SERVER_CONFIG['mode'] == 'prefork':
+        # 多进程模式：主进程加载推荐数据后fork工作进程，工作进程共享已加载的数据
+        from app.server import PreforkServer
+        logger.info(f"启动微信电影推荐系统服务（多进程模式），监听端口: {port_to_listen}")
+        try:
+            # 关闭web.py的自动重载：工作进程不应在运行中重新导入模块、丢弃已加载的数据
+            app = web.application(urls, globals(), autoreload=False)
+            PreforkServer(
+                app.wsgifunc(), port_to_listen,
+                host=SERVER_CONFIG['host'],
+                workers=SERVER_CONFIG['workers'],
+                threads=SERVER_CONFIG['threads'],
+                graceful_timeout=SERVER_CONFIG['graceful_timeout'],
+                reload_interval=SERVER_CONFIG['reload_interval'],
+                refresh_interval=SERVER_CONFIG['refresh_interval'],
+                backlog=SERVER_CONFIG['backlog'],
+                load_data=load_shared_data,
+                refresh_data=refresh_shared_data,
+                metrics_dir=METRICS_CONFIG['directory'],
+                metrics_flush_interval=METRICS_CONFIG['flush_interval']
+            ).run()
+        except Exception as e:
+            logger.error(f"应用启动失败: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    # 开发服务器模式：单进程，数据由后台线程定时刷新
+    # 预先加载电影目录并启动后台刷新线程
+    # 加载失败不影响服务启动，查询电影时会重新尝试加载，仍失败则直接查询数据库
+    try:
+        movie_catalog.load_movie_catalog()
+    except Exception as e:
+        logger.error(f"电影目录预加载失败: {e}")
+    movie_catalog.start_refresher()
+
+    # 预先加载评分矩阵，避免第一个推荐请求承担全量加载的耗时
+    # 加载失败不影响服务启动，首次推荐请求时会重新尝试加载
+    try:
+        rating_matrix.load_rating_matrix()
+    except Exception as e:
+        logger.error(f"评分矩阵预加载失败: {e}")
+
+    # 加载磁盘上的邻居索引并启动后台刷新线程
+    # 磁盘上还没有索引时，刷新线程会立即构建一次，构建完成前推荐请求实时计算邻居
+    neighbor_index.load_neighbor_index()
+    neighbor_index.start_refresher()
+
+    # 使用基于物品的协同过滤时，预先加载（或构建）电影相似度表并定时重建
+    if RECOMMENDATION_ALGORITHM == 'item_cf':
+        try:
+            item_similarity.get_item_similarity()
+        except Exception as e:
+            logger.error(f"电影相似度表预加载失败: {e}")
+        item_similarity.start_refresher()
+
     # 创建并启动web.py应用
     logger.info(f"启动微信电影推荐系统服务，监听端口: {port_to_listen}")
     try:
@@ -0,0 +1,340 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 消息去重模块：微信服务器重试同一条消息时，不重复处理，直接返回第一次处理的回复
+#
+# 微信服务器5秒内没有收到回复时会重新发送同一条消息（最多重试3次），普通消息的MsgId相同，
+# 事件消息没有MsgId，以 FromUserName + CreateTime 区分。每条消息先在去重表中登记：
+#   - 第一次收到：登记为处理中，处理完成后保存回复
+#   - 重试时第一次处理已完成：直接返回保存的回复
+#   - 重试时第一次处理仍在进行：等待其完成（最多等到本次请求的回复时限），不重复计算
+# 重复消息不经过速率限制，不会占用用户的请求次数。多进程部署时去重表使用所有工作进程共享的SQLite文件，
+# 重试的请求被其他工作进程接收时同样有效
+
+import os
+import time
+import logging
+import sqlite3
+import threading
+from app import metrics
+from app.config import MESSAGE_DEDUP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_MESSAGES = metrics.counter(
+    'wechat_duplicate_messages_total',
+    '微信服务器重试的重复消息，按结果分类：cached 返回已保存的回复，coalesced 等待第一次处理完成后返回其回复，'
+    'timeout 回复时限内第一次处理未完成',
+    labels=('result',)
+)
+
+def message_key(msg):
+    """
+    消息的去重键
+
+    Args:
+        msg (dict): parse_xml_message解析出的消息
+
+    Returns:
+        str or None: 普通消息为MsgId，事件消息为 FromUserName:CreateTime；无法确定时返回None（不去重）
+    """
+    msg_id = msg.get('MsgId')
+    if msg_id:
+        return msg_id
+    from_user = msg.get('FromUserName')
+    create_time = msg.get('CreateTime')
+    if from_user and create_time:
+        return f"{from_user}:{create_time}"
+    return None
+
+############################################################
+# 去重表
+# 每条消息一条记录：状态（'pending' 处理中 / 'done' 已完成）、回复、更新时间
+# 每个存储提供：
+#   claim(key, now)          -> None（本次请求负责处理）或 (状态, 回复)
+#   get(key, now)            -> (状态, 回复) 或 None
+#   complete(key, reply, now)
+#   release(key)             处理失败时删除记录，重试的消息重新处理
+# 已完成的记录保留ttl秒，处理中的记录超过pending_timeout秒视为处理进程已退出
+############################################################
+class MemoryDedupStore:
+    """
+    进程内去重表，只在单进程（'dev'模式）下能识别所有重试
+    """
+
+    def __init__(self, ttl=30, pending_timeout=15):
+        """
+        Args:
+            ttl (float): 已完成消息的回复保留时间（秒），应覆盖微信的重试间隔
+            pending_timeout (float): 处理中的记录的有效期（秒）
+        """
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self._entries = {}  # 去重键 -> (状态, 回复, 更新时间)，按登记顺序排列
+        self._lock = threading.Lock()
+
+    def _valid(self, entry, now):
+        status, _, updated_at = entry
+        return now - updated_at < (self.pending_timeout if status == 'pending' else self.ttl)
+
+    def claim(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._valid(entry, now):
+                return entry[0], entry[1]
+            # 清理过期记录：字典按登记顺序排列，从头部开始删除即可
+            expired_before = now - max(self.ttl, self.pending_timeout)
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][2] >= expired_before:
+                    break
+                del self._entries[oldest]
+            self._entries.pop(key, None)
+            self._entries[key] = ('pending', None, now)
+            return None
+
+    def get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or not self._valid(entry, now):
+            return None
+        return entry[0], entry[1]
+
+    def complete(self, key, reply, now):
+        with self._lock:
+            # 保持登记时间的顺序，完成时间只用于判断过期
+            self._entries[key] = ('done', reply, now)
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteDedupStore:
+    """
+    多进程共享的去重表：所有工作进程读写同一个SQLite数据库文件
+    """
+
+    def __init__(self, path, ttl=30, pending_timeout=15, busy_timeout=1.0):
+        """
+        Args:
+            path (str): 数据库文件路径
+            ttl (float): 已完成消息的回复保留时间（秒），应覆盖微信的重试间隔
+            pending_timeout (float): 处理中的记录的有效期（秒）
+            busy_timeout (float): 等待其他进程释放写锁的最长时间（秒）
+        """
+        self.path = path
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._last_evict = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # 每个线程一个连接；fork出的子进程不使用从父进程继承的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS message_dedup ("
+            "  message_key TEXT PRIMARY KEY,"
+            "  status TEXT NOT NULL,"
+            "  reply TEXT,"
+            "  updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_message_dedup_updated_at ON message_dedup (updated_at)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _valid(self, status, updated_at, now):
+        return now - updated_at < (self.pending_timeout if status == 'pending' else self.ttl)
+
+    def claim(self, key, now):
+        conn = self._connection()
+        # 新消息只需一条语句，不必为 查询+插入 开启写事务，减少工作进程之间的写锁等待
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO message_dedup (message_key, status, reply, updated_at) "
+            "VALUES (?, 'pending', NULL, ?)", (key, now)
+        )
+        if cursor.rowcount == 1:
+            # 每秒最多清理一次过期记录
+            if now - self._last_evict >= 1.0:
+                self._last_evict = now
+                conn.execute("DELETE FROM message_dedup WHERE updated_at < ?",
+                             (now - max(self.ttl, self.pending_timeout),))
+            return None
+        row = conn.execute(
+            "SELECT status, reply, updated_at FROM message_dedup WHERE message_key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return self.claim(key, now)  # 记录刚被删除（处理失败），重新登记
+        if self._valid(row[0], row[2], now):
+            return row[0], row[1]
+        # 记录已过期：只有更新时间未被其他进程改动时才接管
+        cursor = conn.execute(
+            "UPDATE message_dedup SET status = 'pending', reply = NULL, updated_at = ? "
+            "WHERE message_key = ? AND updated_at = ?", (now, key, row[2])
+        )
+        if cursor.rowcount == 1:
+            return None
+        return self.get(key, now) or ('pending', None)
+
+    def get(self, key, now):
+        row = self._connection().execute(
+            "SELECT status, reply, updated_at FROM message_dedup WHERE message_key = ?", (key,)
+        ).fetchone()
+        if row is None or not self._valid(row[0], row[2], now):
+            return None
+        return row[0], row[1]
+
+    def complete(self, key, reply, now):
+        self._connection().execute(
+            "UPDATE message_dedup SET status = 'done', reply = ?, updated_at = ? WHERE message_key = ?",
+            (reply, now, key)
+        )
+
+    def release(self, key):
+        self._connection().execute("DELETE FROM message_dedup WHERE message_key = ?", (key,))
+
+def create_store(config):
+    """
+    按配置创建去重表
+
+    Args:
+        config (dict): MESSAGE_DEDUP_CONFIG格式的配置
+
+    Returns:
+        MemoryDedupStore or SQLiteDedupStore: 去重表
+    """
+    store = config.get('store', 'memory')
+    if store == 'memory':
+        return MemoryDedupStore(config['ttl'], config['pending_timeout'])
+    if store == 'sqlite':
+        return SQLiteDedupStore(config['sqlite_path'], config['ttl'], config['pending_timeout'])
+    raise ValueError(f"未知的消息去重存储: {store}")
+
+############################################################
+# 去重处理
+############################################################
+class _InFlight:
+    """本进程中正在处理的一条消息，重复消息在这里等待回复"""
+    __slots__ = ('event', 'reply')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reply = None  # 处理失败时保持None
+
+class MessageDeduplicator:
+    """
+    按去重键合并重复的消息：同一条消息只处理一次，重试的消息得到相同的回复
+    """
+
+    def __init__(self, store, poll_interval=0.05):
+        """
+        Args:
+            store: 去重表
+            poll_interval (float): 等待其他工作进程完成处理时查询去重表的间隔（秒）
+        """
+        self.store = store
+        self.poll_interval = poll_interval
+        self._in_flight = {}  # 去重键 -> _InFlight
+        self._lock = threading.Lock()
+
+    def run(self, key, func, deadline):
+        """
+        处理一条消息，重复的消息返回第一次处理的回复
+
+        Args:
+            key (str): 消息的去重键
+            func (callable): 无参数、返回回复的处理函数
+            deadline (float): 本次请求的回复时限（time.monotonic()时间），重复消息最多等待到该时间
+
+        Returns:
+            tuple: (回复, 是否为重复消息)；重复消息在时限内没有等到回复时，回复为空字符串
+                   （微信服务器收到空回复后不再重试，也不向用户显示内容）
+        """
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            try:
+                entry = self.store.claim(key, time.time())
+            except Exception as e:
+                # 去重表不可用时直接处理，不影响正常消息
+                logger.error(f"登记消息 {key} 失败，不做去重处理: {e}")
+                return func(), False
+            if entry is None:
+                in_flight = _InFlight()
+                with self._lock:
+                    self._in_flight[key] = in_flight
+                return self._process(key, in_flight, func), False
+        else:
+            entry = ('pending', None)
+
+        status, reply = entry
+        if status == 'done':
+            DUPLICATE_MESSAGES.inc('cached')
+            return reply, True
+        if in_flight is not None:
+            # 本进程正在处理
+            in_flight.event.wait(max(0.0, deadline - time.monotonic()))
+            reply = in_flight.reply
+        else:
+            # 其他工作进程（或本进程中尚未登记完成的线程）正在处理，定期查询去重表
+            reply = None
+            while time.monotonic() < deadline:
+                time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+                try:
+                    entry = self.store.get(key, time.time())
+                except Exception as e:
+                    logger.error(f"查询消息 {key} 的去重记录失败: {e}")
+                    break
+                if entry is None:
+                    break  # 第一次处理失败，由微信的下一次重试重新处理
+                if entry[0] == 'done':
+                    reply = entry[1]
+                    break
+        if reply is None:
+            DUPLICATE_MESSAGES.inc('timeout')
+            return "", True
+        DUPLICATE_MESSAGES.inc('coalesced')
+        return reply, True
+
+    def _process(self, key, in_flight, func):
+        try:
+            reply = func()
+        except BaseException:
+            self._finish(key, in_flight, None)
+            raise
+        self._finish(key, in_flight, reply)
+        return reply
+
+    def _finish(self, key, in_flight, reply):
+        try:
+            if reply is None:
+                self.store.release(key)
+            else:
+                self.store.complete(key, reply, time.time())
+        except Exception as e:
+            logger.error(f"更新消息 {key} 的去重记录失败: {e}")
+        finally:
+            in_flight.reply = reply
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.event.set()
+
+    def _reset_after_fork(self):
+        # 父进程中正在处理的消息不属于子进程
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+# 全局消息去重实例
+message_deduplicator = MessageDeduplicator(
+    create_store(MESSAGE_DEDUP_CONFIG), poll_interval=MESSAGE_DEDUP_CONFIG['poll_interval']
+)
+os.register_at_fork(after_in_child=message_deduplicator._reset_after_fork)
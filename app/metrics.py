@@ -0,0 +1,395 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 性能指标模块：请求处理各阶段的耗时直方图和计数器，以Prometheus文本格式输出
+
+############################################################
+# 导入必要的库
+############################################################
+import bisect  # 查找观测值所在的直方图区间
+import functools  # 保留被装饰函数的名称和文档
+import json  # 多进程模式下各进程的指标快照文件
+import logging  # 日志库
+import os  # 快照文件路径和进程ID
+import threading  # 保护指标数据的锁和后台写入线程
+import time  # 计时
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'  # Prometheus文本格式的Content-Type
+
+# 默认的耗时区间上界（秒），覆盖内存查询（亚毫秒）到慢SQL（秒级）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+############################################################
+# 指标类型
+############################################################
+class Counter:
+    """
+    计数器：只增不减，按标签值分别计数
+    """
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        Args:
+            name (str): 指标名，按Prometheus惯例以_total结尾
+            documentation (str): 指标说明
+            labels (tuple): 标签名
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}  # 标签值元组 -> 计数
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """
+        增加计数
+
+        Args:
+            *label_values: 与labels一一对应的标签值
+            amount (float): 增加量
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        """获取当前数据：{标签值元组: 计数}"""
+        with self._lock:
+            return dict(self._values)
+
+    def _reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+class Histogram:
+    """
+    直方图：按固定区间统计观测值的分布，同时记录观测值总和与次数
+
+    每个标签组合只保存一个长度为 区间数+2 的列表（各区间计数、超出最大区间的计数、总和），
+    记录一次观测只需一次二分查找和两次加法，内存不随观测次数增长
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): 指标名
+            documentation (str): 指标说明
+            labels (tuple): 标签名
+            buckets (tuple): 升序排列的区间上界
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(float(b) for b in buckets)
+        self._series = {}  # 标签值元组 -> [各区间计数..., 超出最大区间的计数, 总和]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        记录一次观测值
+
+        Args:
+            value (float): 观测值（耗时为秒）
+            *label_values: 与labels一一对应的标签值
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *label_values):
+        """
+        记录代码块耗时的上下文管理器
+
+        用法:
+            with STAGE_SECONDS.time('parse_xml'):
+                ...
+        """
+        return _Timer(self, label_values)
+
+    def timed(self, *label_values):
+        """记录函数耗时的装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, *label_values)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        """获取当前数据：{标签值元组: [各区间计数..., 超出最大区间的计数, 总和]}"""
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    def _reset(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'start')
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+############################################################
+# 指标注册
+############################################################
+_registry = {}  # 指标名 -> 指标对象，按注册顺序输出
+_registry_lock = threading.Lock()
+
+def _register(metric_class, name, *args, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = metric_class(name, *args, **kwargs)
+        elif not isinstance(metric, metric_class):
+            raise ValueError(f"指标 {name} 已注册为 {metric.type}")
+    return metric
+
+def counter(name, documentation, labels=()):
+    """注册（或获取已注册的）计数器"""
+    return _register(Counter, name, documentation, labels)
+
+def histogram(name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+    """注册（或获取已注册的）直方图"""
+    return _register(Histogram, name, documentation, labels, buckets)
+
+def snapshot():
+    """
+    获取当前进程全部指标的数据，可以直接写入JSON
+
+    Returns:
+        dict: {指标名: {'type', 'help', 'labels', 'buckets', 'series': [[标签值列表, 数据], ...]}}
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    result = {}
+    for metric in metrics:
+        result[metric.name] = {
+            'type': metric.type,
+            'help': metric.documentation,
+            'labels': list(metric.labels),
+            'buckets': list(getattr(metric, 'buckets', ())),
+            'series': [[list(labels), data] for labels, data in metric.snapshot().items()]
+        }
+    return result
+
+############################################################
+# 多进程汇总
+# 多进程模式下每个工作进程各自统计，/metrics请求只会由其中一个工作进程处理。
+# 各工作进程定期把自己的数据写入 <目录>/<PID>.json，输出时汇总目录中所有进程的数据；
+# 工作进程退出后，主进程把它的数据合并进 archive.json，计数器不会因工作进程替换而减少
+############################################################
+_multiprocess_dir = None
+_ARCHIVE_FILE = 'archive.json'
+_exporter = None
+_exporter_stop = threading.Event()
+
+def enable_multiprocess(directory):
+    """
+    启用多进程汇总，清空目录中上次运行留下的数据（主进程在fork工作进程之前调用）
+
+    Args:
+        directory (str): 各进程指标快照文件的目录
+    """
+    global _multiprocess_dir
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(directory, name))
+    _multiprocess_dir = directory
+
+def start_exporter(interval):
+    """
+    在工作进程中启动后台线程，每隔interval秒写入一次本进程的指标快照
+
+    Args:
+        interval (float): 写入间隔（秒）
+    """
+    global _exporter
+    if _multiprocess_dir is None or (_exporter is not None and _exporter.is_alive()):
+        return
+    _exporter_stop.clear()
+    _exporter = threading.Thread(target=_export_loop, args=(interval,), name='metrics-exporter', daemon=True)
+    _exporter.start()
+
+def stop_exporter():
+    """停止后台写入线程，并写入最后一次快照（工作进程退出前调用）"""
+    _exporter_stop.set()
+    if _exporter is not None:
+        # 等待正在进行的写入完成，避免它覆盖最后一次快照
+        _exporter.join(timeout=1)
+    if _multiprocess_dir is not None:
+        _write_snapshot()
+
+def _export_loop(interval):
+    while not _exporter_stop.wait(interval):
+        _write_snapshot()
+
+def _write_snapshot():
+    path = os.path.join(_multiprocess_dir, f"{os.getpid()}.json")
+    try:
+        _write_json(path, snapshot())
+    except Exception as e:
+        logger.error(f"写入指标快照失败: {e}")
+
+def _write_json(path, data):
+    # 先写临时文件再原子替换，读取方不会读到写了一半的文件
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def archive_process(pid):
+    """
+    把已退出的工作进程的指标合并进archive.json（主进程回收工作进程后调用）
+
+    Args:
+        pid (int): 已退出的工作进程PID
+    """
+    if _multiprocess_dir is None:
+        return
+    path = os.path.join(_multiprocess_dir, f"{pid}.json")
+    data = _read_json(path)
+    if data is None:
+        return
+    archive_path = os.path.join(_multiprocess_dir, _ARCHIVE_FILE)
+    merged = _merge([_read_json(archive_path) or {}, data])
+    try:
+        _write_json(archive_path, merged)
+        os.remove(path)
+    except OSError as e:
+        logger.error(f"归档工作进程 {pid} 的指标失败: {e}")
+
+def _merge(snapshots):
+    """按指标名和标签值把多个快照的数据相加"""
+    merged = {}
+    for data in snapshots:
+        for name, metric in data.items():
+            target = merged.setdefault(name, {**metric, 'series': {}})
+            series = target['series']
+            for labels, values in (metric['series'].items() if isinstance(metric['series'], dict)
+                                   else ((tuple(labels), values) for labels, values in metric['series'])):
+                current = series.get(labels)
+                if current is None:
+                    series[labels] = list(values) if isinstance(values, list) else values
+                elif isinstance(values, list):
+                    series[labels] = [a + b for a, b in zip(current, values)]
+                else:
+                    series[labels] = current + values
+    for metric in merged.values():
+        metric['series'] = [[list(labels), values] for labels, values in metric['series'].items()]
+    return merged
+
+def collect():
+    """
+    汇总所有进程的指标数据
+
+    Returns:
+        dict: 与snapshot()格式相同
+    """
+    own = snapshot()
+    if _multiprocess_dir is None:
+        return own
+    snapshots = [own]
+    own_file = f"{os.getpid()}.json"
+    try:
+        names = os.listdir(_multiprocess_dir)
+    except OSError:
+        names = []
+    for name in names:
+        # 本进程使用内存中的最新数据，不读取自己写入的快照
+        if name.endswith('.json') and name != own_file:
+            data = _read_json(os.path.join(_multiprocess_dir, name))
+            if data:
+                snapshots.append(data)
+    return _merge(snapshots)
+
+def _reset_after_fork():
+    """
+    fork后在子进程中清空继承的指标数据
+
+    子进程从零开始统计，父进程（如主进程加载数据时）的统计不会被每个工作进程重复上报；
+    锁可能在fork时正被其他线程持有，一并重新创建
+    """
+    global _registry_lock, _exporter
+    _registry_lock = threading.Lock()
+    _exporter = None
+    for metric in _registry.values():
+        metric._reset()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+############################################################
+# Prometheus文本格式输出
+############################################################
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+def _format_bound(bound):
+    return repr(float(bound)) if not float(bound).is_integer() else f"{float(bound):.1f}"
+
+def render():
+    """
+    以Prometheus文本格式输出全部指标（多进程模式下为所有工作进程的汇总）
+
+    Returns:
+        str: 指标文本
+    """
+    lines = []
+    for name, metric in collect().items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        label_names = metric['labels']
+        for label_values, values in sorted(metric['series'], key=lambda item: item[0]):
+            if metric['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(label_names, label_values)} {_format_value(values)}")
+                continue
+            # 直方图的区间计数是累计值：le="x" 表示观测值 <= x 的次数
+            cumulative = 0
+            for bound, count in zip(metric['buckets'], values):
+                cumulative += count
+                labels = _format_labels(label_names, label_values, ('le', _format_bound(bound)))
+                lines.append(f"{name}_bucket{labels} {cumulative}")
+            cumulative += values[len(metric['buckets'])]
+            lines.append(f"{name}_bucket{_format_labels(label_names, label_values, ('le', '+Inf'))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, label_values)} {_format_value(values[-1])}")
+            lines.append(f"{name}_count{_format_labels(label_names, label_values)} {cumulative}")
+    return '\n'.join(lines) + '\n'
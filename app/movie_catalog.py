@@ -0,0 +1,330 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 电影目录模块：在内存中保存全部电影的精简信息，搜索、评分和推荐展示直接读取，不再逐条查询数据库
+
+############################################################
+# 导入必要的库
+############################################################
+import logging  # 日志库
+import threading  # 线程库，保护目录加载和后台刷新
+import time  # 定时刷新
+from app import db_manager  # 数据库管理模块，提供电影数据
+from app.title_index import TitleIndex  # 电影标题倒排索引
+from app.title_matcher import TitleMatcher  # 容错的电影标题匹配器
+from app.config import MOVIE_CATALOG_REFRESH_INTERVAL  # 电影目录刷新间隔
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+############################################################
+# 电影记录
+############################################################
+class MovieRecord:
+    """
+    精简的电影记录
+
+    使用__slots__存储，每条记录只占用固定的几个字段，没有每个对象一个字典的开销。
+    同时支持 movie['title'] 和 movie.get('title') 的访问方式，
+    可以直接传给原来接收数据库行字典的函数（如get_movie_details_for_display）
+    """
+
+    __slots__ = ('id', 'title', 'douban_rating', 'rating_count', 'release_date', 'genres', 'plot_summary')
+
+    def __init__(self, row):
+        """
+        Args:
+            row (dict): db_manager.get_catalog_movies()返回的一行
+        """
+        self.id = row['id']
+        self.title = row['title']
+        self.douban_rating = row.get('douban_rating')
+        self.rating_count = row.get('rating_count')
+        self.release_date = row.get('release_date')
+        self.genres = row.get('genres')
+        self.plot_summary = row.get('plot_summary') or ''
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.__slots__:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+    def to_dict(self):
+        """转换为普通字典"""
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    def __repr__(self):
+        return f"MovieRecord(id={self.id!r}, title={self.title!r})"
+
+############################################################
+# 电影目录
+############################################################
+def _title_key(title):
+    """
+    标题的比较键
+
+    movies表使用utf8mb4_unicode_ci排序规则，WHERE title = %s 比较时不区分大小写、忽略末尾空格，
+    内存中按标题查询时保持相同的匹配行为
+    """
+    return title.rstrip(' ').casefold()
+
+class MovieCatalog:
+    """
+    电影目录：电影ID、标题、豆瓣评分排序三种索引，以及标题倒排索引
+
+    目录对象创建后不再修改，刷新时构建新的目录对象再整体替换，读取方无需加锁
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (iterable): MovieRecord列表
+        """
+        self.by_id = {}
+        self.by_title = {}
+        for record in sorted(records, key=lambda r: r.id):
+            self.by_id[record.id] = record
+            self.by_title.setdefault(_title_key(record.title), []).append(record)
+        # 按豆瓣评分从高到低排列，没有评分的电影排在最后（与MySQL中 ORDER BY douban_rating DESC 一致）
+        self.by_rating = sorted(
+            self.by_id.values(),
+            key=lambda r: (r.douban_rating is None, -(r.douban_rating or 0))
+        )
+        self._title_index = None
+        self._title_matcher = None
+
+    @property
+    def title_index(self):
+        """标题倒排索引，首次使用时构建（按豆瓣评分排序的电影编号）"""
+        if self._title_index is None:
+            self._title_index = TitleIndex(self.by_rating)
+        return self._title_index
+
+    @property
+    def title_matcher(self):
+        """容错标题匹配器（错别字、繁简体、拼音首字母），首次使用时构建"""
+        if self._title_matcher is None:
+            self._title_matcher = TitleMatcher(self.by_rating)
+        return self._title_matcher
+
+    def build_indexes(self):
+        """预先构建标题索引，避免第一次搜索承担构建耗时"""
+        self.title_index
+        self.title_matcher
+
+    def __len__(self):
+        return len(self.by_id)
+
+    def get(self, movie_id):
+        """按ID查询电影，不存在时返回None"""
+        return self.by_id.get(movie_id)
+
+    def get_many(self, movie_ids):
+        """
+        按ID列表查询电影
+
+        Returns:
+            list: 顺序与movie_ids一致，不存在的电影被跳过，重复的ID只返回一次
+        """
+        return [self.by_id[movie_id] for movie_id in dict.fromkeys(movie_ids) if movie_id in self.by_id]
+
+    def find_by_title(self, title):
+        """按标题精确查询电影，返回同名电影列表"""
+        return list(self.by_title.get(_title_key(title), ()))
+
+    def top_rated(self, exclude_movie_ids=None, limit=100):
+        """
+        获取豆瓣评分最高的电影
+
+        Args:
+            exclude_movie_ids (iterable, optional): 需要排除的电影ID
+            limit (int): 返回数量
+
+        Returns:
+            list: 电影记录列表，按豆瓣评分降序
+        """
+        exclude = set(exclude_movie_ids or ())
+        result = []
+        for record in self.by_rating:
+            if record.id in exclude:
+                continue
+            result.append(record)
+            if len(result) >= limit:
+                break
+        return result
+
+############################################################
+# 全局电影目录
+############################################################
+_catalog = None
+_catalog_lock = threading.Lock()
+_refresher = None
+
+def load_movie_catalog():
+    """
+    从数据库加载全部电影，替换当前目录
+
+    Returns:
+        MovieCatalog: 新的电影目录
+    """
+    global _catalog
+    start_time = time.time()
+    rows = db_manager.get_catalog_movies()
+    catalog = MovieCatalog(MovieRecord(row) for row in rows)
+    catalog.build_indexes()
+    _catalog = catalog
+    logger.info(f"电影目录加载完成: {len(catalog)} 部电影, 耗时 {time.time() - start_time:.2f} 秒")
+    return catalog
+
+def get_movie_catalog():
+    """
+    获取电影目录，首次调用时加载
+
+    Returns:
+        MovieCatalog: 电影目录
+    """
+    if _catalog is not None:
+        return _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            load_movie_catalog()
+    return _catalog
+
+def refresh_movies(movie_ids=None):
+    """
+    电影数据发生变化后刷新目录（新增、修改或删除电影后调用）
+
+    Args:
+        movie_ids (list, optional): 发生变化的电影ID，只重新加载这些电影；默认重新加载全部电影
+    """
+    global _catalog
+    if movie_ids is None or _catalog is None:
+        load_movie_catalog()
+        return
+    movie_ids = list(movie_ids)
+    rows = db_manager.get_catalog_movies(movie_ids)
+    with _catalog_lock:
+        records = dict(_catalog.by_id)
+        # 数据库中已不存在的电影视为已删除
+        for movie_id in movie_ids:
+            records.pop(movie_id, None)
+        for row in rows:
+            records[row['id']] = MovieRecord(row)
+        catalog = MovieCatalog(records.values())
+        catalog.build_indexes()
+        _catalog = catalog
+    logger.info(f"电影目录已刷新 {len(movie_ids)} 部电影")
+
+def start_refresher(interval=MOVIE_CATALOG_REFRESH_INTERVAL):
+    """启动后台刷新线程，每隔interval秒重新加载一次电影目录"""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    _refresher = threading.Thread(
+        target=_refresh_loop, args=(interval,), name='movie-catalog-refresher', daemon=True
+    )
+    _refresher.start()
+
+def _refresh_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            load_movie_catalog()
+        except Exception as e:
+            logger.error(f"电影目录刷新失败: {e}")
+
+############################################################
+# 带数据库回退的查询函数
+# 电影目录不可用（例如启动时数据库连接失败）时直接查询数据库，保证功能可用
+############################################################
+def get_movies_by_ids(movie_ids):
+    """
+    按ID列表获取电影，顺序与movie_ids一致
+
+    Returns:
+        list: 电影记录列表
+    """
+    try:
+        return get_movie_catalog().get_many(movie_ids)
+    except Exception as e:
+        logger.error(f"电影目录不可用，改为查询数据库: {e}")
+        return db_manager.get_movies_by_ids(movie_ids)
+
+def search_movies_by_title_exact(title):
+    """
+    按标题精确查询电影
+
+    Returns:
+        list: 同名电影列表
+    """
+    try:
+        return get_movie_catalog().find_by_title(title)
+    except Exception as e:
+        logger.error(f"电影目录不可用，改为查询数据库: {e}")
+        return db_manager.search_movies_by_title_exact(title)
+
+def get_top_rated_movies(exclude_movie_ids=None, limit=100):
+    """
+    获取豆瓣评分最高的电影（排除指定的电影）
+
+    Returns:
+        list: 电影记录列表，按豆瓣评分降序
+    """
+    try:
+        return get_movie_catalog().top_rated(exclude_movie_ids, limit)
+    except Exception as e:
+        logger.error(f"电影目录不可用，改为查询数据库: {e}")
+        return db_manager.get_movies_for_content_based_recommendation(
+            exclude_movie_ids=list(exclude_movie_ids or []), limit=limit
+        )
+
+def search_movies_by_title_fuzzy(title, limit=5):
+    """
+    查找标题包含关键词的电影，按豆瓣评分降序（与SQL中 LIKE '%关键词%' 的结果一致）
+
+    Returns:
+        list: 电影记录列表
+    """
+    try:
+        return get_movie_catalog().title_index.search_substring(title, limit)
+    except Exception as e:
+        logger.error(f"电影目录不可用，改为查询数据库: {e}")
+        return db_manager.search_movies_by_title_fuzzy(title, limit=limit)
+
+def match_movie_title(title, limit=5):
+    """
+    容错匹配电影标题：繁简体、大小写、标点不同，拼音首字母，或有少量错别字
+
+    Returns:
+        list: [(电影记录, 编辑距离), ...]，编辑距离小的在前；电影目录不可用时返回空列表
+    """
+    try:
+        return get_movie_catalog().title_matcher.match(title, limit)
+    except Exception as e:
+        logger.error(f"标题容错匹配失败: {e}")
+        return []
+
+def search_movies_by_title_similar(title, limit=5):
+    """
+    查找标题与关键词相近的电影（关键词有错字、多字或少字时使用）
+
+    先做容错匹配（错别字、繁简体、拼音首字母），找不到时再按字符二元组相似度查找
+
+    Returns:
+        list: 电影记录列表，按相近程度降序；电影目录不可用时返回空列表
+    """
+    matches = match_movie_title(title, limit)
+    if matches:
+        return [record for record, _ in matches]
+    try:
+        return [record for record, _ in get_movie_catalog().title_index.search_similar(title, limit)]
+    except Exception as e:
+        logger.error(f"标题相似匹配失败: {e}")
+        return []
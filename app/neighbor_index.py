@@ -0,0 +1,374 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 邻居索引模块：离线预计算每个用户最相似的Top-K邻居，保存为可内存映射的磁盘文件，请求时直接查询
+
+############################################################
+# 导入必要的库
+############################################################
+import os  # 文件路径
+import time  # 构建耗时统计和定时刷新
+import logging  # 日志库
+import threading  # 后台刷新线程
+import numpy as np  # 数值计算库，索引数组存储
+from app import db_manager  # 数据库管理模块，用于监听评分变更
+from app import rating_matrix  # 内存评分矩阵模块
+from app import rating_versions  # 评分版本模块，发现其他工作进程处理的评分
+from app import similarity  # 相似度计算模块
+from app import snapshot_store  # 按版本存储、内存映射加载的快照文件
+from app.config import (
+    SIMILAR_USERS_COUNT,
+    MIN_COMMON_RATINGS,
+    NEIGHBOR_INDEX_DIR,
+    NEIGHBOR_INDEX_REFRESH_INTERVAL,
+    NEIGHBOR_INDEX_REFRESH_AFTER_RATINGS,
+    SNAPSHOT_CHECK_INTERVAL
+)  # 邻居数量及索引刷新配置
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+# 磁盘上的索引目录结构（版本目录和CURRENT文件的管理见snapshot_store）：
+#   NEIGHBOR_INDEX_DIR/
+#    ├── CURRENT              - 当前生效的索引版本目录名（通过原子替换更新）
+#    └── gen-<时间戳>/        - 每次构建生成一个新的版本目录
+#         ├── user_ids.npy    - 升序排列的用户ID
+#         ├── neighbors.npy   - 每个用户的邻居用户ID，形状为 (用户数, K)，不足K个时用-1填充
+#         ├── similarities.npy - 对应的相似度，形状为 (用户数, K)
+#         └── meta.json       - 构建时间、邻居数、所基于的评分数据时间和全局评分序号等元数据
+_ARRAY_NAMES = ('user_ids', 'neighbors', 'similarities')
+
+############################################################
+# 邻居索引
+############################################################
+class NeighborIndex:
+    """
+    用户Top-K邻居索引
+
+    所有数组都可以是np.load(mmap_mode='r')得到的内存映射数组，
+    多个进程加载同一个索引文件时共享操作系统的页缓存
+    """
+
+    def __init__(self, user_ids, neighbors, similarities, meta=None):
+        """
+        Args:
+            user_ids (np.ndarray): 升序排列的用户ID
+            neighbors (np.ndarray): 邻居用户ID，形状为 (用户数, K)，-1表示空位
+            similarities (np.ndarray): 邻居相似度，形状为 (用户数, K)
+            meta (dict, optional): 元数据
+        """
+        self.user_ids = user_ids
+        self.neighbors = neighbors
+        self.similarities = similarities
+        self.meta = meta or {}
+
+    def lookup(self, user_id):
+        """
+        查询用户的邻居
+
+        Args:
+            user_id (int): 用户ID
+
+        Returns:
+            list or None: [(邻居用户ID, 相似度), ...]，按相似度从高到低排序；用户不在索引中时返回None
+        """
+        pos = int(np.searchsorted(self.user_ids, user_id))
+        if pos >= len(self.user_ids) or self.user_ids[pos] != user_id:
+            return None
+        neighbor_ids = self.neighbors[pos]
+        valid = neighbor_ids >= 0
+        return list(zip(neighbor_ids[valid].tolist(), self.similarities[pos][valid].tolist()))
+
+    def lookup_many(self, ids):
+        """
+        批量查询多个ID的邻居
+
+        Args:
+            ids (np.ndarray): 要查询的ID数组
+
+        Returns:
+            tuple: (found, neighbors, similarities)
+                   found为布尔数组，表示每个ID是否在索引中；
+                   neighbors/similarities为索引中找到的那些ID的邻居行，形状为 (找到的数量, K)，-1表示空位
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.user_ids, ids)
+        found = positions < len(self.user_ids)
+        found[found] = self.user_ids[positions[found]] == ids[found]
+        positions = positions[found]
+        return found, self.neighbors[positions], self.similarities[positions]
+
+    def save(self, directory):
+        """
+        将索引写入一个新的版本目录，写完后原子地更新CURRENT指向它
+
+        Args:
+            directory (str): 索引根目录
+
+        Returns:
+            str: 新版本目录的路径
+        """
+        generation = snapshot_store.write_generation(directory, {
+            'user_ids': self.user_ids,
+            'neighbors': self.neighbors,
+            'similarities': self.similarities
+        }, self.meta)
+        return os.path.join(directory, generation)
+
+    @classmethod
+    def load(cls, directory, generation=None):
+        """
+        以内存映射方式加载索引版本
+
+        Args:
+            directory (str): 索引根目录
+            generation (str, optional): 版本目录名，默认为CURRENT指向的版本
+
+        Returns:
+            NeighborIndex or None: 索引不存在时返回None
+        """
+        loaded = snapshot_store.load_generation(directory, _ARRAY_NAMES, generation)
+        if loaded is None:
+            return None
+        arrays, meta = loaded
+        return cls(arrays['user_ids'], arrays['neighbors'], arrays['similarities'], meta)
+
+def build_neighbor_index(matrix, k=SIMILAR_USERS_COUNT, min_common=MIN_COMMON_RATINGS, rating_version=None):
+    """
+    为评分矩阵中的每个用户计算Top-K邻居
+
+    传入转置后的评分矩阵（电影×用户）时，得到的是每部电影的Top-K相似电影
+
+    Args:
+        matrix (RatingMatrix): 评分矩阵
+        k (int): 每个用户保留的邻居数
+        min_common (int): 最少共同评分电影数
+        rating_version (int, optional): 评分矩阵包含的全局评分序号，默认为matrix.rating_version
+
+    Returns:
+        NeighborIndex: 新构建的索引
+    """
+    start_time = time.time()
+    user_ids = matrix.user_ids.copy()
+    n_users = len(user_ids)
+    neighbors = np.full((n_users, k), -1, dtype=np.int64)
+    similarities = np.zeros((n_users, k), dtype=np.float64)
+
+    for row in range(n_users):
+        rows, sims, _ = similarity.user_similarities(matrix, row, min_common)
+        top_rows, top_sims = similarity.top_neighbors(rows, sims, k)
+        neighbors[row, :len(top_rows)] = user_ids[top_rows]
+        similarities[row, :len(top_rows)] = top_sims
+
+    # 按用户ID排序，便于查询时二分查找
+    order = np.argsort(user_ids, kind='stable')
+    meta = {
+        'built_at': start_time,
+        'k': k,
+        'min_common': min_common,
+        'size': n_users,
+        'build_seconds': round(time.time() - start_time, 3),
+        # 所基于的评分数据的时间：此后发生的评分变更不包含在索引中
+        'data_as_of': matrix.as_of if matrix.as_of is not None else start_time,
+        # 所基于的全局评分序号：评分版本大于它的用户，其邻居需要实时计算
+        'rating_version': rating_version if rating_version is not None else matrix.rating_version
+    }
+    return NeighborIndex(user_ids[order], neighbors[order], similarities[order], meta)
+
+############################################################
+# 全局邻居索引
+############################################################
+_index = None
+_dirty_users = {}  # 索引构建之后评分发生过变化的用户 -> 最近一次变化的时间，这些用户的邻居需要实时计算
+_dirty_lock = threading.Lock()
+_watcher = None  # 检查其他进程是否发布了新版本索引
+_ratings_since_build = 0
+_refresh_event = threading.Event()
+_refresher = None
+_rebuild_listeners = []  # 索引重建完成后需要通知的回调函数
+
+def add_rebuild_listener(listener):
+    """
+    注册索引重建监听函数，每次新索引生效后调用 listener(index)
+
+    Args:
+        listener (callable): 回调函数
+    """
+    _rebuild_listeners.append(listener)
+
+def _notify_rebuild_listeners(index):
+    for listener in list(_rebuild_listeners):
+        try:
+            listener(index)
+        except Exception as e:
+            logger.error(f"邻居索引重建监听函数执行失败: {e}")
+
+def get_neighbor_index():
+    """
+    获取当前生效的邻居索引
+
+    其他进程（多进程模式下的主进程）发布了新版本索引时，切换为以内存映射方式加载的新版本
+
+    Returns:
+        NeighborIndex or None: 尚未加载或构建索引时返回None
+    """
+    watcher = _watcher
+    if watcher is not None:
+        generation = watcher.check(_index.meta.get('generation') if _index is not None else None)
+        if generation is not None:
+            _adopt_generation(watcher.directory, generation)
+    return _index
+
+def load_neighbor_index(directory=NEIGHBOR_INDEX_DIR):
+    """
+    从磁盘加载邻居索引（服务启动时调用），此后定期检查该目录是否发布了新版本
+
+    Returns:
+        NeighborIndex or None: 磁盘上没有索引时返回None
+    """
+    global _index, _watcher
+    _watcher = snapshot_store.GenerationWatcher(directory, SNAPSHOT_CHECK_INTERVAL)
+    try:
+        index = NeighborIndex.load(directory)
+    except Exception as e:
+        logger.error(f"加载邻居索引失败: {e}")
+        return None
+    if index is not None:
+        _index = index
+        logger.info(f"邻居索引加载完成: 版本 {index.meta.get('generation')}, {len(index.user_ids)} 个用户")
+    return index
+
+def _adopt_generation(directory, generation):
+    """
+    切换为其他进程发布的索引版本
+
+    新索引基于meta['data_as_of']时的评分数据：在此之前发生变化的用户已包含在新索引中，
+    不再需要实时计算；之后发生变化的用户仍然标记为需要实时计算
+    """
+    global _index
+    try:
+        index = NeighborIndex.load(directory, generation)
+    except Exception as e:
+        logger.error(f"加载邻居索引版本 {generation} 失败: {e}")
+        return
+    data_as_of = index.meta.get('data_as_of', index.meta.get('built_at', 0))
+    with _dirty_lock:
+        _index = index
+        for user_id, changed_at in list(_dirty_users.items()):
+            if changed_at < data_as_of:
+                del _dirty_users[user_id]
+    logger.info(f"切换到新版本邻居索引: {generation}, {len(index.user_ids)} 个用户")
+    _notify_rebuild_listeners(index)
+
+def rebuild_neighbor_index(directory=NEIGHBOR_INDEX_DIR):
+    """
+    基于当前评分矩阵重新构建邻居索引，写入磁盘后原子地替换当前索引
+
+    Returns:
+        NeighborIndex: 新索引
+    """
+    global _index, _ratings_since_build, _watcher
+    # 单进程模式下评分由本进程同步写入评分矩阵，读取矩阵之前的全局序号对应的评分都已包含在其中；
+    # 由快照加载的矩阵只包含加载时的评分
+    rating_version = rating_versions.current_version()
+    matrix = rating_matrix.get_rating_matrix()
+    if matrix.generation is not None:
+        rating_version = matrix.rating_version
+    with _dirty_lock:
+        # 构建期间再次发生变化的用户变化时间会更新，构建完成后仍保留在脏用户表中
+        dirty_before_build = dict(_dirty_users)
+        _ratings_since_build = 0
+
+    index = build_neighbor_index(matrix, rating_version=rating_version)
+    index.save(directory)
+    # 切换为从磁盘内存映射的版本，与其他进程共享页缓存
+    index = NeighborIndex.load(directory) or index
+
+    with _dirty_lock:
+        _index = index
+        for user_id, changed_at in dirty_before_build.items():
+            if _dirty_users.get(user_id) == changed_at:
+                del _dirty_users[user_id]
+    if _watcher is None or _watcher.directory != directory:
+        _watcher = snapshot_store.GenerationWatcher(directory, SNAPSHOT_CHECK_INTERVAL)
+    logger.info(f"邻居索引重建完成: {len(index.user_ids)} 个用户, 耗时 {index.meta.get('build_seconds')} 秒")
+    _notify_rebuild_listeners(index)
+    return index
+
+def get_neighbors(user_id):
+    """
+    从索引查询用户的邻居
+
+    Args:
+        user_id (int): 用户ID
+
+    Returns:
+        list or None: [(邻居用户ID, 相似度), ...]；索引不可用、用户不在索引中，
+                      或用户在索引构建后评分发生了变化（包括在其他工作进程中评分）时返回None，调用方应实时计算
+    """
+    index = get_neighbor_index()
+    if index is None or user_id in _dirty_users:
+        return None
+    built_version = index.meta.get('rating_version')
+    if built_version is not None:
+        version = rating_versions.get_version(user_id)
+        if version is not None and version > built_version:
+            return None
+    return index.lookup(user_id)
+
+def ratings_since_build(index=None):
+    """
+    索引构建之后所有工作进程累计的评分次数，多进程模式下主进程据此判断是否提前重建
+
+    Args:
+        index (NeighborIndex, optional): 邻居索引，默认为当前索引
+
+    Returns:
+        int or None: 评分次数；索引中没有记录全局评分序号或查询失败时返回None
+    """
+    index = index if index is not None else _index
+    if index is None or index.meta.get('rating_version') is None:
+        return None
+    current = rating_versions.current_version()
+    if current is None:
+        return None
+    return current - index.meta['rating_version']
+
+def on_rating_changed(user_id, movie_id, score):
+    """
+    评分变更监听函数：标记该用户的邻居需要实时计算，评分变更累计到阈值时触发重建
+    """
+    global _ratings_since_build
+    with _dirty_lock:
+        _dirty_users[int(user_id)] = time.time()
+        _ratings_since_build += 1
+        should_refresh = _ratings_since_build >= NEIGHBOR_INDEX_REFRESH_AFTER_RATINGS
+    if should_refresh:
+        _refresh_event.set()
+
+def start_refresher(directory=NEIGHBOR_INDEX_DIR, interval=NEIGHBOR_INDEX_REFRESH_INTERVAL):
+    """
+    启动后台刷新线程：每隔interval秒，或评分变更累计达到阈值时重建索引
+
+    磁盘上没有可用索引时，刷新线程启动后会立即构建一次
+    """
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    if _index is None:
+        _refresh_event.set()
+    _refresher = threading.Thread(
+        target=_refresh_loop, args=(directory, interval), name='neighbor-index-refresher', daemon=True
+    )
+    _refresher.start()
+
+def _refresh_loop(directory, interval):
+    while True:
+        _refresh_event.wait(interval)
+        _refresh_event.clear()
+        try:
+            rebuild_neighbor_index(directory)
+        except Exception as e:
+            logger.error(f"邻居索引重建失败: {e}")
+
+# 评分变更后标记用户，确保其邻居实时计算而不是使用过期的索引
+db_manager.add_rating_listener(on_rating_changed)
@@ -3,92 +3,331 @@
 # Mindsnap团队的电影推荐系统分团队
 # 速率限制模块：防止用户频繁请求，保护系统稳定性
 
+import os
 import time
 import logging
-from collections import defaultdict, deque
+import sqlite3
+import threading
+from collections import OrderedDict
+from app.config import RATE_LIMIT_CONFIG
 
 logger = logging.getLogger(__name__)
 
+############################################################
+# 存储后端
+# 每个后端提供：
+#   hit(key, max_requests, window, now)       -> (是否允许, 剩余次数)，允许时记录这次请求
+#   remaining(key, max_requests, window, now) -> 剩余次数，不记录请求
+#   evict_idle(now)                           -> 移除已空闲的用户，返回移除的数量
+############################################################
+class MemoryBackend:
+    """
+    进程内存储：滑动窗口计数算法
+
+    每个用户只保存一个三元组：当前窗口的开始时间、当前窗口和上一个窗口的请求数，
+    每次检查的耗时和每个用户占用的内存都是常数，与时间窗口内的请求数无关。
+    用户按最近一次请求的先后排列，每隔evict_interval秒从最久没有请求的一端开始，
+    移除计数已全部失效的用户，内存占用只与最近活跃的用户数有关。
+    计数只在当前进程内有效，多进程部署时应使用SQLiteBackend
+    """
+
+    def __init__(self, idle_timeout=60, evict_interval=60):
+        """
+        Args:
+            idle_timeout (float): 用户的计数全部滑出窗口、且又经过该时间（秒）后移除，应不小于时间窗口
+            evict_interval (float): 两次移除空闲用户的最小间隔（秒）
+        """
+        self.idle_timeout = idle_timeout
+        self.evict_interval = evict_interval
+        self._counters = OrderedDict()  # 用户 -> (窗口开始时间, 当前窗口请求数, 上一个窗口请求数)，最近请求过的用户在末尾
+        self._lock = threading.Lock()
+        self._next_evict = 0
+
+    def hit(self, key, max_requests, window, now):
+        with self._lock:
+            if now >= self._next_evict:
+                self._evict_idle(now)
+            allowed, remaining, counter = _sliding_window_hit(self._counters.get(key), max_requests, window, now)
+            self._counters[key] = counter
+            self._counters.move_to_end(key)
+        return allowed, remaining
+
+    def remaining(self, key, max_requests, window, now):
+        return _sliding_window_remaining(self._counters.get(key), max_requests, window, now)
+
+    def evict_idle(self, now):
+        with self._lock:
+            return self._evict_idle(now)
+
+    def _evict_idle(self, now):
+        self._next_evict = now + self.evict_interval
+        # 计数在窗口开始后两个窗口内有效，idle_timeout不小于时间窗口时移除的都是已失效的计数
+        expired_before = now - 2 * self.idle_timeout
+        evicted = 0
+        while self._counters:
+            key, (window_start, _, _) = next(iter(self._counters.items()))
+            if window_start >= expired_before:
+                break
+            del self._counters[key]
+            evicted += 1
+        return evicted
+
+    def __len__(self):
+        return len(self._counters)
+
+class SQLiteBackend:
+    """
+    多进程共享存储：所有工作进程读写同一个SQLite数据库文件
+
+    与MemoryBackend使用同样的滑动窗口计数算法，每个用户只保存一行计数。
+    每次检查在一个IMMEDIATE事务中读取并更新该行，多个进程同时请求时由SQLite的写锁串行化。
+    数据库文件可以放在/dev/shm等内存文件系统中，避免磁盘写入
+    """
+
+    def __init__(self, path, idle_timeout=60, evict_interval=60, busy_timeout=1.0):
+        """
+        Args:
+            path (str): 数据库文件路径
+            idle_timeout (float): 用户的计数全部滑出窗口、且又经过该时间（秒）后删除，应不小于时间窗口
+            evict_interval (float): 每个进程两次清理空闲用户的最小间隔（秒）
+            busy_timeout (float): 等待其他进程释放写锁的最长时间（秒）
+        """
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.evict_interval = evict_interval
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._next_evict = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # 每个线程一个连接；fork出的子进程不使用从父进程继承的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        # 计数数据丢失的代价只是限流短暂失效，不需要每次提交都同步到磁盘
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "  user_key TEXT PRIMARY KEY,"
+            "  window_start INTEGER NOT NULL,"
+            "  current_count INTEGER NOT NULL,"
+            "  previous_count INTEGER NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, key, max_requests, window, now):
+        if now >= self._next_evict:
+            self.evict_idle(now)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT window_start, current_count, previous_count FROM rate_limits WHERE user_key = ?", (key,)
+            ).fetchone()
+            allowed, remaining, counter = _sliding_window_hit(row, max_requests, window, now)
+            if allowed:
+                conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (user_key, window_start, current_count, previous_count) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key,) + counter
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, remaining
+
+    def remaining(self, key, max_requests, window, now):
+        row = self._connection().execute(
+            "SELECT window_start, current_count, previous_count FROM rate_limits WHERE user_key = ?", (key,)
+        ).fetchone()
+        return _sliding_window_remaining(row, max_requests, window, now)
+
+    def evict_idle(self, now):
+        self._next_evict = now + self.evict_interval
+        try:
+            # 一行的计数在窗口开始后两个窗口内有效，idle_timeout不小于时间窗口时删除的都是已失效的行
+            cursor = self._connection().execute(
+                "DELETE FROM rate_limits WHERE window_start < ?", (now - 2 * self.idle_timeout,)
+            )
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"清理空闲用户的速率限制记录失败: {e}")
+            return 0
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+############################################################
+# 滑动窗口计数算法
+# 时间按time_window划分为固定窗口，估算最近time_window秒内的请求数：
+#   上一个窗口的请求数 × 上一个窗口仍在滑动窗口内的时间比例 + 当前窗口的请求数
+# 计数为三元组 (窗口开始时间, 该窗口的请求数, 再上一个窗口的请求数)
+############################################################
+def _roll_window(counter, window_start, window):
+    """
+    把保存的计数换算到以window_start开始的当前窗口
+
+    Returns:
+        tuple: (当前窗口的请求数, 上一个窗口的请求数)
+    """
+    if counter is None:
+        return 0, 0
+    saved_start, current, previous = counter
+    if saved_start == window_start:
+        return current, previous
+    if saved_start == window_start - window:
+        return 0, current
+    return 0, 0
+
+def _sliding_window_count(current, previous, now, window):
+    """估算最近window秒内的请求数：上一个窗口的请求按仍在滑动窗口内的时间比例计入"""
+    elapsed = (now % window) / window
+    return previous * (1 - elapsed) + current
+
+def _sliding_window_hit(counter, max_requests, window, now):
+    """
+    检查一次请求，估算的请求数未达到上限时计入这次请求
+
+    Args:
+        counter (tuple or None): 保存的计数，没有计数时为None
+
+    Returns:
+        tuple: (是否允许, 剩余次数, 更新后的计数)
+    """
+    window_start = int(now // window) * window
+    current, previous = _roll_window(counter, window_start, window)
+    estimated = _sliding_window_count(current, previous, now, window)
+    allowed = estimated < max_requests
+    if allowed:
+        current += 1
+        estimated += 1
+    return allowed, max(0, int(max_requests - estimated)), (window_start, current, previous)
+
+def _sliding_window_remaining(counter, max_requests, window, now):
+    """不计入请求，只计算剩余次数"""
+    current, previous = _roll_window(counter, int(now // window) * window, window)
+    return max(0, int(max_requests - _sliding_window_count(current, previous, now, window)))
+
+def create_backend(config):
+    """
+    按配置创建存储后端
+
+    Args:
+        config (dict): RATE_LIMIT_CONFIG格式的配置
+
+    Returns:
+        MemoryBackend or SQLiteBackend: 存储后端
+    """
+    backend = config.get('backend', 'memory')
+    if backend == 'memory':
+        return MemoryBackend(idle_timeout=config['time_window'], evict_interval=config['evict_interval'])
+    if backend == 'sqlite':
+        return SQLiteBackend(
+            config['sqlite_path'], idle_timeout=config['time_window'], evict_interval=config['evict_interval']
+        )
+    raise ValueError(f"未知的速率限制存储后端: {backend}")
+
+############################################################
+# 速率限制器
+############################################################
 class RateLimiter:
     """
     简单的速率限制器
-    
-    使用滑动窗口算法限制用户请求频率
+
+    限制每个用户在时间窗口内的请求数，计数保存在可替换的存储后端中
     """
-    
-    def __init__(self, max_requests=10, time_window=60):
+
+    def __init__(self, max_requests=10, time_window=60, backend=None):
         """
         初始化速率限制器
-        
+
         Args:
             max_requests (int): 时间窗口内最大请求数
             time_window (int): 时间窗口大小（秒）
+            backend (optional): 存储后端，默认为进程内的MemoryBackend
         """
         self.max_requests = max_requests
         self.time_window = time_window
-        self.user_requests = defaultdict(deque)  # 用户请求时间戳队列
-        
+        self.backend = backend if backend is not None else MemoryBackend(idle_timeout=time_window)
+
+    def check(self, user_id):
+        """
+        检查用户是否允许发送请求，同时得到剩余请求次数（只访问一次存储后端）
+
+        Args:
+            user_id (str): 用户标识
+
+        Returns:
+            tuple: (是否允许, 剩余请求次数)
+        """
+        try:
+            allowed, remaining = self.backend.hit(user_id, self.max_requests, self.time_window, time.time())
+        except Exception as e:
+            # 存储后端出错时不限制用户请求
+            logger.error(f"速率限制检查失败: {e}")
+            return True, self.max_requests
+        if not allowed:
+            logger.warning(f"用户 {user_id} 请求频率过高，被限制")
+        return allowed, remaining
+
     def is_allowed(self, user_id):
         """
         检查用户是否允许发送请求
-        
+
         Args:
             user_id (str): 用户标识
-            
+
         Returns:
             bool: True表示允许，False表示被限制
         """
-        current_time = time.time()
-        user_queue = self.user_requests[user_id]
-        
-        # 清理过期的请求记录
-        while user_queue and current_time - user_queue[0] > self.time_window:
-            user_queue.popleft()
-        
-        # 检查是否超过限制
-        if len(user_queue) >= self.max_requests:
-            logger.warning(f"用户 {user_id} 请求频率过高，被限制")
-            return False
-        
-        # 记录当前请求
-        user_queue.append(current_time)
-        return True
-    
+        return self.check(user_id)[0]
+
     def get_remaining_requests(self, user_id):
         """
         获取用户剩余请求次数
-        
+
         Args:
             user_id (str): 用户标识
-            
+
         Returns:
             int: 剩余请求次数
         """
-        current_time = time.time()
-        user_queue = self.user_requests[user_id]
-        
-        # 清理过期的请求记录
-        while user_queue and current_time - user_queue[0] > self.time_window:
-            user_queue.popleft()
-        
-        return max(0, self.max_requests - len(user_queue))
+        try:
+            return self.backend.remaining(user_id, self.max_requests, self.time_window, time.time())
+        except Exception as e:
+            logger.error(f"查询剩余请求次数失败: {e}")
+            return 0
 
 # 全局速率限制器实例
-# 每个用户每分钟最多10次请求
-rate_limiter = RateLimiter(max_requests=10, time_window=60)
+# 默认每个用户每分钟最多10次请求，多进程部署时计数保存在所有工作进程共享的SQLite文件中
+rate_limiter = RateLimiter(
+    max_requests=RATE_LIMIT_CONFIG['max_requests'],
+    time_window=RATE_LIMIT_CONFIG['time_window'],
+    backend=create_backend(RATE_LIMIT_CONFIG)
+)
 
 def check_rate_limit(user_openid):
     """
     检查用户请求是否被速率限制
-    
+
     Args:
         user_openid (str): 用户OpenID
-        
+
     Returns:
         tuple: (是否允许, 错误消息)
     """
-    if not rate_limiter.is_allowed(user_openid):
-        remaining = rate_limiter.get_remaining_requests(user_openid)
+    allowed, remaining = rate_limiter.check(user_openid)
+    if not allowed:
         return False, f"请求过于频繁，请稍后再试。您还可以发送 {remaining} 次请求。"
-    
-    return True, None 
\ No newline at end of file
+
+    return True, None
@@ -0,0 +1,242 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 评分导入工具：把外部评分数据集（如MovieLens格式的CSV）按电影标题对应到movies表后批量导入，
+# 为协同过滤提供足够的相似用户
+#
+# 运行方式（项目根目录下）：
+#   # 评分文件中直接包含电影标题（列：userId,title,rating）
+#   python -m app.rating_importer ratings.csv
+#   # MovieLens格式：评分文件只有movieId，通过movies.csv对应到标题；MovieLens为5分制，乘以2换算为10分制
+#   python -m app.rating_importer ml/ratings.csv --movies ml/movies.csv --score-scale 2
+#
+# 导入的用户以 "--user-prefix + 外部用户ID" 作为openid创建（默认 "import:"），与微信用户区分。
+# 导入完成后重启服务（或等待评分矩阵和邻居索引的定时重建），推荐才会使用新数据。
+
+############################################################
+# 导入必要的库
+############################################################
+import argparse  # 命令行参数解析
+import csv  # 流式读取CSV文件
+import logging  # 日志库
+import re  # 正则表达式，用于处理MovieLens标题
+import time  # 统计耗时和吞吐量
+from app import db_manager  # 数据库管理模块，提供批量写入函数
+from app import movie_catalog  # 电影目录模块，提供标题 -> 电影ID的对应
+from app.utils import LRUCache  # LRU缓存，限制用户ID映射占用的内存
+from app.config import USER_ID_CACHE_SIZE  # 用户ID缓存容量
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+DEFAULT_CHUNK_SIZE = 5000  # 每次读取并写入的评分行数
+DEFAULT_PROGRESS_INTERVAL = 100000  # 每读取多少行输出一次进度
+
+############################################################
+# 标题对应
+############################################################
+# MovieLens标题末尾的年份，如 "Toy Story (1995)"
+_YEAR_SUFFIX = re.compile(r'\s*\((\d{4})\)\s*$')
+# MovieLens把英文冠词放在末尾，如 "Matrix, The (1999)"
+_TRAILING_ARTICLE = re.compile(r'^(.*), (The|A|An)$')
+
+def title_candidates(title):
+    """
+    外部数据集中的标题可能对应的电影标题，按优先级排列
+
+    依次尝试：原标题、去掉末尾年份、把末尾的英文冠词移回开头
+    如 "Matrix, The (1999)" -> ["Matrix, The (1999)", "Matrix, The", "The Matrix"]
+    """
+    title = title.strip()
+    candidates = [title]
+    without_year = _YEAR_SUFFIX.sub('', title)
+    if without_year != title:
+        candidates.append(without_year)
+    match = _TRAILING_ARTICLE.match(without_year)
+    if match:
+        candidates.append(f"{match.group(2)} {match.group(1)}")
+    return candidates
+
+class TitleResolver:
+    """
+    外部标题 -> 电影ID的对应，基于内存电影目录，结果缓存
+
+    同名电影有多部时取豆瓣评分人数最多的一部
+    """
+
+    def __init__(self, catalog, cache_size=USER_ID_CACHE_SIZE):
+        self.catalog = catalog
+        self._cache = LRUCache(max_size=cache_size)
+
+    def resolve(self, title):
+        """
+        Returns:
+            int: 电影ID，找不到对应电影时返回None
+        """
+        movie_id = self._cache.get(title)
+        if movie_id is None:
+            movie_id = 0  # 0表示已查找过但没有对应电影
+            for candidate in title_candidates(title):
+                movies = self.catalog.find_by_title(candidate)
+                if movies:
+                    movie_id = max(movies, key=lambda m: m.rating_count or 0).id
+                    break
+            self._cache.set(title, movie_id)
+        return movie_id or None
+
+def load_external_movie_titles(path, id_column='movieId', title_column='title'):
+    """
+    读取外部数据集的电影文件（如MovieLens的movies.csv）
+
+    Returns:
+        dict: {外部电影ID: 标题}
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return {row[id_column]: row[title_column] for row in csv.DictReader(f)}
+
+############################################################
+# 流式导入
+############################################################
+class ImportStats:
+    """导入进度统计"""
+
+    def __init__(self):
+        self.rows = 0            # 已读取的评分行数
+        self.inserted = 0        # 新增的评分数
+        self.updated = 0         # 更新的评分数
+        self.failed = 0          # 写入失败的评分数
+        self.unknown_movies = 0  # 找不到对应电影而跳过的行数
+        self.invalid_rows = 0    # 格式错误而跳过的行数
+        self.started_at = time.time()
+
+    @property
+    def elapsed(self):
+        return time.time() - self.started_at
+
+    def summary(self):
+        rate = self.rows / self.elapsed if self.elapsed > 0 else 0
+        return (
+            f"已读取 {self.rows} 行 ({rate:.0f} 行/秒): 新增 {self.inserted}, 更新 {self.updated}, "
+            f"失败 {self.failed}, 无对应电影 {self.unknown_movies}, 格式错误 {self.invalid_rows}"
+        )
+
+def _read_chunks(reader, chunk_size):
+    chunk = []
+    for row in reader:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_ratings(path, movie_titles=None, user_column='userId', movie_column='movieId', title_column='title',
+                   score_column='rating', score_scale=1.0, user_prefix='import:', chunk_size=DEFAULT_CHUNK_SIZE,
+                   progress_interval=DEFAULT_PROGRESS_INTERVAL, catalog=None):
+    """
+    流式导入评分文件
+
+    按chunk_size行分块读取，每块：批量解析用户ID -> 按标题对应电影 -> db_manager.add_or_update_ratings批量写入
+    （每条多行INSERT最多500条评分，单独提交）。内存中只保留当前块和有上限的用户、标题缓存，
+    不随文件大小增长。
+
+    Args:
+        path (str): 评分CSV文件路径（带表头）
+        movie_titles (dict, optional): {外部电影ID: 标题}；为None时评分文件需包含title_column列
+        user_column (str): 用户ID列名
+        movie_column (str): 外部电影ID列名（提供movie_titles时使用）
+        title_column (str): 标题列名（未提供movie_titles时使用）
+        score_column (str): 评分列名
+        score_scale (float): 评分换算倍数，如MovieLens的5分制评分乘以2
+        user_prefix (str): 导入用户的openid前缀
+        chunk_size (int): 每块行数
+        progress_interval (int): 每读取多少行输出一次进度
+        catalog (MovieCatalog, optional): 电影目录，默认使用全局电影目录
+
+    Returns:
+        ImportStats: 导入统计
+    """
+    resolver = TitleResolver(catalog or movie_catalog.get_movie_catalog())
+    user_ids = LRUCache(max_size=USER_ID_CACHE_SIZE)
+    stats = ImportStats()
+    next_progress = progress_interval
+
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for chunk in _read_chunks(reader, chunk_size):
+            stats.rows += len(chunk)
+
+            # 1. 解析本块中的评分行
+            parsed = []
+            for row in chunk:
+                try:
+                    title = movie_titles.get(row[movie_column]) if movie_titles is not None else row[title_column]
+                    parsed.append((row[user_column], title, float(row[score_column]) * score_scale))
+                except (KeyError, TypeError, ValueError):
+                    stats.invalid_rows += 1
+
+            # 2. 批量解析本块中未缓存的用户
+            new_openids = {
+                user_prefix + external_user for external_user, _, _ in parsed
+                if user_ids.get(user_prefix + external_user) is None
+            }
+            if new_openids:
+                for openid, user_id in db_manager.upsert_users(new_openids).items():
+                    user_ids.set(openid, user_id)
+
+            # 3. 标题对应电影ID
+            ratings = []
+            for external_user, title, score in parsed:
+                movie_id = resolver.resolve(title) if title else None
+                user_id = user_ids.get(user_prefix + external_user)
+                if movie_id is None or user_id is None:
+                    stats.unknown_movies += 1
+                    continue
+                ratings.append((user_id, movie_id, score))
+
+            # 4. 批量写入
+            if ratings:
+                result = db_manager.add_or_update_ratings(ratings)
+                stats.inserted += result['inserted']
+                stats.updated += result['updated']
+                stats.failed += result['failed']
+
+            if stats.rows >= next_progress:
+                logger.info(stats.summary())
+                next_progress += progress_interval
+
+    logger.info(f"导入完成，耗时 {stats.elapsed:.1f} 秒。{stats.summary()}")
+    return stats
+
+############################################################
+# 命令行入口
+############################################################
+def main():
+    parser = argparse.ArgumentParser(description="批量导入外部评分数据")
+    parser.add_argument('ratings', help="评分CSV文件（带表头）")
+    parser.add_argument('--movies', help="外部电影CSV文件（如MovieLens的movies.csv），评分文件只有电影ID时使用")
+    parser.add_argument('--user-column', default='userId', help="用户ID列名")
+    parser.add_argument('--movie-column', default='movieId', help="电影ID列名")
+    parser.add_argument('--title-column', default='title', help="电影标题列名")
+    parser.add_argument('--score-column', default='rating', help="评分列名")
+    parser.add_argument('--score-scale', type=float, default=1.0, help="评分换算倍数（MovieLens 5分制使用2）")
+    parser.add_argument('--user-prefix', default='import:', help="导入用户的openid前缀")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="每块读取和写入的行数")
+    parser.add_argument('--progress', type=int, default=DEFAULT_PROGRESS_INTERVAL, help="每读取多少行输出一次进度")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    movie_titles = None
+    if args.movies:
+        movie_titles = load_external_movie_titles(args.movies, args.movie_column, args.title_column)
+        logger.info(f"外部电影文件: {len(movie_titles)} 部电影")
+
+    stats = import_ratings(
+        args.ratings, movie_titles,
+        user_column=args.user_column, movie_column=args.movie_column, title_column=args.title_column,
+        score_column=args.score_column, score_scale=args.score_scale, user_prefix=args.user_prefix,
+        chunk_size=args.chunk_size, progress_interval=args.progress
+    )
+    raise SystemExit(0 if not stats.failed else 1)
+
+if __name__ == "__main__":
+    main()
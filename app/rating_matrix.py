@@ -0,0 +1,795 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 评分矩阵模块：在内存中以CSR（压缩稀疏行）格式保存用户×电影评分矩阵，供协同过滤算法直接查询
+
+############################################################
+# 导入必要的库
+############################################################
+import logging  # 日志库，用于记录矩阵加载情况
+import threading  # 线程库，用于保护全局矩阵的加载和增量更新
+import time  # 时间库，用于统计加载耗时和合并间隔
+from collections import namedtuple  # 命名元组，用于打包CSR数组
+import numpy as np  # 数值计算库，评分矩阵的数组存储
+from app import db_manager  # 数据库管理模块，提供评分数据
+from app import snapshot_store  # 按版本存储、内存映射加载的快照文件，多进程共享评分矩阵
+from app import rating_versions  # 评分版本模块，记录矩阵包含了哪些评分
+from app.config import (
+    RATING_MATRIX_COMPACT_THRESHOLD,
+    RATING_MATRIX_COMPACT_INTERVAL,
+    RATING_MATRIX_VERIFY_AFTER_COMPACT,
+    RATING_MATRIX_LOAD_CHUNK_SIZE,
+    RATING_MATRIX_SNAPSHOT_DIR,
+    SNAPSHOT_CHECK_INTERVAL
+)  # 增量日志合并、加载和快照相关配置
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+# CSR格式的三个数组，作为一个整体替换，保证读取方看到的三个数组始终匹配
+CSRArrays = namedtuple('CSRArrays', ['indptr', 'indices', 'data'])
+
+_EMPTY_COLS = np.zeros(0, dtype=np.int32)
+_EMPTY_SCORES = np.zeros(0, dtype=np.float64)
+
+# 快照中保存的数组：ID映射、CSR主矩阵，以及按列存储的主矩阵（工作进程不需要各自转置）
+_SNAPSHOT_ARRAYS = ('user_ids', 'movie_ids', 'indptr', 'indices', 'data', 'col_indptr', 'col_rows', 'col_data')
+
+############################################################
+# 评分数据加载
+############################################################
+def load_rating_arrays(chunk_size=RATING_MATRIX_LOAD_CHUNK_SIZE):
+    """
+    从ratings表流式加载全部评分，直接转换为紧凑的NumPy数组
+
+    每次只有一块（chunk_size行）评分以Python元组的形式存在，转换为数组后即释放，
+    峰值内存约为 每条评分16字节（用户ID、电影ID各4字节，评分8字节）+ 一块元组，
+    不再像fetchall()那样先在内存中保存全部评分的元组或字典
+
+    Args:
+        chunk_size (int): 每块的行数
+
+    Returns:
+        tuple: (user_ids int32数组, movie_ids int32数组, scores float64数组)
+    """
+    user_chunks, movie_chunks, score_chunks = [], [], []
+    for rows in db_manager.iter_rating_rows(chunk_size):
+        block = np.array(rows, dtype=np.float64)
+        user_chunks.append(block[:, 0].astype(np.int32))
+        movie_chunks.append(block[:, 1].astype(np.int32))
+        score_chunks.append(block[:, 2].copy())
+        del rows, block
+    if not user_chunks:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32), _EMPTY_SCORES
+    return np.concatenate(user_chunks), np.concatenate(movie_chunks), np.concatenate(score_chunks)
+
+############################################################
+# ID -> 行号/列号映射
+############################################################
+class IdIndex:
+    """
+    ID到行号（或列号）的映射
+
+    主体直接使用升序排列的ID数组（可以是内存映射数组）二分查找，不为每个ID创建字典项，
+    多个进程映射同一个评分矩阵快照时不需要各自构建一份大字典；
+    加载之后新出现的ID追加在末尾，保存在一个小字典中
+    """
+
+    def __init__(self, ids):
+        """
+        Args:
+            ids (np.ndarray): 行号（列号）到ID的映射，第i个元素为第i行的ID
+        """
+        ids = np.asarray(ids)
+        if not _strictly_increasing(ids):
+            # 不是严格升序时另外保存排序后的ID及其原行号
+            self._order = np.argsort(ids, kind='stable')
+            self._sorted = ids[self._order]
+        else:
+            self._order = None
+            self._sorted = ids
+        self._extra = {}
+
+    def get(self, key, default=None):
+        row = self._extra.get(key)
+        if row is not None:
+            return row
+        pos = int(np.searchsorted(self._sorted, key))
+        if pos < len(self._sorted) and self._sorted[pos] == key:
+            return int(self._order[pos]) if self._order is not None else pos
+        return default
+
+    def __getitem__(self, key):
+        row = self.get(key)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __setitem__(self, key, row):
+        self._extra[key] = row
+
+    def __len__(self):
+        return len(self._sorted) + len(self._extra)
+
+    def items(self):
+        """按行号遍历 (ID, 行号)"""
+        if self._order is None:
+            yield from zip(self._sorted.tolist(), range(len(self._sorted)))
+        else:
+            yield from zip(self._sorted.tolist(), self._order.tolist())
+        yield from self._extra.items()
+
+############################################################
+# 评分矩阵
+############################################################
+class RatingMatrix:
+    """
+    用户×电影评分矩阵（CSR压缩稀疏行格式 + 增量日志）
+
+    第row行对应用户user_ids[row]，第col列对应电影movie_ids[col]
+    主矩阵中第row行的评分存储在 indices[indptr[row]:indptr[row+1]]（列号，行内升序）
+    和 data[indptr[row]:indptr[row+1]]（评分）中
+
+    新增或修改的评分不直接改动主矩阵，而是记录到增量日志中：
+    发生变化的用户整行保存在增量行表里，读取时优先使用增量行；
+    增量积累到一定数量后再通过compact()一次性合并进主矩阵。
+    新出现的用户/电影追加在行号/列号的末尾，已有的行号和列号永远不会改变。
+
+    主矩阵可以通过save()发布为磁盘快照，其他进程用attach()以内存映射方式加载，
+    共享操作系统的页缓存而不是各自保存一份；增量日志只保存在各自的进程中
+    """
+
+    def __init__(self, user_ids, movie_ids, indptr, indices, data):
+        """
+        Args:
+            user_ids (np.ndarray): 行号到用户ID的映射
+            movie_ids (np.ndarray): 列号到电影ID的映射
+            indptr (np.ndarray): 每行评分在indices/data中的起止位置，长度为用户数+1
+            indices (np.ndarray): 每条评分的列号
+            data (np.ndarray): 每条评分的分数
+        """
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.base = CSRArrays(indptr, indices, data)
+        # ID到行号/列号的反向映射
+        self.user_index = IdIndex(user_ids)
+        self.movie_index = IdIndex(movie_ids)
+        self.as_of = None       # 评分数据的时间：从数据库加载时为查询开始的时间
+        self.generation = None  # 由快照加载时为快照的版本目录名
+        self.rating_version = None  # 加载时的全局评分序号：评分版本不大于它的用户，其评分都已包含在矩阵中
+
+        # 增量日志
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._log = []         # 尚未合并的评分变更 [(user_id, movie_id, score), ...]
+        self._delta_rows = {}  # 发生变化的用户的完整评分行 {row: (列号数组, 评分数组)}
+        self._delta_seq = {}   # 每个增量行最后一次变更的序号 {row: seq}
+        self._seq = 0          # 评分变更的全局递增序号
+        self.last_compacted_at = time.time()
+
+        # 按列存储的主矩阵（CSC格式），首次使用时由主矩阵转置得到，主矩阵替换后重新生成
+        self._columns = None
+
+    @classmethod
+    def from_triples(cls, user_ids, movie_ids, scores):
+        """
+        由评分三元组构建评分矩阵
+
+        Args:
+            user_ids (array-like): 每条评分的用户ID
+            movie_ids (array-like): 每条评分的电影ID
+            scores (array-like): 每条评分的分数
+
+        Returns:
+            RatingMatrix: 评分矩阵
+        """
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        # 将ID压缩为连续的行号/列号
+        row_user_ids, rows = np.unique(user_ids, return_inverse=True)
+        col_movie_ids, cols = np.unique(movie_ids, return_inverse=True)
+
+        # 按(行号, 列号)排序，得到CSR格式要求的存储顺序
+        order = np.lexsort((cols, rows))
+        indices = cols[order].astype(np.int32)
+        data = scores[order]
+
+        # indptr[row]为第row行第一条评分的位置
+        counts = np.bincount(rows, minlength=len(row_user_ids))
+        indptr = np.zeros(len(row_user_ids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+
+        return cls(row_user_ids, col_movie_ids, indptr, indices, data)
+
+    @classmethod
+    def from_db(cls):
+        """
+        从ratings表加载全部评分并构建评分矩阵
+
+        Returns:
+            RatingMatrix: 评分矩阵
+        """
+        # 查询开始之前已写入数据库的评分都包含在结果中
+        # （评分先写入数据库再更新版本，查询前读取的序号不会包含尚未写入的评分）
+        rating_version = rating_versions.current_version()
+        as_of = time.time()
+        user_ids, movie_ids, scores = load_rating_arrays()
+        matrix = cls.from_triples(user_ids, movie_ids, scores)
+        matrix.as_of = as_of
+        matrix.rating_version = rating_version
+        return matrix
+
+    def save(self, directory):
+        """
+        将评分矩阵（已包含增量日志中的变更）发布为新版本快照
+
+        Args:
+            directory (str): 快照根目录
+
+        Returns:
+            str: 新版本目录名
+        """
+        matrix = self
+        if self._delta_rows or not _strictly_increasing(self.user_ids) or \
+                not _strictly_increasing(self.movie_ids):
+            # 有增量或追加过新用户/电影时先重新构建，快照中的ID保持升序，加载方可以直接二分查找
+            matrix = RatingMatrix.from_triples(*self.to_triples())
+        base, columns = matrix.columns()
+        meta = {
+            'as_of': self.as_of if self.as_of is not None else time.time(),
+            'rating_version': self.rating_version,
+            'n_users': matrix.n_users,
+            'n_movies': matrix.n_movies,
+            'nnz': matrix.nnz,
+            'saved_at': time.time()
+        }
+        return snapshot_store.write_generation(directory, {
+            'user_ids': matrix.user_ids,
+            'movie_ids': matrix.movie_ids,
+            'indptr': base.indptr,
+            'indices': base.indices,
+            'data': base.data,
+            'col_indptr': columns.indptr,
+            'col_rows': columns.indices,
+            'col_data': columns.data
+        }, meta)
+
+    @classmethod
+    def attach(cls, directory, generation=None):
+        """
+        以内存映射方式加载评分矩阵快照，不复制数组
+
+        Args:
+            directory (str): 快照根目录
+            generation (str, optional): 版本目录名，默认为CURRENT指向的版本
+
+        Returns:
+            RatingMatrix or None: 没有可用快照时返回None
+        """
+        loaded = snapshot_store.load_generation(directory, _SNAPSHOT_ARRAYS, generation)
+        if loaded is None:
+            return None
+        arrays, meta = loaded
+        matrix = cls(arrays['user_ids'], arrays['movie_ids'], arrays['indptr'], arrays['indices'], arrays['data'])
+        matrix._columns = (matrix.base, CSRArrays(arrays['col_indptr'], arrays['col_rows'], arrays['col_data']))
+        matrix.as_of = meta['as_of']
+        matrix.rating_version = meta.get('rating_version')
+        matrix.generation = meta['generation']
+        return matrix
+
+    @property
+    def n_users(self):
+        """矩阵中的用户数（行数，包括尚未合并进主矩阵的新用户）"""
+        return len(self.user_ids)
+
+    @property
+    def n_movies(self):
+        """矩阵中的电影数（列数，包括尚未合并进主矩阵的新电影）"""
+        return len(self.movie_ids)
+
+    @property
+    def nnz(self):
+        """主矩阵中的评分总数（不含增量日志）"""
+        return len(self.base.data)
+
+    @property
+    def pending_count(self):
+        """增量日志中尚未合并的评分变更数"""
+        return len(self._log)
+
+    def row(self, row):
+        """
+        获取指定行的评分（已包含增量日志中的变更）
+
+        Args:
+            row (int): 行号
+
+        Returns:
+            tuple: (列号数组, 评分数组)，调用方不应修改返回的数组
+        """
+        delta = self._delta_rows.get(row)
+        if delta is not None:
+            return delta
+        base = self.base
+        if row >= len(base.indptr) - 1:
+            return _EMPTY_COLS, _EMPTY_SCORES
+        start, end = base.indptr[row], base.indptr[row + 1]
+        return base.indices[start:end], base.data[start:end]
+
+    def columns(self):
+        """
+        获取按列（电影）存储的主矩阵，用于快速找到评价过某部电影的所有用户
+
+        第col列的评分存储在 indices[indptr[col]:indptr[col+1]]（行号，列内升序）
+        和 data[indptr[col]:indptr[col+1]] 中。只包含主矩阵，不包含增量日志中的变更
+
+        Returns:
+            tuple: (对应的主矩阵CSRArrays, 按列存储的CSRArrays)
+        """
+        base = self.base
+        cached = self._columns
+        if cached is not None and cached[0] is base:
+            return cached
+
+        n_cols = int(base.indices.max()) + 1 if len(base.indices) else 0
+        element_rows = np.repeat(np.arange(len(base.indptr) - 1, dtype=np.int32), np.diff(base.indptr))
+        # 稳定排序保证同一列内的行号保持升序
+        order = np.argsort(base.indices, kind='stable')
+        counts = np.bincount(base.indices, minlength=n_cols)
+        indptr = np.zeros(n_cols + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        cached = (base, CSRArrays(indptr, element_rows[order], base.data[order]))
+        self._columns = cached
+        return cached
+
+    def delta_rows(self):
+        """
+        获取增量日志中发生变化的用户行的快照
+
+        Returns:
+            dict: {行号: (列号数组, 评分数组)}，调用方不应修改其中的数组
+        """
+        return dict(self._delta_rows)
+
+    def user_ratings(self, user_id):
+        """
+        获取用户的全部评分
+
+        Args:
+            user_id (int): 用户ID
+
+        Returns:
+            dict: {电影ID: 评分}，用户不在矩阵中时返回空字典
+        """
+        row = self.user_index.get(user_id)
+        if row is None:
+            return {}
+        cols, scores = self.row(row)
+        return dict(zip(self.movie_ids[cols].tolist(), scores.tolist()))
+
+    def to_triples(self):
+        """
+        导出全部评分（已包含增量日志中的变更）
+
+        Returns:
+            tuple: (user_ids, movie_ids, scores) 三个numpy数组
+        """
+        base = self.base
+        delta_rows = self.delta_rows()
+        base_rows = len(base.indptr) - 1
+        element_rows = np.repeat(np.arange(base_rows), np.diff(base.indptr))
+        # 主矩阵中已被增量行取代的行不再导出
+        keep_rows = np.ones(base_rows, dtype=bool)
+        keep_rows[[row for row in delta_rows if row < base_rows]] = False
+        keep = keep_rows[element_rows]
+
+        rows = [element_rows[keep]]
+        cols = [base.indices[keep]]
+        scores = [base.data[keep]]
+        for row, (row_cols, row_scores) in delta_rows.items():
+            rows.append(np.full(len(row_cols), row, dtype=np.int64))
+            cols.append(row_cols)
+            scores.append(row_scores)
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        return self.user_ids[rows], self.movie_ids[cols], np.concatenate(scores)
+
+    def transposed(self):
+        """
+        构建转置的评分矩阵：行为电影、列为用户，用于基于物品的协同过滤
+
+        转置矩阵中的user_ids/user_index对应电影ID，movie_ids/movie_index对应用户ID
+
+        Returns:
+            RatingMatrix: 电影×用户评分矩阵
+        """
+        user_ids, movie_ids, scores = self.to_triples()
+        return RatingMatrix.from_triples(movie_ids, user_ids, scores)
+
+    ############################################################
+    # 增量更新
+    ############################################################
+    def apply(self, user_id, movie_id, score):
+        """
+        将一条评分变更写入增量日志，立即对后续读取生效
+
+        Args:
+            user_id (int): 用户ID
+            movie_id (int): 电影ID
+            score (float or None): 新评分，None表示删除该评分
+        """
+        user_id = int(user_id)
+        movie_id = int(movie_id)
+        with self._lock:
+            row = self.user_index.get(user_id)
+            if row is None:
+                if score is None:
+                    return
+                row = len(self.user_ids)
+                self.user_ids = np.append(self.user_ids, np.int64(user_id))
+                self.user_index[user_id] = row
+
+            col = self.movie_index.get(movie_id)
+            if col is None:
+                if score is None:
+                    return
+                col = len(self.movie_ids)
+                self.movie_ids = np.append(self.movie_ids, np.int64(movie_id))
+                self.movie_index[movie_id] = col
+
+            cols, scores = self.row(row)
+            pos = int(np.searchsorted(cols, col))
+            exists = pos < len(cols) and cols[pos] == col
+            if score is None:
+                cols = np.delete(cols, pos) if exists else cols
+                scores = np.delete(scores, pos) if exists else scores
+            elif exists:
+                scores = scores.copy()
+                scores[pos] = score
+            else:
+                cols = np.insert(cols, pos, np.int32(col))
+                scores = np.insert(scores, pos, float(score))
+
+            self._seq += 1
+            self._delta_rows[row] = (cols, scores)
+            self._delta_seq[row] = self._seq
+            self._log.append((user_id, movie_id, score))
+
+    def replace_user(self, user_id, ratings):
+        """
+        用给定的评分整体替换某个用户的评分行（用于一致性校验后的修复）
+
+        Args:
+            user_id (int): 用户ID
+            ratings (dict): {电影ID: 评分}
+        """
+        current = self.user_ratings(user_id)
+        for movie_id in current:
+            if movie_id not in ratings:
+                self.apply(user_id, movie_id, None)
+        for movie_id, score in ratings.items():
+            if current.get(movie_id) != score:
+                self.apply(user_id, movie_id, score)
+
+    def compact(self):
+        """
+        将增量日志合并进主矩阵
+
+        合并期间仍可正常读取和写入，合并过程中新到达的变更会保留在增量日志中
+
+        Returns:
+            int: 本次合并的增量行数
+        """
+        with self._compact_lock:
+            with self._lock:
+                base = self.base
+                delta_rows = dict(self._delta_rows)
+                snapshot_seq = self._seq
+                snapshot_log_len = len(self._log)
+                n_rows = len(self.user_ids)
+
+            if not delta_rows:
+                self.last_compacted_at = time.time()
+                return 0
+
+            # 计算新矩阵每一行的评分数：增量行使用增量中的长度，其余沿用主矩阵
+            base_rows = len(base.indptr) - 1
+            base_lengths = np.diff(base.indptr)
+            lengths = np.zeros(n_rows, dtype=np.int64)
+            lengths[:base_rows] = base_lengths
+            changed_rows = np.fromiter(delta_rows.keys(), dtype=np.int64, count=len(delta_rows))
+            lengths[changed_rows] = [len(delta_rows[row][0]) for row in changed_rows.tolist()]
+
+            indptr = np.zeros(n_rows + 1, dtype=np.int64)
+            np.cumsum(lengths, out=indptr[1:])
+            indices = np.empty(indptr[-1], dtype=np.int32)
+            data = np.empty(indptr[-1], dtype=np.float64)
+
+            # 批量复制主矩阵中未发生变化的行
+            keep_rows = np.ones(base_rows, dtype=bool)
+            keep_rows[changed_rows[changed_rows < base_rows]] = False
+            element_rows = np.repeat(np.arange(base_rows), base_lengths)
+            keep = keep_rows[element_rows]
+            offsets = np.arange(len(base.indices)) - base.indptr[element_rows]
+            targets = indptr[element_rows[keep]] + offsets[keep]
+            indices[targets] = base.indices[keep]
+            data[targets] = base.data[keep]
+
+            # 写入增量行
+            for row, (cols, scores) in delta_rows.items():
+                indices[indptr[row]:indptr[row + 1]] = cols
+                data[indptr[row]:indptr[row + 1]] = scores
+
+            with self._lock:
+                self.base = CSRArrays(indptr, indices, data)
+                # 只保留合并开始之后又发生变化的增量行
+                self._delta_rows = {
+                    row: value for row, value in self._delta_rows.items()
+                    if self._delta_seq[row] > snapshot_seq
+                }
+                self._delta_seq = {row: self._delta_seq[row] for row in self._delta_rows}
+                self._log = self._log[snapshot_log_len:]
+            self.last_compacted_at = time.time()
+
+        logger.info(f"评分矩阵增量合并完成: 合并 {len(delta_rows)} 个用户的评分行, 主矩阵评分数 {indptr[-1]}")
+        return len(delta_rows)
+
+    def check_consistency(self):
+        """
+        与ratings表逐用户比对评分数量和评分总和，找出不一致的用户
+
+        Returns:
+            list: 评分数据不一致的用户ID列表
+        """
+        summary = db_manager.get_rating_summary_by_user()
+        mismatched = []
+        db_user_ids = set()
+        for user_id, count, total in summary:
+            user_id = int(user_id)
+            db_user_ids.add(user_id)
+            row = self.user_index.get(user_id)
+            if row is None:
+                mismatched.append(user_id)
+                continue
+            cols, scores = self.row(row)
+            if len(cols) != count or abs(float(scores.sum()) - float(total)) > 1e-6:
+                mismatched.append(user_id)
+
+        # 矩阵中有评分但数据库中已没有评分的用户（例如用户被删除）
+        for user_id, row in list(self.user_index.items()):
+            if user_id not in db_user_ids and len(self.row(row)[0]) > 0:
+                mismatched.append(user_id)
+        return mismatched
+
+def _strictly_increasing(ids):
+    return len(ids) < 2 or bool(np.all(ids[1:] > ids[:-1]))
+
+############################################################
+# 全局评分矩阵
+############################################################
+_matrix = None
+_matrix_lock = threading.Lock()
+
+# 加载矩阵期间到达的评分变更，加载完成后重放到新矩阵上
+_loading = False
+_pending_updates = []
+_pending_lock = threading.Lock()
+
+_compaction_thread = None
+
+# 多进程模式：全局矩阵由快照加载时，定期检查是否发布了新版本
+_watcher = None
+# 本进程中最近的评分变更 [(时间, 用户ID, 电影ID, 评分), ...]，切换到新版本快照时重放其中较新的部分
+_recent_updates = []
+_switch_listeners = []  # 切换到新版本快照后需要通知的回调函数
+
+def add_switch_listener(listener):
+    """
+    注册快照切换监听函数，每次切换到新版本快照后调用 listener(matrix)
+
+    Args:
+        listener (callable): 回调函数
+    """
+    _switch_listeners.append(listener)
+
+def _notify_switch_listeners(matrix):
+    for listener in list(_switch_listeners):
+        try:
+            listener(matrix)
+        except Exception as e:
+            logger.error(f"评分矩阵快照切换监听函数执行失败: {e}")
+
+def load_rating_matrix():
+    """
+    从数据库重新加载全局评分矩阵，并替换当前矩阵
+
+    新矩阵构建完成后才会替换，正在使用旧矩阵的请求不受影响；
+    加载期间到达的评分变更会在替换前重放到新矩阵上
+
+    Returns:
+        RatingMatrix: 新加载的评分矩阵
+    """
+    global _matrix, _loading
+    start_time = time.time()
+    with _pending_lock:
+        _loading = True
+        del _pending_updates[:]
+    try:
+        matrix = RatingMatrix.from_db()
+    finally:
+        with _pending_lock:
+            _loading = False
+            pending = list(_pending_updates)
+            del _pending_updates[:]
+    # 重放是幂等的：即使某条变更已包含在加载结果中，再次写入相同评分也不会改变结果
+    for user_id, movie_id, score in pending:
+        matrix.apply(user_id, movie_id, score)
+    _matrix = matrix
+    logger.info(
+        f"评分矩阵加载完成: {matrix.n_users} 个用户, {matrix.n_movies} 部电影, "
+        f"{matrix.nnz} 条评分, 耗时 {time.time() - start_time:.2f} 秒"
+    )
+    return matrix
+
+def get_rating_matrix():
+    """
+    获取全局评分矩阵，尚未加载时从数据库加载；
+    全局矩阵来自快照且发布了新版本时，切换到新版本
+
+    Returns:
+        RatingMatrix: 评分矩阵
+
+    Raises:
+        Exception: 首次加载失败时抛出异常，下次调用会重新尝试加载
+    """
+    if _matrix is None:
+        with _matrix_lock:
+            if _matrix is None:
+                load_rating_matrix()
+    watcher = _watcher
+    if watcher is not None:
+        generation = watcher.check(_matrix.generation)
+        if generation is not None:
+            _switch_generation(watcher.directory, generation)
+    return _matrix
+
+def publish_rating_matrix(directory=RATING_MATRIX_SNAPSHOT_DIR):
+    """
+    将全局评分矩阵发布为新版本快照，并把全局矩阵切换为内存映射的快照
+
+    多进程模式下由主进程在加载评分矩阵后调用：fork出的工作进程直接使用快照，
+    之后发布的新版本由工作进程在get_rating_matrix()中自行切换，不需要重启
+
+    Returns:
+        RatingMatrix: 内存映射的评分矩阵
+    """
+    matrix = get_rating_matrix()
+    generation = matrix.save(directory)
+    logger.info(f"评分矩阵快照已发布: {generation}")
+    return attach_rating_matrix(directory, generation)
+
+def attach_rating_matrix(directory=RATING_MATRIX_SNAPSHOT_DIR, generation=None):
+    """
+    以内存映射方式加载评分矩阵快照作为全局矩阵，此后定期检查是否发布了新版本
+
+    Returns:
+        RatingMatrix or None: 没有可用快照时返回None（全局矩阵不变）
+    """
+    global _watcher
+    matrix = _switch_generation(directory, generation)
+    if matrix is not None:
+        _watcher = snapshot_store.GenerationWatcher(directory, SNAPSHOT_CHECK_INTERVAL)
+    return matrix
+
+def _switch_generation(directory, generation):
+    """
+    切换到指定版本的快照
+
+    快照包含as_of之前写入数据库的全部评分；本进程中as_of之后的评分变更重放到新矩阵上，
+    更早的变更已包含在快照中，从最近变更列表中移除
+
+    Returns:
+        RatingMatrix or None: 加载失败或没有可用快照时返回None
+    """
+    global _matrix
+    with _matrix_lock:
+        current = _matrix
+        if current is not None and generation is not None and current.generation == generation:
+            return current
+        try:
+            matrix = RatingMatrix.attach(directory, generation)
+        except Exception as e:
+            logger.error(f"加载评分矩阵快照失败 ({directory} {generation}): {e}")
+            return None
+        if matrix is None:
+            return None
+        # 在锁内重放并替换，重放之后到达的评分变更一定应用在新矩阵上
+        with _pending_lock:
+            _recent_updates[:] = [update for update in _recent_updates if update[0] >= matrix.as_of]
+            for _, user_id, movie_id, score in _recent_updates:
+                matrix.apply(user_id, movie_id, score)
+            replayed = len(_recent_updates)
+            _matrix = matrix
+    logger.info(
+        f"评分矩阵切换到快照 {matrix.generation}: {matrix.n_users} 个用户, {matrix.nnz} 条评分, "
+        f"重放 {replayed} 条本进程的评分变更"
+    )
+    _notify_switch_listeners(matrix)
+    return matrix
+
+def apply_rating(user_id, movie_id, score):
+    """
+    评分变更监听函数：将新评分立即应用到全局评分矩阵
+
+    由db_manager在评分写入数据库后调用；增量日志积累到阈值或距上次合并超过
+    指定时间时，在后台线程中合并进主矩阵
+
+    Args:
+        user_id (int): 用户ID
+        movie_id (int): 电影ID
+        score (float or None): 新评分，None表示删除该评分
+    """
+    with _pending_lock:
+        if _loading:
+            _pending_updates.append((user_id, movie_id, score))
+        if _watcher is not None:
+            _recent_updates.append((time.time(), user_id, movie_id, score))
+        matrix = _matrix
+    if matrix is None:
+        return
+
+    matrix.apply(user_id, movie_id, score)
+    if matrix.generation is None and (
+            matrix.pending_count >= RATING_MATRIX_COMPACT_THRESHOLD or
+            time.time() - matrix.last_compacted_at >= RATING_MATRIX_COMPACT_INTERVAL):
+        _start_compaction(matrix)
+
+def verify_rating_matrix(repair=True):
+    """
+    校验全局评分矩阵与ratings表是否一致
+
+    Args:
+        repair (bool): 是否从数据库重新读取不一致用户的评分并修复
+
+    Returns:
+        list: 不一致的用户ID列表
+    """
+    matrix = get_rating_matrix()
+    mismatched = matrix.check_consistency()
+    if not mismatched:
+        logger.info("评分矩阵一致性校验通过")
+        return mismatched
+
+    logger.warning(f"评分矩阵与ratings表不一致的用户数: {len(mismatched)}")
+    if repair:
+        for user_id in mismatched:
+            ratings = db_manager.get_user_ratings(user_id)
+            matrix.replace_user(user_id, {row['movie_id']: float(row['score']) for row in ratings})
+        logger.info(f"已修复 {len(mismatched)} 个用户的评分行")
+    return mismatched
+
+def _start_compaction(matrix):
+    """在后台线程中合并增量日志，同一时间最多只有一个合并线程"""
+    global _compaction_thread
+    with _pending_lock:
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return
+        _compaction_thread = threading.Thread(
+            target=_compact_in_background, args=(matrix,), name='rating-matrix-compaction', daemon=True
+        )
+        _compaction_thread.start()
+
+def _compact_in_background(matrix):
+    try:
+        matrix.compact()
+        if RATING_MATRIX_VERIFY_AFTER_COMPACT and matrix is _matrix:
+            verify_rating_matrix(repair=True)
+    except Exception as e:
+        logger.error(f"评分矩阵增量合并失败: {e}")
+
+# 评分写入数据库后立即同步到内存评分矩阵
+db_manager.add_rating_listener(apply_rating)
@@ -0,0 +1,165 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 评分版本模块：记录每个用户最近一次评分的全局序号，让所有工作进程都能发现其他进程处理的评分
+#
+# 多进程部署时，评分只会同步到处理该请求的工作进程的评分矩阵、推荐缓存和邻居索引脏用户表，
+# 其他工作进程要等主进程发布新版本快照后才能看到。每次评分把全局序号加一，并记为该用户的版本：
+#   - 推荐缓存保存计算时的用户版本，版本变化后不再使用缓存的结果
+#   - 评分矩阵、邻居索引记录构建时的全局序号，用户版本大于该序号说明其评分不在其中
+#   - 主进程按 当前序号 - 邻居索引构建时的序号 判断累计的新评分数，达到阈值时重建索引
+# 多进程部署时版本存储使用所有工作进程共享的SQLite文件
+
+import os
+import logging
+import sqlite3
+import threading
+from app import db_manager
+from app.config import RATING_VERSION_CONFIG
+
+logger = logging.getLogger(__name__)
+
+############################################################
+# 版本存储
+# 每个存储提供：
+#   bump(user_id) -> 全局序号加一，记为该用户的版本并返回
+#   get(user_id)  -> 用户的版本，没有评分过的用户为0
+#   current()     -> 当前的全局序号（即累计的评分次数）
+############################################################
+class MemoryVersionStore:
+    """
+    进程内版本存储，只在单进程（'dev'模式）下能看到所有评分
+    """
+
+    def __init__(self):
+        self._versions = {}  # 用户ID -> 版本
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def bump(self, user_id):
+        with self._lock:
+            self._seq += 1
+            self._versions[user_id] = self._seq
+            return self._seq
+
+    def get(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def current(self):
+        return self._seq
+
+class SQLiteVersionStore:
+    """
+    多进程共享的版本存储：所有工作进程读写同一个SQLite数据库文件
+
+    全局序号即表中最大的版本号（版本列上有索引），每次评分只需一条语句，不必开启多语句的写事务
+    """
+
+    def __init__(self, path, busy_timeout=1.0):
+        """
+        Args:
+            path (str): 数据库文件路径
+            busy_timeout (float): 等待其他进程释放写锁的最长时间（秒）
+        """
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # 每个线程一个连接；fork出的子进程不使用从父进程继承的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS rating_versions ("
+            "  user_id INTEGER PRIMARY KEY,"
+            "  version INTEGER NOT NULL"
+            ")"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_rating_versions_version ON rating_versions (version)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def bump(self, user_id):
+        # 单条语句在SQLite的写锁内执行，多个进程同时评分时得到不同的序号
+        return self._connection().execute(
+            "INSERT INTO rating_versions (user_id, version) "
+            "VALUES (?, (SELECT IFNULL(MAX(version), 0) + 1 FROM rating_versions)) "
+            "ON CONFLICT (user_id) DO UPDATE SET version = excluded.version "
+            "RETURNING version", (user_id,)
+        ).fetchone()[0]
+
+    def get(self, user_id):
+        row = self._connection().execute(
+            "SELECT version FROM rating_versions WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row is not None else 0
+
+    def current(self):
+        return self._connection().execute("SELECT IFNULL(MAX(version), 0) FROM rating_versions").fetchone()[0]
+
+def create_store(config):
+    """
+    按配置创建版本存储
+
+    Args:
+        config (dict): RATING_VERSION_CONFIG格式的配置
+
+    Returns:
+        MemoryVersionStore or SQLiteVersionStore: 版本存储
+    """
+    store = config.get('store', 'memory')
+    if store == 'memory':
+        return MemoryVersionStore()
+    if store == 'sqlite':
+        return SQLiteVersionStore(config['sqlite_path'])
+    raise ValueError(f"未知的评分版本存储: {store}")
+
+############################################################
+# 全局版本存储
+# 查询失败时返回None，调用方按"版本未知"处理（例如直接查询数据库、不使用缓存）
+############################################################
+store = create_store(RATING_VERSION_CONFIG)
+
+def get_version(user_id):
+    """
+    获取用户的评分版本
+
+    Returns:
+        int or None: 版本号，没有评分过的用户为0；查询失败时返回None
+    """
+    try:
+        return store.get(int(user_id))
+    except Exception as e:
+        logger.error(f"查询用户 {user_id} 的评分版本失败: {e}")
+        return None
+
+def current_version():
+    """
+    获取当前的全局评分序号
+
+    Returns:
+        int or None: 全局序号；查询失败时返回None
+    """
+    try:
+        return store.current()
+    except Exception as e:
+        logger.error(f"查询全局评分序号失败: {e}")
+        return None
+
+def on_rating_changed(user_id, movie_id, score):
+    """
+    评分变更监听函数：更新用户的评分版本，使其他工作进程发现这次评分
+    """
+    store.bump(int(user_id))
+
+# 评分写入数据库后更新用户的评分版本（出错时由db_manager记录日志，不影响评分结果）
+db_manager.add_rating_listener(on_rating_changed)
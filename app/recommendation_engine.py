@@ -9,8 +9,25 @@
 import logging  # 日志库，用于记录算法执行情况
 import random   # 随机库，用于增加推荐结果多样性
 import math     # 数学库，用于各种数学计算
+import time     # 时间库，用于统计各阶段耗时
+import threading  # 线程库，用于保护缓存失效计数
+import numpy as np  # 数值计算库，用于基于物品的协同过滤中的批量累加
 from app import db_manager  # 数据库管理模块，提供数据访问功能
-from app.config import SIMILAR_USERS_COUNT, MIN_COMMON_RATINGS  # 推荐算法配置参数
+from app import rating_matrix  # 内存评分矩阵模块，提供所有用户的评分数据
+from app import rating_versions  # 评分版本模块，判断用户的评分是否都已包含在评分矩阵中
+from app import similarity  # 相似度计算模块，批量计算用户相似度
+from app import neighbor_index  # 邻居索引模块，提供离线预计算的相似用户
+from app import item_similarity  # 电影相似度模块，提供离线预计算的相似电影
+from app import movie_catalog  # 电影目录模块，提供按豆瓣评分排序的电影
+from app import metrics  # 性能指标模块，统计推荐计算各阶段的耗时
+from app.utils import LRUCache, SingleFlight  # LRU缓存，用于缓存推荐结果；请求合并
+from app.config import SIMILAR_USERS_COUNT, MIN_COMMON_RATINGS, RECOMMENDATION_ALGORITHM  # 推荐算法配置参数
+from app.config import (
+    RECOMMENDATION_CACHE_SIZE,
+    RECOMMENDATION_CACHE_TTL,
+    RECOMMENDATION_CACHE_CLEAR_ON_REBUILD
+)  # 推荐结果缓存配置
+from app.config import SINGLE_FLIGHT_CONFIG  # 同一用户并发推荐请求的合并配置
 
 ############################################################
 # 配置日志系统
@@ -19,9 +36,103 @@ from app.config import SIMILAR_USERS_COUNT, MIN_COMMON_RATINGS  # 推荐算法
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
 
+############################################################
+# 性能指标
+############################################################
+STAGE_SECONDS = metrics.histogram(
+    'recommendation_stage_seconds', '推荐计算各阶段的耗时（秒）', labels=('stage',)
+)
+CACHE_REQUESTS = metrics.counter(
+    'recommendation_cache_requests_total',
+    '推荐结果缓存的查询次数，按结果分类：hit 命中，miss 未命中，stale 用户在其他工作进程中评过分、缓存已失效',
+    labels=('result',)
+)
+
+############################################################
+# 目标用户的评分
+############################################################
+@STAGE_SECONDS.timed('target_ratings')
+def _target_user_ratings(matrix, target_user_id):
+    """
+    获取目标用户的最新评分
+
+    多进程模式下，其他工作进程处理的评分要等主进程发布新版本快照后才会进入本进程的评分矩阵。
+    用户的评分版本大于矩阵加载时的全局序号时，说明矩阵可能缺少该用户最近的评分，
+    从数据库读取该用户的评分（按user_id的索引查询）覆盖到矩阵的评分行上，
+    刚评过的电影不会被推荐，新用户也不会被误判为没有评分记录
+
+    Args:
+        matrix (RatingMatrix): 评分矩阵
+        target_user_id (int): 目标用户ID
+
+    Returns:
+        tuple: (评分字典 {电影ID: 评分}, 是否与评分矩阵中的评分行一致)
+    """
+    ratings = matrix.user_ratings(target_user_id)
+    version = rating_versions.get_version(target_user_id)
+    if version is not None and matrix.rating_version is not None and version <= matrix.rating_version:
+        return ratings, True
+    merged = dict(ratings)
+    for row in db_manager.get_user_ratings(target_user_id):
+        merged[int(row['movie_id'])] = float(row['score'])
+    return merged, merged == ratings
+
 ############################################################
 # 基于用户的协同过滤推荐算法
 ############################################################
+@STAGE_SECONDS.timed('user_cf.neighbors_index')
+def _indexed_neighbors(matrix, target_user_id):
+    """
+    从邻居索引中查询目标用户的邻居
+
+    Returns:
+        list or None: [(邻居行号, 相似度), ...]；索引中没有可用结果时返回None
+    """
+    indexed = neighbor_index.get_neighbors(target_user_id)
+    if indexed is None:
+        return None
+    # 索引中保存的是用户ID，转换为评分矩阵的行号
+    return [
+        (matrix.user_index[user_id], user_similarity)
+        for user_id, user_similarity in indexed
+        if user_id in matrix.user_index
+    ]
+
+@STAGE_SECONDS.timed('user_cf.neighbors_compute')
+def _compute_neighbors(matrix, target_user_id, target_ratings=None):
+    """
+    实时计算目标用户的邻居
+
+    一次批量计算目标用户与所有其他用户的相似度：差异值area = Σ(评分差)^2 / 共同评分电影数，
+    相似度 = 1/(1+area)；共同评分电影数少于MIN_COMMON_RATINGS的用户已被排除，
+    再按相似度从大到小排序，取前SIMILAR_USERS_COUNT个
+
+    Args:
+        target_ratings (dict, optional): 与评分矩阵中的评分行不一致时，目标用户的最新评分
+
+    Returns:
+        list: [(邻居行号, 相似度), ...]
+    """
+    if target_ratings is None:
+        target_row = matrix.user_index[target_user_id]
+        rows, similarities, _ = similarity.user_similarities(matrix, target_row, MIN_COMMON_RATINGS)
+    else:
+        # 矩阵中还没有的电影不会有其他用户的评分，不参与比较
+        pairs = sorted(
+            (matrix.movie_index[movie_id], score)
+            for movie_id, score in target_ratings.items()
+            if movie_id in matrix.movie_index
+        )
+        target_cols = np.array([col for col, _ in pairs], dtype=np.int64)
+        target_scores = np.array([score for _, score in pairs], dtype=np.float64)
+        rows, similarities, _ = similarity.ratings_similarities(
+            matrix, target_cols, target_scores, MIN_COMMON_RATINGS,
+            exclude_row=matrix.user_index.get(target_user_id)
+        )
+    neighbor_rows, neighbor_similarities = similarity.top_neighbors(rows, similarities, SIMILAR_USERS_COUNT)
+    return list(zip(neighbor_rows.tolist(), neighbor_similarities.tolist()))
+
+@STAGE_SECONDS.timed('user_cf')
 def get_user_cf_recommendations(target_user_id, num_recommendations=5):
     """
     基于用户的协同过滤推荐算法 (User-CF)
@@ -40,93 +151,24 @@ def get_user_cf_recommendations(target_user_id, num_recommendations=5):
     try:
         logger.info(f"为用户 {target_user_id} 生成协同过滤推荐")
         
-        # 步骤1: 获取目标用户的评分记录
-        # 返回格式: [{'movie_id': 电影ID, 'score': 评分}, ...]
-        target_user_ratings = db_manager.get_user_ratings(target_user_id)
+        # 步骤1: 获取内存中的评分矩阵（启动时加载一次，新评分通过增量日志实时更新）
+        with STAGE_SECONDS.time('user_cf.user_ratings'):
+            matrix = rating_matrix.get_rating_matrix()
+            
+            # 步骤2: 获取目标用户的评分记录，格式: {movie_id: score}
+            target_user_ratings_dict, in_matrix = _target_user_ratings(matrix, target_user_id)
         
         # 如果用户没有任何评分记录，无法使用协同过滤
-        if not target_user_ratings:
+        if not target_user_ratings_dict:
             logger.info(f"用户 {target_user_id} 没有评分记录，无法使用协同过滤")
             return []
         
-        # 将目标用户评分转换为字典形式 {movie_id: score}，便于后续O(1)时间复杂度查找
-        target_user_ratings_dict = {rating['movie_id']: rating['score'] for rating in target_user_ratings}
-        
-        # 步骤2: 获取所有用户的评分记录
-        # 返回格式: {user_id1: [{'movie_id': 电影ID, 'score': 评分}, ...], user_id2: [...], ...}
-        all_user_ratings = db_manager.get_all_user_ratings()
-        
-        # 步骤3: 计算用户相似度（核心步骤）
-        # 用字典存储每个用户与目标用户的相似度和其他信息
-        user_similarity = {}
-        
-        # 遍历所有其他用户，计算与目标用户的相似度
-        for other_user_id, other_user_ratings in all_user_ratings.items():
-            # 排除目标用户自己
-            try:
-                if int(other_user_id) == target_user_id:
-                    continue
-            except (ValueError, TypeError):
-                logger.warning(f"无效的用户ID: {other_user_id}")
-                continue
-            
-            # 验证评分数据
-            if not other_user_ratings or not isinstance(other_user_ratings, list):
-                continue
-            
-            # 将其他用户评分也转换为字典形式，便于查找
-            other_user_ratings_dict = {rating['movie_id']: rating['score'] for rating in other_user_ratings}
-            
-            # 找出两个用户共同评分的电影（两个集合的交集）
-            common_movies = set(target_user_ratings_dict.keys()) & set(other_user_ratings_dict.keys())
-            
-            # 如果共同评分电影太少，视为不相似，跳过
-            # MIN_COMMON_RATINGS参数控制最小共同评分数量，太少可能导致相似度不可靠
-            if len(common_movies) < MIN_COMMON_RATINGS:
-                continue
-            
-            # 计算基于评分差平方的相似度
-            # 论文算法：差异值area = Σ(score_target_user_i - score_other_user_i)^2 / num_common_movies
-            # 计算所有共同评分电影的评分差的平方和
-            sum_squared_diff = 0
-            for movie_id in common_movies:
-                target_score = target_user_ratings_dict[movie_id]  # 目标用户对电影的评分
-                other_score = other_user_ratings_dict[movie_id]    # 其他用户对电影的评分
-                squared_diff = (target_score - other_score) ** 2   # 评分差的平方
-                sum_squared_diff += squared_diff
-            
-            # 计算差异值area (越小越相似)
-            # 除以共同电影数量是为了归一化，使得评分数量不影响相似度
-            area = sum_squared_diff / len(common_movies)
-            
-            # 考虑不重合电影数量的影响（论文4.3.2节）
-            # 计算各自独有的电影数量，可选择用于调整相似度
-            target_only_count = len(target_user_ratings_dict) - len(common_movies)
-            other_only_count = len(other_user_ratings_dict) - len(common_movies)
-            
-            # 调整差异值（可以根据需要调整公式，当前代码默认不启用）
-            # area = area * (1 + 0.1 * (target_only_count + other_only_count))
-            
-            # 转换差异值为相似度
-            # 因为是差异值（越小表示越相似），使用1/(1+area)转换为相似度（越大越相似）
-            # 范围为(0,1]，完全相同的用户相似度为1
-            similarity = 1 / (1 + area)
-            
-            # 存储用户相似度及相关信息
-            user_similarity[other_user_id] = {
-                'similarity': similarity,                # 相似度
-                'common_movies': len(common_movies),     # 共同评分电影数
-                'area': area,                            # 原始差异值
-                'ratings': other_user_ratings_dict       # 该用户的所有评分字典
-            }
-        
-        # 步骤4: 选取Top-N个最相似的邻居用户
-        # 按相似度从大到小排序，取前SIMILAR_USERS_COUNT个
-        neighbors = sorted(
-            user_similarity.items(),
-            key=lambda x: x[1]['similarity'], 
-            reverse=True
-        )[:SIMILAR_USERS_COUNT]
+        # 步骤3/4: 找出Top-N个最相似的邻居用户
+        # 优先查询离线预计算的邻居索引；索引不可用、用户是新用户或索引构建后评分有变化时实时计算
+        # 评分矩阵中还没有该用户最近的评分时，按从数据库读取的最新评分实时计算
+        neighbors = _indexed_neighbors(matrix, target_user_id) if in_matrix else None
+        if neighbors is None:
+            neighbors = _compute_neighbors(matrix, target_user_id, None if in_matrix else target_user_ratings_dict)
         
         logger.info(f"找到 {len(neighbors)} 个相似用户作为邻居")
         
@@ -135,20 +177,21 @@ def get_user_cf_recommendations(target_user_id, num_recommendations=5):
             logger.info(f"未找到足够相似的用户，无法使用协同过滤")
             return []
         
-        # 步骤5: 获取目标用户已评分电影列表，避免推荐已看过的电影
-        rated_movie_ids = db_manager.get_movies_rated_by_user(target_user_id)
+        # 步骤5: 目标用户已评分电影集合，避免推荐已看过的电影
+        scoring_start = time.perf_counter()
+        rated_movie_ids = set(target_user_ratings_dict)
         
         # 步骤6: 生成候选电影及其预测评分
         # 用字典存储候选电影及其预测评分信息
         candidate_movies = {}
         
         # 遍历所有邻居用户，收集他们高分评价的电影
-        for user_id, user_data in neighbors:
-            neighbor_ratings = user_data['ratings']  # 邻居用户的所有评分
-            similarity = user_data['similarity']     # 与目标用户的相似度
+        for row, user_similarity in neighbors:
+            neighbor_cols, neighbor_scores = matrix.row(row)  # 邻居用户的所有评分
+            neighbor_movie_ids = matrix.movie_ids[neighbor_cols].tolist()
             
             # 遍历邻居用户的所有评分
-            for movie_id, score in neighbor_ratings.items():
+            for movie_id, score in zip(neighbor_movie_ids, neighbor_scores.tolist()):
                 # 排除目标用户已评分的电影
                 if movie_id in rated_movie_ids:
                     continue
@@ -163,13 +206,13 @@ def get_user_cf_recommendations(target_user_id, num_recommendations=5):
                 if movie_id not in candidate_movies:
                     # 第一次遇到这部电影，初始化记录
                     candidate_movies[movie_id] = {
-                        'weighted_sum': score * similarity,  # 评分与相似度的加权和
-                        'similarity_sum': similarity          # 相似度之和，用于归一化
+                        'weighted_sum': score * user_similarity,  # 评分与相似度的加权和
+                        'similarity_sum': user_similarity          # 相似度之和，用于归一化
                     }
                 else:
                     # 已经遇到过这部电影，累加数值
-                    candidate_movies[movie_id]['weighted_sum'] += score * similarity
-                    candidate_movies[movie_id]['similarity_sum'] += similarity
+                    candidate_movies[movie_id]['weighted_sum'] += score * user_similarity
+                    candidate_movies[movie_id]['similarity_sum'] += user_similarity
         
         # 步骤7: 计算最终预测评分并排序
         # 遍历所有候选电影，计算归一化的预测评分
@@ -190,6 +233,7 @@ def get_user_cf_recommendations(target_user_id, num_recommendations=5):
         
         # 提取电影ID列表
         recommended_movie_ids = [movie_id for movie_id, _ in recommended_movies]
+        STAGE_SECONDS.observe(time.perf_counter() - scoring_start, 'user_cf.scoring')
         
         logger.info(f"协同过滤推荐生成的电影数量: {len(recommended_movie_ids)}")
         return recommended_movie_ids
@@ -198,9 +242,76 @@ def get_user_cf_recommendations(target_user_id, num_recommendations=5):
         logger.error(f"协同过滤推荐算法出错: {e}")
         return []
 
+############################################################
+# 基于物品的协同过滤推荐算法
+############################################################
+@STAGE_SECONDS.timed('item_cf')
+def get_item_cf_recommendations(target_user_id, num_recommendations=5):
+    """
+    基于物品的协同过滤推荐算法 (Item-CF)
+    
+    算法核心思想：
+    1. 离线计算每部电影最相似的Top-K部电影（电影相似度表）
+    2. 用户评价过的每部电影，按相似度把用户的评分"传递"给它的相似电影
+    3. 推荐预测评分最高、且用户尚未看过的电影
+    
+    与User-CF相比，请求时不需要与所有用户比较，只需查询用户评价过的电影的相似电影
+    
+    Args:
+        target_user_id (int): 目标用户ID，即要给谁推荐
+        num_recommendations (int): 推荐电影数量
+        
+    Returns:
+        list: 推荐电影ID列表，按预测评分从高到低排序
+    """
+    try:
+        logger.info(f"为用户 {target_user_id} 生成基于物品的协同过滤推荐")
+        
+        # 步骤1: 获取目标用户的评分记录，格式: {movie_id: score}
+        target_user_ratings_dict, _ = _target_user_ratings(rating_matrix.get_rating_matrix(), target_user_id)
+        if not target_user_ratings_dict:
+            logger.info(f"用户 {target_user_id} 没有评分记录，无法使用协同过滤")
+            return []
+        rated_movie_ids = np.fromiter(target_user_ratings_dict.keys(), dtype=np.int64)
+        rated_scores = np.fromiter(target_user_ratings_dict.values(), dtype=np.float64)
+        
+        # 步骤2: 查询用户评价过的每部电影的Top-K相似电影
+        with STAGE_SECONDS.time('item_cf.lookup'):
+            table = item_similarity.get_item_similarity()
+            found, neighbor_ids, neighbor_similarities = table.lookup_many(rated_movie_ids)
+        scoring_start = time.perf_counter()
+        # 每个相似电影对应的"来源评分"，即用户对与它相似的那部电影的评分
+        source_scores = np.broadcast_to(rated_scores[found][:, None], neighbor_ids.shape)
+        
+        # 步骤3: 排除空位和用户已评分的电影
+        valid = (neighbor_ids >= 0) & ~np.isin(neighbor_ids, rated_movie_ids)
+        candidate_ids, candidate_pos = np.unique(neighbor_ids[valid], return_inverse=True)
+        if len(candidate_ids) == 0:
+            logger.info(f"用户 {target_user_id} 评价过的电影没有可推荐的相似电影")
+            return []
+        
+        # 步骤4: 计算预测评分 = Σ(相似度 * 来源评分) / Σ相似度
+        weights = neighbor_similarities[valid]
+        weighted_sum = np.bincount(candidate_pos, weights=weights * source_scores[valid])
+        similarity_sum = np.bincount(candidate_pos, weights=weights)
+        predicted_scores = weighted_sum / similarity_sum
+        
+        # 步骤5: 按预测评分排序，预测评分相同时相似度之和大（证据更多）的在前
+        order = np.lexsort((-similarity_sum, -predicted_scores))[:num_recommendations]
+        recommended_movie_ids = candidate_ids[order].tolist()
+        STAGE_SECONDS.observe(time.perf_counter() - scoring_start, 'item_cf.scoring')
+        
+        logger.info(f"基于物品的协同过滤推荐生成的电影数量: {len(recommended_movie_ids)}")
+        return recommended_movie_ids
+    
+    except Exception as e:
+        logger.error(f"基于物品的协同过滤推荐算法出错: {e}")
+        return []
+
 ############################################################
 # 基于内容的推荐算法（冷启动解决方案）
 ############################################################
+@STAGE_SECONDS.timed('content_based')
 def get_content_based_recommendations(target_user_id, num_recommendations=5):
     """
     基于内容的电影推荐算法（用于冷启动或补充推荐）
@@ -225,8 +336,8 @@ def get_content_based_recommendations(target_user_id, num_recommendations=5):
         rated_movie_ids = db_manager.get_movies_rated_by_user(target_user_id)
         
         # 步骤2: 获取高评分电影作为候选（排除用户已评分的）
-        # 从数据库中获取按豆瓣评分排序的电影（最多100部）
-        candidate_movies = db_manager.get_movies_for_content_based_recommendation(
+        # 从电影目录中获取按豆瓣评分排序的电影（最多100部）
+        candidate_movies = movie_catalog.get_top_rated_movies(
             exclude_movie_ids=rated_movie_ids,
             limit=100  # 选取前100部高分电影作为候选池
         )
@@ -266,62 +377,191 @@ def get_content_based_recommendations(target_user_id, num_recommendations=5):
 ############################################################
 # 综合推荐策略
 ############################################################
+# 可通过配置RECOMMENDATION_ALGORITHM选择的协同过滤算法
+CF_ALGORITHMS = {
+    'user_cf': get_user_cf_recommendations,
+    'item_cf': get_item_cf_recommendations
+}
+
+# 推荐结果缓存：{user_id: (推荐数量, 协同过滤推荐的电影ID列表, 计算时的用户评分版本)}
+# 只缓存协同过滤的结果；不足的部分由基于内容的推荐（随机选择）在每次请求时补充，不被缓存固定下来
+# 用户评分后该用户的缓存立即失效；其他工作进程处理的评分通过共享的评分版本发现，版本变化的缓存不再使用；
+# 评分矩阵切换到新版本快照、邻居索引或电影相似度表重建后可选择清空全部缓存
+_recommendation_cache = LRUCache(max_size=RECOMMENDATION_CACHE_SIZE, ttl=RECOMMENDATION_CACHE_TTL)
+# 缓存失效计数：计算推荐期间发生过失效时，计算结果可能基于旧数据，不写入缓存
+_invalidation_count = 0
+_invalidation_lock = threading.Lock()
+# 同一用户的并发推荐请求只计算一次（结果已由推荐结果缓存保存，这里不再保留）
+_recommendation_flight = SingleFlight(
+    max_waiters=SINGLE_FLIGHT_CONFIG['max_waiters'],
+    wait_timeout=SINGLE_FLIGHT_CONFIG['wait_timeout']
+)
+
 def generate_recommendations(target_user_id, num_recommendations=5):
     """
-    综合推荐函数，整合不同推荐策略的结果
-    
-    推荐流程：
-    1. 优先使用协同过滤算法
-    2. 如果协同过滤结果不足，用基于内容的推荐补充
-    3. 如遇到异常，回退到基于内容的推荐
+    综合推荐函数，优先使用缓存的协同过滤结果
+
+    用户自上次推荐以来没有新的评分（在任何工作进程中）时，协同过滤结果不会变化，直接使用缓存，
+    只有缓存未命中时才重新计算；同一用户同时发出的多个请求共享一次计算。
+    协同过滤结果不足时每次都用基于内容的推荐补充
+
+    Args:
+        target_user_id (int): 目标用户ID
+        num_recommendations (int): 推荐电影数量
+
+    Returns:
+        list: 综合推荐的电影ID列表
+    """
+    cached = _recommendation_cache.get(target_user_id)
+    if cached is not None and cached[0] >= num_recommendations:
+        # 用户在其他工作进程中评过分时版本会变化；版本查询失败时仍使用缓存
+        version = rating_versions.get_version(target_user_id)
+        if version is None or version == cached[2]:
+            CACHE_REQUESTS.inc('hit')
+            logger.info(f"用户 {target_user_id} 的推荐结果命中缓存")
+            return _fill_recommendations(target_user_id, cached[1], num_recommendations)
+        CACHE_REQUESTS.inc('stale')
+        # 正在进行的计算同样可能基于评分前的数据，不再等待它；删除缓存后，之后的请求共享新的计算
+        _recommendation_cache.delete(target_user_id)
+        _recommendation_flight.forget(target_user_id)
+    else:
+        CACHE_REQUESTS.inc('miss')
+
+    count, recommendations = _recommendation_flight.do(
+        target_user_id, _compute_and_cache_recommendations, target_user_id, num_recommendations
+    )
+    if count < num_recommendations:
+        # 共享的计算请求的推荐数量较少，单独计算
+        count, recommendations = _compute_and_cache_recommendations(target_user_id, num_recommendations)
+    return _fill_recommendations(target_user_id, recommendations, num_recommendations)
+
+def _compute_and_cache_recommendations(target_user_id, num_recommendations):
+    """计算协同过滤推荐并写入缓存，返回 (推荐数量, 协同过滤推荐的电影ID列表)"""
+    invalidation_count = _invalidation_count
+    # 计算之前读取版本：计算期间发生的评分会使版本变化，缓存的结果下次不会被使用
+    version = rating_versions.get_version(target_user_id)
+    recommendations = _compute_cf_recommendations(target_user_id, num_recommendations)
+    # 推荐失败（空列表）不缓存，下次请求重新尝试
+    if recommendations and invalidation_count == _invalidation_count:
+        _recommendation_cache.set(target_user_id, (num_recommendations, list(recommendations), version))
+    return num_recommendations, recommendations
+
+def _bump_invalidation_count():
+    # 多个线程同时评分时 += 不是原子操作，可能少计一次失效，使计算期间失效的结果仍被缓存
+    global _invalidation_count
+    with _invalidation_lock:
+        _invalidation_count += 1
+
+def invalidate_recommendations(user_id, movie_id=None, score=None):
+    """
+    使用户缓存的推荐结果失效（作为评分监听函数，在用户评分后调用）
+
+    Args:
+        user_id (int): 用户ID
+    """
+    _bump_invalidation_count()
+    _recommendation_cache.delete(user_id)
+    # 正在进行的计算基于评分前的数据，之后的请求不再等待它
+    _recommendation_flight.forget(user_id)
+
+def clear_recommendation_cache(*args):
+    """清空全部缓存的推荐结果（作为索引重建、评分矩阵快照切换的监听函数调用）"""
+    _bump_invalidation_count()
+    _recommendation_cache.clear()
+    _recommendation_flight.clear()
+    logger.info("推荐结果缓存已清空")
+
+def get_recommendation_cache_stats():
+    """
+    获取推荐结果缓存的统计信息，用于评估缓存容量
+
+    Returns:
+        dict: 命中/未命中/过期/淘汰次数、命中率、当前条目数和容量
+    """
+    return _recommendation_cache.stats()
+
+def get_recommendation_flight_stats():
+    """
+    获取同一用户并发推荐请求合并的统计信息
+
+    Returns:
+        dict: 执行、共享、超出上限和等待超时次数，以及正在进行的计算数
+    """
+    return _recommendation_flight.stats()
+
+def _compute_cf_recommendations(target_user_id, num_recommendations=5):
+    """
+    协同过滤推荐（由RECOMMENDATION_ALGORITHM选择基于用户或基于物品），结果写入推荐缓存
     
     Args:
         target_user_id (int): 目标用户ID
         num_recommendations (int): 推荐电影数量
         
     Returns:
-        list: 综合推荐的电影ID列表
+        list: 推荐电影ID列表，可能少于num_recommendations；出错时返回空列表
     """
     try:
         logger.info(f"为用户 {target_user_id} 生成综合推荐")
         
-        # 步骤1: 尝试使用协同过滤生成推荐
-        cf_recommendations = get_user_cf_recommendations(target_user_id, num_recommendations)
-        
-        # 步骤2: 判断协同过滤结果是否足够
-        # 如果协同过滤推荐数量足够，直接返回
-        if len(cf_recommendations) >= num_recommendations:
-            return cf_recommendations[:num_recommendations]
-        
-        # 步骤3: 如果协同过滤推荐不足，使用基于内容的推荐补充
-        # 计算还需要多少推荐数量
-        needed_count = num_recommendations - len(cf_recommendations)
-        content_recommendations = get_content_based_recommendations(
-            target_user_id, 
-            needed_count
-        )
-        
-        # 步骤4: 合并两种推荐结果（注意去重）
-        final_recommendations = cf_recommendations.copy()
-        
-        # 遍历基于内容的推荐结果
-        for movie_id in content_recommendations:
-            # 如果电影尚未在最终推荐列表中，则添加
-            if movie_id not in final_recommendations:
-                final_recommendations.append(movie_id)
-                # 如果达到目标数量，提前结束
-                if len(final_recommendations) >= num_recommendations:
-                    break
-        
-        logger.info(f"最终综合推荐电影数量: {len(final_recommendations)} (CF: {len(cf_recommendations)}, Content: {len(content_recommendations)})")
-        return final_recommendations
+        cf_algorithm = CF_ALGORITHMS.get(RECOMMENDATION_ALGORITHM)
+        if cf_algorithm is None:
+            logger.warning(f"未知的推荐算法配置: {RECOMMENDATION_ALGORITHM}，使用基于用户的协同过滤")
+            cf_algorithm = get_user_cf_recommendations
+        return cf_algorithm(target_user_id, num_recommendations)[:num_recommendations]
     
     except Exception as e:
+        # 出错时返回空列表，由基于内容的推荐提供全部结果（容错机制，确保用户仍能获得一些推荐）
         logger.error(f"生成综合推荐出错: {e}")
+        return []
+
+def _fill_recommendations(target_user_id, cf_recommendations, num_recommendations=5):
+    """
+    整合协同过滤与基于内容的推荐结果
+    
+    推荐流程：
+    1. 协同过滤推荐数量足够时直接返回
+    2. 如果协同过滤结果不足（或出错），用基于内容的推荐补充
+    基于内容的推荐随机选择高分电影，每次请求重新选择，不写入推荐缓存
+    
+    Args:
+        target_user_id (int): 目标用户ID
+        cf_recommendations (list): 协同过滤推荐的电影ID列表
+        num_recommendations (int): 推荐电影数量
         
-        # 异常处理：出错时尝试返回基于内容的推荐作为备选方案
-        # 这是一个容错机制，确保即使协同过滤算法失败，用户仍能获得一些推荐
-        try:
-            return get_content_based_recommendations(target_user_id, num_recommendations)
-        except:
-            return [] 
\ No newline at end of file
+    Returns:
+        list: 综合推荐的电影ID列表
+    """
+    # 步骤1: 判断协同过滤结果是否足够
+    # 如果协同过滤推荐数量足够，直接返回
+    if len(cf_recommendations) >= num_recommendations:
+        return cf_recommendations[:num_recommendations]
+    
+    # 步骤2: 如果协同过滤推荐不足，使用基于内容的推荐补充
+    # 计算还需要多少推荐数量
+    needed_count = num_recommendations - len(cf_recommendations)
+    content_recommendations = get_content_based_recommendations(
+        target_user_id, 
+        needed_count
+    )
+    
+    # 步骤3: 合并两种推荐结果（注意去重）
+    final_recommendations = list(cf_recommendations)
+    
+    # 遍历基于内容的推荐结果
+    for movie_id in content_recommendations:
+        # 如果电影尚未在最终推荐列表中，则添加
+        if movie_id not in final_recommendations:
+            final_recommendations.append(movie_id)
+            # 如果达到目标数量，提前结束
+            if len(final_recommendations) >= num_recommendations:
+                break
+    
+    logger.info(f"最终综合推荐电影数量: {len(final_recommendations)} (CF: {len(cf_recommendations)}, Content: {len(content_recommendations)})")
+    return final_recommendations
+
+# 用户评分后使其推荐缓存失效
+db_manager.add_rating_listener(invalidate_recommendations)
+if RECOMMENDATION_CACHE_CLEAR_ON_REBUILD:
+    rating_matrix.add_switch_listener(clear_recommendation_cache)
+    neighbor_index.add_rebuild_listener(clear_recommendation_cache)
+    item_similarity.add_rebuild_listener(clear_recommendation_cache)
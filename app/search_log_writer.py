@@ -0,0 +1,200 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 搜索记录写入模块：搜索记录放入内存队列，由后台线程按批次写入search_logs表
+
+############################################################
+# 导入必要的库
+############################################################
+import atexit  # 进程退出时写入剩余记录
+import datetime  # 记录搜索发生的时间
+import logging  # 日志库
+import queue  # 线程安全的有界队列
+import threading  # 后台写入线程
+import time  # 计算写入间隔
+from app import db_manager  # 数据库管理模块，提供批量写入函数
+from app.config import SEARCH_LOG_CONFIG  # 搜索记录写入配置
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+_STOP = object()  # 通知后台线程退出的标记
+
+class SearchLogWriter:
+    """
+    异步批量搜索记录写入器
+
+    请求线程调用submit()把记录放入有界队列后立即返回；后台线程从队列中取出记录，
+    积累到batch_size条或距上次写入超过flush_interval秒时，用一条多行INSERT写入数据库。
+    队列已满（数据库写入跟不上）时按overflow_policy丢弃记录或短暂等待，并计数
+    """
+
+    def __init__(self, write_func=None, batch_size=200, flush_interval=2, max_queue_size=10000,
+                 overflow_policy='drop', block_timeout=0.05):
+        """
+        Args:
+            write_func (callable, optional): 批量写入函数，接收记录列表，默认为db_manager.insert_search_logs
+            batch_size (int): 每批最多写入的记录数
+            flush_interval (float): 最长写入间隔（秒）
+            max_queue_size (int): 队列最大长度
+            overflow_policy (str): 队列已满时的处理方式，'drop'或'block'
+            block_timeout (float): 'block'策略的最长等待时间（秒）
+        """
+        if overflow_policy not in ('drop', 'block'):
+            raise ValueError(f"未知的队列溢出策略: {overflow_policy}")
+        self.write_func = write_func or db_manager.insert_search_logs
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+        # 统计计数（submitted和dropped由多个请求线程更新，使用锁保护）
+        self._stats_lock = threading.Lock()
+        self.submitted = 0  # 成功放入队列的记录数
+        self.dropped = 0    # 因队列已满或写入器已关闭而丢弃的记录数
+        self.written = 0    # 成功写入数据库的记录数
+        self.failed = 0     # 写入数据库失败的记录数
+        self.batches = 0    # 写入批次数
+
+    def submit(self, user_id, search_query):
+        """
+        提交一条搜索记录，不等待写入数据库
+
+        Args:
+            user_id (int): 用户ID
+            search_query (str): 搜索关键词
+
+        Returns:
+            bool: 记录放入队列返回True，被丢弃返回False
+        """
+        if self._closed:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        self._ensure_started()
+        # 在请求线程中记录搜索时间，批量写入时保留真实的搜索时间
+        record = (user_id, search_query, datetime.datetime.now())
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put(record, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(record)
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+                dropped = self.dropped
+            if dropped % 1000 == 1:
+                logger.warning(f"搜索记录队列已满，已累计丢弃 {dropped} 条记录")
+            return False
+        with self._stats_lock:
+            self.submitted += 1
+        return True
+
+    def close(self, timeout=5):
+        """
+        停止接收新记录，写入队列中剩余的记录后结束后台线程
+
+        Args:
+            timeout (float): 等待剩余记录写入的最长时间（秒）
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None or not self._thread.is_alive():
+            return
+        # 队列已满时等待结束标记放入，最多等待timeout秒
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("搜索记录队列已满，无法通知后台线程退出")
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        """
+        获取统计信息
+
+        Returns:
+            dict: 提交、丢弃、写入、失败的记录数，写入批次数和当前队列长度
+        """
+        return {
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+            'batches': self.batches,
+            'queued': self._queue.qsize()
+        }
+
+    def _ensure_started(self):
+        # 后台线程在第一次提交记录时启动（多进程部署时在子进程中启动，而不是在fork之前）
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='search-log-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+
+            if record is _STOP:
+                self._flush(batch)
+                return
+            if record is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(record)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        try:
+            self.write_func(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"批量写入搜索记录失败 ({len(batch)} 条): {e}")
+        self.batches += 1
+
+############################################################
+# 全局搜索记录写入器
+############################################################
+_writer = SearchLogWriter(**SEARCH_LOG_CONFIG)
+# 进程正常退出时写入队列中剩余的记录
+atexit.register(_writer.close)
+
+def log_search(user_id, search_query):
+    """
+    异步记录用户搜索查询，立即返回
+
+    Args:
+        user_id (int): 用户ID
+        search_query (str): 搜索关键词
+
+    Returns:
+        bool: 记录放入队列返回True，被丢弃返回False
+    """
+    return _writer.submit(user_id, search_query)
+
+def get_search_log_stats():
+    """获取搜索记录写入器的统计信息"""
+    return _writer.stats()
+
+def flush_and_stop(timeout=5):
+    """停止写入器并写入剩余记录（服务退出时调用）"""
+    _writer.close(timeout)
@@ -0,0 +1,317 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 多进程服务模块：预先fork多个工作进程，每个进程用cheroot的线程池处理WSGI请求
+
+############################################################
+# 导入必要的库
+############################################################
+import gc  # 垃圾回收控制，fork前冻结已加载的数据，保持写时复制的内存共享
+import logging  # 日志库
+import os  # fork、waitpid等进程管理函数
+import signal  # 信号处理：平滑重载、平滑停止
+import socket  # 监听套接字，由主进程创建后被所有工作进程继承
+import threading  # 工作进程中的父进程存活检查线程
+import time  # 计时
+from cheroot import wsgi  # 线程池WSGI服务器
+from app import db_manager  # 数据库管理模块，fork前关闭主进程的连接池
+from app import search_log_writer  # 搜索记录写入模块，工作进程退出前写入剩余记录
+from app import metrics  # 性能指标模块，汇总各工作进程的指标
+from app.async_reply import async_replier  # 异步回复模块，工作进程退出前清除未完成的后台推荐
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+class _SharedSocketServer(wsgi.Server):
+    """
+    使用主进程创建的监听套接字的cheroot服务器
+
+    所有工作进程在同一个套接字上accept，由内核把连接分给空闲的进程。
+    套接字设为非阻塞：多个进程同时被唤醒时，没抢到连接的进程立即返回，而不是在accept上等待
+    """
+
+    def __init__(self, listen_socket, wsgi_app, **options):
+        self._listen_socket = listen_socket
+        super().__init__(listen_socket.getsockname()[:2], wsgi_app, **options)
+
+    def bind(self, family, type, proto=0):
+        self.socket = self._listen_socket
+        return self.socket
+
+    def prepare(self):
+        super().prepare()
+        self.socket.settimeout(0)
+
+class PreforkServer:
+    """
+    预先fork的多进程WSGI服务器
+
+    主进程：创建监听套接字，加载推荐数据（电影目录、评分矩阵、邻居索引等），然后fork工作进程。
+    工作进程继承主进程已加载的数据（写时复制，NumPy数组和内存映射的索引文件在进程间共享），
+    不需要各自从数据库重新加载。主进程只负责管理工作进程，不处理请求。
+
+    信号：
+        SIGHUP  平滑重载：主进程重新加载数据，启动新一代工作进程后再让旧工作进程处理完当前请求后退出
+        SIGTERM/SIGINT  平滑停止：工作进程处理完当前请求后退出（最长等待graceful_timeout秒）
+
+    每隔reload_interval秒也会自动平滑重载一次。
+    评分变更只写入处理该请求的工作进程的评分矩阵，其他工作进程通过共享的评分版本（见rating_versions）
+    发现用户的新评分，推荐时从数据库读取该用户的评分；主进程每隔refresh_interval秒调用refresh_data
+    发布新版本的共享数据（评分矩阵快照等），工作进程检查到新版本后自行切换，不需要重启。
+    refresh_data在单独fork的刷新进程中执行，主进程在刷新期间仍然回收、补充工作进程并响应信号；
+    同一时间最多只有一个刷新进程，刷新期间到期的平滑重载在刷新完成后进行。
+    指定metrics_dir时，各工作进程定期把性能指标写入该目录，/metrics输出所有工作进程的汇总
+    """
+
+    def __init__(self, wsgi_app, port, host='0.0.0.0', workers=4, threads=10, graceful_timeout=10,
+                 reload_interval=3600, backlog=128, load_data=None, refresh_interval=0, refresh_data=None,
+                 metrics_dir=None, metrics_flush_interval=5):
+        """
+        Args:
+            wsgi_app (callable): WSGI应用
+            port (int): 监听端口
+            host (str): 监听地址
+            workers (int): 工作进程数
+            threads (int): 每个工作进程的请求处理线程数
+            graceful_timeout (float): 停止工作进程时等待当前请求处理完成的最长时间（秒）
+            reload_interval (float): 自动平滑重载的间隔（秒），0表示只在收到SIGHUP时重载
+            backlog (int): 监听队列长度
+            load_data (callable, optional): 加载共享数据的函数，参数reload为True表示重载
+            refresh_interval (float): 调用refresh_data的间隔（秒），0表示不刷新
+            refresh_data (callable, optional): 发布新版本共享数据的函数，不替换工作进程
+            metrics_dir (str, optional): 工作进程写入性能指标快照的目录，不指定时/metrics只输出处理该请求的进程的数据
+            metrics_flush_interval (float): 工作进程写入性能指标快照的间隔（秒）
+        """
+        self.wsgi_app = wsgi_app
+        self.address = (host, port)
+        self.worker_count = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.reload_interval = reload_interval
+        self.backlog = backlog
+        self.load_data = load_data
+        self.refresh_interval = refresh_interval
+        self.refresh_data = refresh_data
+        self.metrics_dir = metrics_dir
+        self.metrics_flush_interval = metrics_flush_interval
+        self.socket = None
+        self.workers = {}  # 工作进程PID -> 所属的代数
+        self.stopping = {}  # 正在停止的工作进程PID -> 强制结束的时间
+        self.generation = 0
+        self.refresh_pid = None  # 正在执行refresh_data的刷新进程PID
+        self._reload_requested = False
+        self._stop_requested = False
+
+    ############################################################
+    # 主进程
+    ############################################################
+    def run(self):
+        """启动服务，阻塞直到收到停止信号且所有工作进程退出"""
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(self.address)
+        self.socket.listen(self.backlog)
+        logger.info(f"主进程 {os.getpid()} 监听 {self.address[0]}:{self.address[1]}，"
+                    f"{self.worker_count} 个工作进程 × {self.threads} 个线程")
+
+        if self.metrics_dir:
+            metrics.enable_multiprocess(self.metrics_dir)
+        self._load(reload=False)
+        signal.signal(signal.SIGHUP, self._on_reload_signal)
+        signal.signal(signal.SIGTERM, self._on_stop_signal)
+        signal.signal(signal.SIGINT, self._on_stop_signal)
+        self._spawn_generation()
+        last_reload = last_refresh = time.monotonic()
+
+        try:
+            while not self._stop_requested:
+                self._reap_workers()
+                now = time.monotonic()
+                if self.refresh_pid is not None:
+                    pass  # 刷新进行中：重载和下一次刷新等它结束后再进行，不同时加载两份数据
+                elif self._reload_requested or (self.reload_interval and now - last_reload >= self.reload_interval):
+                    self._reload_requested = False
+                    self._reload()
+                    last_reload = last_refresh = time.monotonic()
+                elif self.refresh_interval and now - last_refresh >= self.refresh_interval:
+                    self._start_refresh()
+                    last_refresh = time.monotonic()
+                time.sleep(0.5)
+        finally:
+            self._shutdown()
+
+    def _on_reload_signal(self, signum, frame):
+        self._reload_requested = True
+
+    def _on_stop_signal(self, signum, frame):
+        self._stop_requested = True
+
+    def _load(self, reload):
+        if self.load_data is not None:
+            # 解冻上一代的数据，使其在不再被引用后可以被回收
+            gc.unfreeze()
+            self.load_data(reload=reload)
+            gc.collect()
+        # 主进程加载数据时使用的数据库连接不留给工作进程
+        db_manager.close_pool()
+        # 已加载的对象移出垃圾回收的跟踪范围，工作进程中的垃圾回收不会写这些对象所在的内存页，
+        # 写时复制共享的内存不会逐渐被复制
+        gc.freeze()
+
+    def _reload(self):
+        logger.info("开始平滑重载：重新加载数据")
+        try:
+            self._load(reload=True)
+        except Exception as e:
+            logger.error(f"重载数据失败，继续使用当前的工作进程: {e}")
+            return
+        old_workers = [pid for pid, generation in self.workers.items() if generation == self.generation]
+        self._spawn_generation()
+        # 新工作进程已开始接收连接，再让旧工作进程处理完当前请求后退出
+        for pid in old_workers:
+            self._stop_worker(pid)
+        logger.info(f"平滑重载完成：第 {self.generation} 代工作进程已启动")
+
+    def _start_refresh(self):
+        """
+        在fork出的刷新进程中调用refresh_data
+
+        刷新（重新加载评分矩阵、按需重建索引）可能需要较长时间，不在主进程中执行：
+        主进程需要持续回收和补充工作进程、响应信号。刷新的结果以新版本快照的形式写入磁盘，
+        工作进程自行切换，不需要回到主进程。不使用线程是因为主进程随时可能fork工作进程，
+        刷新线程持有的锁会被复制到工作进程中且永远不会释放
+        """
+        if self.refresh_data is None:
+            return
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                signal.signal(signal.SIGHUP, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                self.refresh_data()
+            except BaseException as e:
+                logger.error(f"刷新共享数据失败: {e}")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.refresh_pid = pid
+        logger.info(f"启动刷新进程 {pid}")
+
+    def _spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.worker_count):
+            self._spawn_worker()
+
+    def _spawn_worker(self):
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self._worker_main()
+            except BaseException as e:
+                logger.error(f"工作进程 {os.getpid()} 异常退出: {e}")
+                exit_code = 1
+            finally:
+                # 不返回主进程的代码，也不执行从主进程继承的退出处理函数
+                os._exit(exit_code)
+        self.workers[pid] = self.generation
+        logger.info(f"启动工作进程 {pid}（第 {self.generation} 代）")
+
+    def _stop_worker(self, pid):
+        if pid in self.stopping:
+            return
+        self.stopping[pid] = time.monotonic() + self.graceful_timeout + 5
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    def _reap_workers(self):
+        """回收已退出的工作进程，当前一代的工作进程意外退出时补充启动；强制结束超时未退出的旧进程"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid == self.refresh_pid:
+                self.refresh_pid = None
+                if status != 0:
+                    logger.error(f"刷新进程 {pid} 异常退出 (状态: {status})")
+                continue
+            generation = self.workers.pop(pid, None)
+            # 已退出进程的指标并入归档，累计值不会因为工作进程被替换而减少
+            metrics.archive_process(pid)
+            expected = self.stopping.pop(pid, None) is not None
+            if not expected and generation == self.generation and not self._stop_requested:
+                logger.error(f"工作进程 {pid} 意外退出 (状态: {status})，重新启动")
+                self._spawn_worker()
+
+        now = time.monotonic()
+        for pid, deadline in list(self.stopping.items()):
+            if now >= deadline:
+                logger.warning(f"工作进程 {pid} 未在 {self.graceful_timeout} 秒内退出，强制结束")
+                self.stopping[pid] = float('inf')
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _shutdown(self):
+        logger.info("正在停止所有工作进程")
+        for pid in list(self.workers):
+            self._stop_worker(pid)
+        if self.refresh_pid is not None:
+            # 未完成的刷新不写入CURRENT，直接结束不影响已发布的版本
+            try:
+                os.kill(self.refresh_pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        while self.workers or self.refresh_pid is not None:
+            self._reap_workers()
+            time.sleep(0.1)
+        self.socket.close()
+        logger.info("服务已停止")
+
+    ############################################################
+    # 工作进程
+    ############################################################
+    def _worker_main(self):
+        master_pid = os.getppid()
+        stop = threading.Event()
+
+        def raise_exit(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, raise_exit)
+        signal.signal(signal.SIGINT, raise_exit)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        def watch_master():
+            # 主进程被强制结束时工作进程也退出，不留下孤儿进程继续占用端口
+            while not stop.wait(1):
+                if os.getppid() != master_pid:
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    return
+
+        threading.Thread(target=watch_master, name='master-watcher', daemon=True).start()
+        metrics.start_exporter(self.metrics_flush_interval)
+        server = _SharedSocketServer(
+            self.socket, self.wsgi_app, numthreads=self.threads, shutdown_timeout=self.graceful_timeout
+        )
+        try:
+            server.prepare()
+            server.serve()
+        except SystemExit:
+            pass
+        finally:
+            # 停止过程中再次收到信号不中断当前请求的处理
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            stop.set()
+            server.stop()
+            search_log_writer.flush_and_stop()
+            async_replier.abandon_pending()
+            metrics.stop_exporter()
@@ -0,0 +1,130 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 相似度计算模块：基于内存评分矩阵，一次批量计算目标用户与所有用户的相似度
+
+############################################################
+# 导入必要的库
+############################################################
+import numpy as np  # 数值计算库，用于批量向量运算
+from app.config import MIN_COMMON_RATINGS  # 最少共同评分电影数
+
+############################################################
+# 用户相似度
+############################################################
+# 相似度公式（论文算法）：
+#   差异值 area = Σ(score_target_user_i - score_other_user_i)^2 / num_common_movies
+#   相似度 similarity = 1 / (1 + area)，范围为(0,1]，完全相同的用户相似度为1
+# 共同评分电影数少于MIN_COMMON_RATINGS的用户视为不相似
+#
+# 评分在数据库中为DECIMAL(3,1)，这里先换算成"十分之一分"的整数再做差和平方求和，
+# 整数运算没有舍入误差，差异值完全相同的用户得到完全相同的相似度，
+# 与逐个用户计算时一样，相似度并列的邻居按行号先后排序
+
+def _squared_diff_tenths(scores_a, scores_b):
+    """两组评分之差的平方（单位：十分之一分的平方），结果为精确整数值"""
+    diff = np.rint((scores_a - scores_b) * 10)
+    return diff * diff
+
+def user_similarities(matrix, target_row, min_common=MIN_COMMON_RATINGS):
+    """
+    批量计算目标用户与评分矩阵中所有其他用户的相似度
+
+    计算方式相当于一次稀疏矩阵与向量的乘法：
+    通过按列存储的矩阵，只取出评价过目标用户所评电影的那些评分，
+    再用np.bincount按行号一次性累加出每个用户的共同评分数和评分差平方和。
+    增量日志中发生变化的用户行单独计算后覆盖主矩阵的结果
+
+    Args:
+        matrix (RatingMatrix): 评分矩阵
+        target_row (int): 目标用户的行号
+        min_common (int): 最少共同评分电影数
+
+    Returns:
+        tuple: (行号数组, 相似度数组, 共同评分数数组)，只包含达到min_common的用户，按行号升序
+    """
+    target_cols, target_scores = matrix.row(target_row)
+    return ratings_similarities(matrix, target_cols, target_scores, min_common, exclude_row=target_row)
+
+def ratings_similarities(matrix, target_cols, target_scores, min_common=MIN_COMMON_RATINGS, exclude_row=None):
+    """
+    按给定的一组评分计算与评分矩阵中所有用户的相似度
+
+    用于目标用户的评分与矩阵中的评分行不一致时（例如其他工作进程刚处理的评分尚未进入本进程的矩阵）
+
+    Args:
+        matrix (RatingMatrix): 评分矩阵
+        target_cols (np.ndarray): 目标用户评价过的电影的列号（不重复）
+        target_scores (np.ndarray): 对应的评分
+        min_common (int): 最少共同评分电影数
+        exclude_row (int, optional): 目标用户自己在矩阵中的行号，不参与比较
+
+    Returns:
+        tuple: (行号数组, 相似度数组, 共同评分数数组)，只包含达到min_common的用户，按行号升序
+    """
+    n_rows = matrix.n_users
+    if len(target_cols) == 0 or n_rows == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, np.zeros(0, dtype=np.float64), empty
+
+    _, columns = matrix.columns()
+    delta_rows = matrix.delta_rows()
+
+    # 步骤1: 取出目标用户评价过的每一列（电影）中的全部评分
+    # 主矩阵之后才出现的新电影不在按列存储的矩阵中，只可能出现在增量行里
+    n_base_cols = len(columns.indptr) - 1
+    in_base = target_cols < n_base_cols
+    cols = target_cols[in_base]
+    starts = columns.indptr[cols]
+    lengths = columns.indptr[cols + 1] - starts
+    # 将多个列的区间拼接成一个下标数组：positions = [starts[0]..ends[0]) + [starts[1]..ends[1]) + ...
+    total = int(lengths.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    positions = np.repeat(starts, lengths) + offsets
+
+    rows = columns.indices[positions]
+    other_scores = columns.data[positions]
+    target_values = np.repeat(target_scores[in_base], lengths)
+
+    # 步骤2: 按行号累加共同评分数和评分差平方和
+    common = np.bincount(rows, minlength=n_rows)
+    squared_sum = np.bincount(rows, weights=_squared_diff_tenths(target_values, other_scores), minlength=n_rows)
+
+    # 步骤3: 增量行的评分已经变化，用增量行重新计算这些用户的结果
+    for row, (other_cols, other_row_scores) in delta_rows.items():
+        _, target_pos, other_pos = np.intersect1d(
+            target_cols, other_cols, assume_unique=True, return_indices=True
+        )
+        common[row] = len(target_pos)
+        squared_sum[row] = _squared_diff_tenths(target_scores[target_pos], other_row_scores[other_pos]).sum()
+
+    # 步骤4: 排除目标用户自己和共同评分太少的用户，计算相似度
+    if exclude_row is not None:
+        common[exclude_row] = 0
+    valid_rows = np.flatnonzero(common >= max(min_common, 1))
+    valid_common = common[valid_rows]
+    area = squared_sum[valid_rows] / 100.0 / valid_common
+    similarities = 1 / (1 + area)
+    return valid_rows, similarities, valid_common
+
+def top_neighbors(rows, similarities, k):
+    """
+    从相似度结果中选出最相似的k个邻居
+
+    Args:
+        rows (np.ndarray): 行号数组（升序）
+        similarities (np.ndarray): 对应的相似度数组
+        k (int): 邻居数量
+
+    Returns:
+        tuple: (邻居行号数组, 邻居相似度数组)，按相似度从高到低排序，相似度相同时行号小的在前
+    """
+    if k <= 0:
+        return rows[:0], similarities[:0]
+    if len(rows) > k:
+        # 先用np.partition找出第k名的相似度，只对不低于它的候选做稳定排序
+        threshold = np.partition(similarities, len(similarities) - k)[len(similarities) - k]
+        candidates = np.flatnonzero(similarities >= threshold)
+        rows, similarities = rows[candidates], similarities[candidates]
+    order = np.argsort(-similarities, kind='stable')[:k]
+    return rows[order], similarities[order]
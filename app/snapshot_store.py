@@ -0,0 +1,147 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 快照存储模块：把一组NumPy数组按版本写入磁盘目录，各进程以内存映射方式加载，共享操作系统的页缓存
+
+############################################################
+# 导入必要的库
+############################################################
+import os  # 文件路径和原子替换
+import json  # 元数据读写
+import time  # 版本号和检查间隔
+import shutil  # 清理旧版本目录
+import logging  # 日志库
+import numpy as np  # 数组存储
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+# 磁盘上的目录结构：
+#   <快照根目录>/
+#    ├── CURRENT              - 当前生效的版本目录名（通过原子替换更新）
+#    └── gen-<时间戳>/        - 每次发布生成一个新的版本目录
+#         ├── <数组名>.npy    - 各个数组
+#         └── meta.json       - 元数据
+CURRENT_FILE = 'CURRENT'
+KEEP_GENERATIONS = 2  # 保留的历史版本数，正在被其他进程读取的旧版本不会被立即删除
+
+def write_generation(directory, arrays, meta):
+    """
+    将一组数组写入新的版本目录，写完后原子地更新CURRENT指向它
+
+    Args:
+        directory (str): 快照根目录
+        arrays (dict): {数组名: 数组}
+        meta (dict): 元数据
+
+    Returns:
+        str: 新版本目录名
+    """
+    os.makedirs(directory, exist_ok=True)
+    # 版本目录名按时间递增，排序即为新旧顺序
+    stamp = time.time_ns()
+    while os.path.exists(os.path.join(directory, f"gen-{stamp}")):
+        stamp += 1
+    generation = f"gen-{stamp}"
+    target = os.path.join(directory, generation)
+    tmp = target + '.tmp'
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.asarray(array))
+    with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.rename(tmp, target)
+
+    # 先写临时文件再原子替换，读取方要么看到旧版本，要么看到完整的新版本
+    current_tmp = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(current_tmp, 'w', encoding='utf-8') as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+    _remove_old_generations(directory, keep=generation)
+    return generation
+
+def current_generation(directory):
+    """
+    读取CURRENT指向的版本目录名
+
+    Returns:
+        str or None: 还没有发布过任何版本时返回None
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def load_generation(directory, names, generation=None):
+    """
+    以内存映射方式加载一个版本的数组
+
+    Args:
+        directory (str): 快照根目录
+        names (iterable): 要加载的数组名
+        generation (str, optional): 版本目录名，默认为CURRENT指向的版本
+
+    Returns:
+        tuple or None: ({数组名: 只读内存映射数组}, 元数据)，没有可用版本时返回None；
+                       元数据中的'generation'为版本目录名
+    """
+    generation = generation or current_generation(directory)
+    if generation is None:
+        return None
+    path = os.path.join(directory, generation)
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    meta['generation'] = generation
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in names}
+    return arrays, meta
+
+class GenerationWatcher:
+    """
+    检查快照目录是否发布了新版本
+
+    在请求路径上调用check()：距上次检查不足interval秒时直接返回，
+    否则读取一次CURRENT文件（只有几十个字节）
+    """
+
+    def __init__(self, directory, interval):
+        """
+        Args:
+            directory (str): 快照根目录
+            interval (float): 两次读取CURRENT文件的最小间隔（秒）
+        """
+        self.directory = directory
+        self.interval = interval
+        self._next_check = time.monotonic() + interval
+
+    def check(self, known_generation):
+        """
+        Args:
+            known_generation (str or None): 调用方当前使用的版本
+
+        Returns:
+            str or None: 有不同于known_generation的新版本时返回其目录名，否则返回None
+        """
+        now = time.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.interval
+        try:
+            generation = current_generation(self.directory)
+        except OSError as e:
+            logger.error(f"读取快照版本失败 ({self.directory}): {e}")
+            return None
+        if generation is None or generation == known_generation:
+            return None
+        return generation
+
+def _remove_old_generations(directory, keep):
+    """删除较旧的版本目录，只保留最近的几个"""
+    generations = sorted(
+        name for name in os.listdir(directory)
+        if name.startswith('gen-') and not name.endswith('.tmp')
+    )
+    for name in generations[:-KEEP_GENERATIONS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
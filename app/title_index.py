@@ -0,0 +1,132 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 标题索引模块：基于字符二元组（bigram）的倒排索引，在内存中完成电影标题的精确、包含和相似匹配
+
+############################################################
+# 导入必要的库
+############################################################
+from collections import Counter  # 计数器，用于统计共同二元组数量
+
+############################################################
+# 标题规范化
+############################################################
+def normalize_title(title):
+    """
+    标题规范化：去除首尾空白并忽略大小写
+
+    与movies表的utf8mb4_unicode_ci排序规则一致（LIKE和=比较均不区分大小写）
+    """
+    return title.strip().casefold()
+
+def title_bigrams(text):
+    """
+    获取字符串中所有相邻两个字符组成的二元组集合
+
+    中文标题没有空格分词，按字符二元组切分：如"海蒂和爷爷" -> {"海蒂", "蒂和", "和爷", "爷爷"}
+    只有一个字符时返回该字符本身
+    """
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+############################################################
+# 标题倒排索引
+############################################################
+class TitleIndex:
+    """
+    电影标题倒排索引
+
+    每部电影按豆瓣评分从高到低编号（编号即排名），每个字符和字符二元组记录包含它的电影编号列表，
+    列表天然按编号升序，也就是按豆瓣评分降序，因此查询结果不需要再排序，取够数量即可提前结束
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (list): 电影记录列表，必须已按豆瓣评分降序排列
+        """
+        self.records = list(records)
+        self.titles = [normalize_title(record['title']) for record in self.records]
+        self.postings = {}   # 字符/二元组 -> 包含它的电影编号列表（升序）
+        self.exact = {}      # 规范化标题 -> 电影编号列表
+        self.gram_counts = []  # 每部电影标题的二元组数量，用于计算相似度
+
+        for rank, title in enumerate(self.titles):
+            self.exact.setdefault(title, []).append(rank)
+            grams = title_bigrams(title)
+            self.gram_counts.append(len(grams))
+            # 单个字符也建立索引，用于单字查询
+            for gram in grams | set(title):
+                self.postings.setdefault(gram, []).append(rank)
+
+    def __len__(self):
+        return len(self.records)
+
+    def search_exact(self, query):
+        """
+        精确匹配标题（不区分大小写）
+
+        Returns:
+            list: 电影记录列表，按豆瓣评分降序
+        """
+        return [self.records[rank] for rank in self.exact.get(normalize_title(query), ())]
+
+    def search_substring(self, query, limit=5):
+        """
+        查找标题包含query的电影，等价于 title LIKE '%query%' ORDER BY douban_rating DESC LIMIT limit
+
+        只需遍历query中最少见的二元组对应的电影列表，逐个确认标题是否包含query
+
+        Returns:
+            list: 电影记录列表，按豆瓣评分降序
+        """
+        query = normalize_title(query)
+        if not query:
+            return []
+        grams = title_bigrams(query)
+        postings = [self.postings.get(gram) for gram in grams]
+        if not all(postings):
+            # 某个二元组没有出现在任何标题中，不可能有标题包含query
+            return []
+        rarest = min(postings, key=len)
+
+        result = []
+        for rank in rarest:
+            if query in self.titles[rank]:
+                result.append(self.records[rank])
+                if len(result) >= limit:
+                    break
+        return result
+
+    def search_similar(self, query, limit=5, min_score=0.3):
+        """
+        按二元组相似度查找标题相近的电影（用于包含匹配也找不到结果时）
+
+        相似度为Dice系数：2 * 共同二元组数 / (query二元组数 + 标题二元组数)，
+        相似度相同时豆瓣评分高的在前
+
+        Args:
+            query (str): 查询词
+            limit (int): 返回数量
+            min_score (float): 最低相似度
+
+        Returns:
+            list: [(电影记录, 相似度), ...]，按相似度降序
+        """
+        query = normalize_title(query)
+        grams = title_bigrams(query)
+        if not grams:
+            return []
+
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+
+        scored = []
+        for rank, count in shared.items():
+            score = 2.0 * count / (len(grams) + self.gram_counts[rank])
+            if score >= min_score:
+                scored.append((-score, rank))
+        scored.sort()
+        return [(self.records[rank], -neg_score) for neg_score, rank in scored[:limit]]
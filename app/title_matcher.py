@@ -0,0 +1,201 @@
+# 基于协同过滤算法的电影推荐系统研究与实现
+# 作者：刘鑫凯 (毕业设计作品)
+# Mindsnap团队的电影推荐系统分团队
+# 标题纠错模块：容忍错别字、繁简差异和拼音首字母输入的电影标题匹配
+
+############################################################
+# 导入必要的库
+############################################################
+import logging  # 日志库
+import unicodedata  # Unicode字符分类，用于去除标点符号
+import numpy as np  # 数值计算库，用于批量统计共同字符数
+
+# 拼音库为可选依赖：安装后支持按拼音首字母查找电影（如 "xskdjs" -> 肖申克的救赎）
+try:
+    from pypinyin import lazy_pinyin, Style
+except ImportError:  # pragma: no cover - 取决于部署环境
+    lazy_pinyin = None
+
+logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
+
+############################################################
+# 标题规范化
+############################################################
+# 电影标题中常见的繁体字 -> 简体字对照表
+# 只收录电影标题里常见的字，用户输入繁体标题时仍能匹配到简体标题
+_TRADITIONAL_CHARS = (
+    "愛與們龍門說夢風鬥戰傳國島魚語裡後來時無雙這個長東書電車紅華萬葉號貓獅險歲聖誕靈舊記憶輕騎驚戲劇讓獄蘭歡樂藍綠黃鐵銀錢觀"
+    "對兒媽爺師學貝頭聽見親開關陽陰間當體發臺灣飛機實變幾義會獨難氣場報離歷殺俠劍鳥雲網羅衛隊處蟲壞禮總輪盤錯達應復轉點線鄉漢"
+    "滅際層塵燈燒滿煙壯盜賊園圓團夠婦孫寶將專導帶歸彈徵惡懷戀態慶擊據數斷於陣雞雜響頁順頓領顏類顯題餘館馬駕騰驗魯鳳麗麥齊齒棧陳劉張趙鄭"
+)
+_SIMPLIFIED_CHARS = (
+    "爱与们龙门说梦风斗战传国岛鱼语里后来时无双这个长东书电车红华万叶号猫狮险岁圣诞灵旧记忆轻骑惊戏剧让狱兰欢乐蓝绿黄铁银钱观"
+    "对儿妈爷师学贝头听见亲开关阳阴间当体发台湾飞机实变几义会独难气场报离历杀侠剑鸟云网罗卫队处虫坏礼总轮盘错达应复转点线乡汉"
+    "灭际层尘灯烧满烟壮盗贼园圆团够妇孙宝将专导带归弹征恶怀恋态庆击据数断于阵鸡杂响页顺顿领颜类显题余馆马驾腾验鲁凤丽麦齐齿栈陈刘张赵郑"
+)
+_TO_SIMPLIFIED = str.maketrans(_TRADITIONAL_CHARS, _SIMPLIFIED_CHARS)
+
+def normalize_for_matching(text):
+    """
+    纠错匹配使用的标题规范化
+
+    1. 繁体字转为简体字
+    2. 不区分大小写
+    3. 去除空白和标点符号（"蝙蝠侠：黑暗骑士" 与 "蝙蝠侠黑暗骑士" 视为相同）
+    """
+    text = text.translate(_TO_SIMPLIFIED).casefold()
+    return ''.join(
+        char for char in text
+        if not char.isspace() and not unicodedata.category(char).startswith('P')
+    )
+
+def pinyin_initials(text):
+    """
+    标题的拼音首字母，如 "肖申克的救赎" -> "xskdjs"；未安装pypinyin时返回None
+
+    非汉字字符（字母、数字）原样保留
+    """
+    if lazy_pinyin is None:
+        return None
+    return ''.join(syllable[:1] for syllable in lazy_pinyin(text, style=Style.FIRST_LETTER)).casefold()
+
+############################################################
+# 编辑距离
+############################################################
+def levenshtein(a, b, max_distance=None):
+    """
+    计算两个字符串的编辑距离（插入、删除、替换一个字符各算一步）
+
+    Args:
+        a (str): 字符串
+        b (str): 字符串
+        max_distance (int, optional): 只关心是否不超过该距离，超过时提前结束计算
+
+    Returns:
+        int: 编辑距离；指定max_distance且距离超过它时返回max_distance + 1
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,                      # 删除
+                current[j - 1] + 1,                   # 插入
+                previous[j - 1] + (char_a != char_b)  # 替换
+            ))
+        # 这一行的最小值已经超过上限，最终距离不可能再变小
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+############################################################
+# 标题纠错匹配
+############################################################
+def _has_chinese(text):
+    return any('\u4e00' <= char <= '\u9fff' for char in text)
+
+def max_typos(length):
+    """按查询长度允许的最大编辑距离：短标题只容忍1个错字，较长的标题容忍2个"""
+    if length <= 1:
+        return 0
+    if length <= 5:
+        return 1
+    return 2
+
+class TitleMatcher:
+    """
+    容错的电影标题匹配器
+
+    匹配顺序：
+    1. 规范化后完全相同（繁简差异、大小写、空格和标点不同）
+    2. 拼音首字母完全相同（需要安装pypinyin，查询为纯字母、至少两个字母时）
+    3. 编辑距离不超过允许的错字数
+    同一类匹配中，编辑距离小的在前，距离相同时豆瓣评分高的在前
+
+    编辑距离匹配使用字符倒排索引过滤候选：每次插入、删除或替换最多让查询中的一种字符在标题中缺失，
+    所以距离不超过k的标题至少包含查询中 (不同字符数 - k) 种字符、且长度相差不超过k。
+    先用np.bincount一次统计所有标题包含的查询字符数，只对通过过滤的少数标题计算编辑距离。
+    （BK树在中文短标题上几乎无法剪枝：短标题之间的编辑距离大多接近标题长度）
+    """
+
+    def __init__(self, records):
+        """
+        Args:
+            records (list): 电影记录列表，必须已按豆瓣评分降序排列
+        """
+        self.records = list(records)
+        key_ranks = {}      # 规范化标题 -> 电影编号列表
+        self.initials = {}  # 拼音首字母 -> 电影编号列表
+        for rank, record in enumerate(self.records):
+            key = normalize_for_matching(record['title'])
+            key_ranks.setdefault(key, []).append(rank)
+            # 只为包含汉字的标题建立拼音首字母索引
+            initials = pinyin_initials(key) if _has_chinese(key) else None
+            if initials:
+                self.initials.setdefault(initials, []).append(rank)
+
+        self.keys = list(key_ranks)
+        self.key_ranks = list(key_ranks.values())
+        self.key_index = {key: i for i, key in enumerate(self.keys)}
+        self.key_lengths = np.array([len(key) for key in self.keys], dtype=np.int32)
+        # 字符 -> 包含该字符的规范化标题编号
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for char in set(key):
+                postings.setdefault(char, []).append(i)
+        self.char_postings = {char: np.array(ids, dtype=np.int32) for char, ids in postings.items()}
+        if lazy_pinyin is None:
+            logger.info("未安装pypinyin，标题纠错不支持拼音首字母匹配")
+
+    def match(self, query, limit=5):
+        """
+        查找与query相近的电影
+
+        Args:
+            query (str): 用户输入的标题
+            limit (int): 返回数量
+
+        Returns:
+            list: [(电影记录, 编辑距离), ...]，规范化后相同或拼音首字母相同的距离为0
+        """
+        key = normalize_for_matching(query)
+        if not key:
+            return []
+
+        key_id = self.key_index.get(key)
+        ranks = list(self.key_ranks[key_id]) if key_id is not None else []
+        if not ranks and len(key) >= 2 and key.isascii() and key.isalpha():
+            ranks = list(self.initials.get(key, ()))
+        if ranks:
+            return [(self.records[rank], 0) for rank in sorted(ranks)[:limit]]
+
+        k = max_typos(len(key))
+        if k == 0:
+            return []
+        chars = set(key)
+        postings = [self.char_postings[char] for char in chars if char in self.char_postings]
+        if len(postings) < len(chars) - k:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys)) if postings else \
+            np.zeros(len(self.keys), dtype=np.int64)
+        candidates = np.flatnonzero(
+            (shared >= len(chars) - k) & (np.abs(self.key_lengths - len(key)) <= k)
+        )
+
+        matches = []
+        for i in candidates.tolist():
+            distance = levenshtein(key, self.keys[i], k)
+            if distance <= k:
+                for rank in self.key_ranks[i]:
+                    matches.append((distance, rank))
+        matches.sort()
+        return [(self.records[rank], distance) for distance, rank in matches[:limit]]
@@ -1,13 +1,258 @@
-# Mindsnap团队的电影推荐系统分团队 
+# Mindsnap团队的电影推荐系统分团队
 # 工具函数模块：提供各模块共用的辅助函数
 
+import time
+import threading
+from collections import OrderedDict
+
+############################################################
+# 缓存
+############################################################
+class LRUCache:
+    """
+    线程安全的LRU缓存，支持过期时间
+
+    超过容量时淘汰最久未被访问的条目；条目写入超过ttl秒后视为过期。
+    记录命中、未命中、过期和淘汰次数，用于评估缓存容量和过期时间是否合适
+    """
+
+    def __init__(self, max_size=1000, ttl=None):
+        """
+        初始化缓存
+
+        Args:
+            max_size (int): 最大条目数
+            ttl (float, optional): 条目有效期（秒），None表示不过期
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, value)，按访问先后排列，最近访问的在末尾
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        读取缓存
+
+        Args:
+            key: 键
+            default: 未命中时的返回值
+
+        Returns:
+            缓存的值，未命中或已过期时返回default
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        写入缓存，超过容量时淘汰最久未被访问的条目
+
+        Args:
+            key: 键
+            value: 值
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        删除指定条目
+
+        Returns:
+            bool: 条目存在并被删除时返回True
+        """
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        """清空缓存（统计计数保留）"""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        """
+        获取缓存统计信息
+
+        Returns:
+            dict: 命中/未命中/过期/淘汰次数、命中率、当前条目数和容量
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'expirations': self.expirations,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'max_size': self.max_size
+            }
+
 ############################################################
-# 此模块当前为预留模块，用于未来扩展
+# 请求合并
 ############################################################
-# 可以在此处添加通用工具函数，如：
-# - 日期时间处理函数
-# - 字符串处理函数
-# - 日志记录函数
-# - 格式化输出函数
-# - 错误处理函数
-# 等等 
\ No newline at end of file
+_MISSING = object()  # 缓存未命中的标记，结果本身可能是None
+
+class _Flight:
+    """一次正在进行的调用"""
+    __slots__ = ('done', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = False
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    合并并发的相同调用：同一个键同一时间只执行一次，期间到达的相同调用等待并共享其结果
+
+    - 执行出错时等待者收到同一个异常，出错的结果不缓存
+    - 每个键的等待者数量有上限，超出上限或等待超时的调用自行执行，不会无限排队
+    - result_ttl大于0时，成功的结果在完成后再保留result_ttl秒，期间的相同调用直接返回
+    记录执行、共享、缓存命中、超出上限和等待超时次数，用于评估合并的效果
+    """
+
+    def __init__(self, max_waiters=100, wait_timeout=None, result_ttl=0, max_size=1000):
+        """
+        初始化
+
+        Args:
+            max_waiters (int): 每个键最多的等待者数量
+            wait_timeout (float, optional): 等待的最长时间（秒），None表示一直等待
+            result_ttl (float): 结果的保留时间（秒），0表示不保留
+            max_size (int): 最多保留结果的键数量
+        """
+        self.max_waiters = max_waiters
+        self.wait_timeout = wait_timeout
+        self._results = LRUCache(max_size=max_size, ttl=result_ttl) if result_ttl > 0 else None
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+        # 所有键的等待者共用一个条件变量，不必为每次调用创建Event（没有并发的相同调用时开销最小）
+        self._finished = threading.Condition(self._lock)
+        self.executions = 0
+        self.shared = 0
+        self.overflows = 0
+        self.timeouts = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        执行func(*args, **kwargs)，相同键的并发调用只执行一次
+
+        Args:
+            key: 调用的键，键相同的调用必须返回相同的结果
+            func (callable): 被调用的函数
+
+        Returns:
+            func的返回值（并发调用之间共享同一个对象）
+        """
+        if self._results is not None:
+            value = self._results.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+                leader = True
+            elif flight.waiters < self.max_waiters:
+                flight.waiters += 1
+                leader = False
+                if self._finished.wait_for(lambda: flight.done, self.wait_timeout):
+                    self.shared += 1
+                else:
+                    self.timeouts += 1
+                    self.executions += 1
+                    flight = None
+            else:
+                self.overflows += 1
+                self.executions += 1
+                flight = None
+
+        if flight is None:
+            return func(*args, **kwargs)
+        if leader:
+            return self._lead(key, flight, func, args, kwargs)
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _lead(self, key, flight, func, args, kwargs):
+        try:
+            flight.value = func(*args, **kwargs)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                # 调用期间被forget()时结果可能基于旧数据，不保留；同一个键也可能已经开始了新的调用
+                current = self._flights.get(key) is flight
+                if current:
+                    del self._flights[key]
+            if current and flight.error is None and self._results is not None:
+                self._results.set(key, flight.value)
+            with self._lock:
+                flight.done = True
+                if flight.waiters:
+                    self._finished.notify_all()
+        return flight.value
+
+    def forget(self, key):
+        """
+        使键的结果失效：删除保留的结果，正在进行的调用不再接受新的等待者
+        （数据在调用期间发生变化时使用，之后的调用重新执行）
+        """
+        with self._lock:
+            self._flights.pop(key, None)
+        if self._results is not None:
+            self._results.delete(key)
+
+    def clear(self):
+        """使所有键的结果失效（统计计数保留）"""
+        with self._lock:
+            self._flights.clear()
+        if self._results is not None:
+            self._results.clear()
+
+    def stats(self):
+        """
+        获取统计信息
+
+        Returns:
+            dict: 执行、共享、缓存命中、超出上限和等待超时次数，以及正在进行的调用数
+        """
+        with self._lock:
+            return {
+                'executions': self.executions,
+                'shared': self.shared,
+                'cache_hits': self._results.hits if self._results is not None else 0,
+                'overflows': self.overflows,
+                'timeouts': self.timeouts,
+                'in_flight': len(self._flights)
+            }
@@ -14,8 +14,15 @@ import re  # 正则表达式，用于解析用户评价命令
 
 # 导入配置和其他模块
 from .config import WECHAT_TOKEN, MAX_SEARCH_RESULTS, DEFAULT_RECOMMENDATIONS_COUNT  # 导入配置项
+from .config import ASYNC_REPLY_CONFIG, MESSAGE_DEDUP_CONFIG
 from . import db_manager  # 数据库管理模块，提供数据访问接口
 from . import recommendation_engine  # 推荐引擎模块，提供电影推荐算法
+from . import movie_catalog  # 电影目录模块，提供内存中的电影信息
+from . import search_log_writer  # 搜索记录异步写入模块
+from . import metrics  # 性能指标模块，统计消息处理各阶段的耗时
+from . import rating_versions  # 评分版本模块，判断后台生成的推荐是否早于用户最近的评分
+from .async_reply import async_replier  # 异步回复模块，推荐在回复时限内未完成时转为后台生成
+from .message_dedup import message_deduplicator, message_key  # 消息去重模块，微信重试的消息不重复处理
 from .rate_limiter import check_rate_limit  # 速率限制模块
 
 ############################################################
@@ -25,6 +32,17 @@ from .rate_limiter import check_rate_limit  # 速率限制模块
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)  # 创建当前模块的日志记录器
 
+############################################################
+# 性能指标
+# 数据库查询的耗时由db_manager按函数统计，这里只统计消息处理本身的各阶段
+############################################################
+REQUEST_SECONDS = metrics.histogram(
+    'wechat_request_seconds', '处理一条微信消息的总耗时（秒），按命令分类', labels=('command',)
+)
+STAGE_SECONDS = metrics.histogram(
+    'wechat_stage_seconds', '微信消息处理各阶段的耗时（秒）', labels=('stage',)
+)
+
 ############################################################
 # 微信签名验证
 ############################################################
@@ -64,6 +82,7 @@ def check_signature(signature, timestamp, nonce, token=WECHAT_TOKEN):
         logger.error(f"签名验证失败: {e}")
         return False
 
+@STAGE_SECONDS.timed('parse_xml')
 def parse_xml_message(xml_data):
     """
     解析微信XML消息
@@ -87,6 +106,7 @@ def parse_xml_message(xml_data):
         logger.error(f"XML解析失败: {e}")
         return {}
 
+@STAGE_SECONDS.timed('build_response')
 def build_text_response(to_user, from_user, content):
     """
     构建XML格式的文本回复消息
@@ -143,11 +163,12 @@ def handle_movie_search(from_user_openid, movie_title):
         # 获取用户ID（如不存在则创建）
         user_id = db_manager.get_user_id_by_openid(from_user_openid)
         
-        # 记录搜索查询（可选功能）
-        db_manager.log_search_query(user_id, cleaned_movie_title)
+        # 记录搜索查询（放入队列由后台线程批量写入，不等待数据库）
+        search_log_writer.log_search(user_id, cleaned_movie_title)
         
         # 先尝试精确匹配
-        movies_exact = db_manager.search_movies_by_title_exact(cleaned_movie_title)
+        with STAGE_SECONDS.time('search.exact'):
+            movies_exact = movie_catalog.search_movies_by_title_exact(cleaned_movie_title)
         logger.info(f"精确搜索 '{cleaned_movie_title}' 结果数量: {len(movies_exact) if movies_exact else 0}")
         
         movies_to_display = []
@@ -161,7 +182,9 @@ def handle_movie_search(from_user_openid, movie_title):
                 additional_message = f"\n\n提示：'{cleaned_movie_title}' 精确匹配到多部影片，已显示前{MAX_SEARCH_RESULTS}部。"
         else:
             logger.info(f"精确搜索 '{cleaned_movie_title}' 未找到结果，尝试模糊搜索...")
-            movies_fuzzy = db_manager.search_movies_by_title_fuzzy(cleaned_movie_title, limit=MAX_SEARCH_RESULTS * 2) # 稍微多取一点，让get_movie_details_for_display去筛选
+            # 在内存标题索引中查找标题包含关键词的电影，按豆瓣评分降序
+            with STAGE_SECONDS.time('search.fuzzy'):
+                movies_fuzzy = movie_catalog.search_movies_by_title_fuzzy(cleaned_movie_title, limit=MAX_SEARCH_RESULTS * 2) # 稍微多取一点，让get_movie_details_for_display去筛选
             logger.info(f"模糊搜索 '{cleaned_movie_title}' 结果数量: {len(movies_fuzzy) if movies_fuzzy else 0}")
             if movies_fuzzy:
                 movies_to_display = movies_fuzzy 
@@ -169,6 +192,14 @@ def handle_movie_search(from_user_openid, movie_title):
                 # get_movie_details_for_display 内部会根据 max_movies_to_display (即 MAX_SEARCH_RESULTS) 来限制实际显示的电影数量
                 if len(movies_fuzzy) > MAX_SEARCH_RESULTS:
                      additional_message = f"\n\n提示：模糊搜索到多个结果，已显示评分较高的前{MAX_SEARCH_RESULTS}部。可尝试更精确的搜索词。"
+            else:
+                # 没有标题包含关键词的电影时，容错匹配标题相近的电影（错别字、繁简体、拼音首字母、字符二元组相似度）
+                with STAGE_SECONDS.time('search.similar'):
+                    movies_similar = movie_catalog.search_movies_by_title_similar(cleaned_movie_title, limit=MAX_SEARCH_RESULTS)
+                logger.info(f"相似标题搜索 '{cleaned_movie_title}' 结果数量: {len(movies_similar)}")
+                if movies_similar:
+                    movies_to_display = movies_similar
+                    additional_message = f"\n\n提示：没有找到标题包含'{cleaned_movie_title}'的电影，以上是标题相近的电影。"
 
         if not movies_to_display:
             logger.info(f"电影 '{cleaned_movie_title}' 未找到。")
@@ -176,7 +207,8 @@ def handle_movie_search(from_user_openid, movie_title):
         
         # 获取格式化的电影信息，传递 MAX_SEARCH_RESULTS 作为显示数量上限
         # get_movie_details_for_display 内部会处理总长度和简介长度
-        response_message_main = db_manager.get_movie_details_for_display(movies_to_display, max_movies_to_display=MAX_SEARCH_RESULTS)
+        with STAGE_SECONDS.time('search.format'):
+            response_message_main = db_manager.get_movie_details_for_display(movies_to_display, max_movies_to_display=MAX_SEARCH_RESULTS)
         
         final_response = response_message_main + additional_message
         
@@ -198,13 +230,65 @@ def handle_movie_search(from_user_openid, movie_title):
         logger.error(f"电影搜索失败: {e}")
         return "搜索电影时出现内部错误，请稍后再试。"
 
+# 一条评价消息中的一项 "电影名 评分"，多项之间用逗号、分号、顿号或换行分隔
+# 电影名使用非贪婪匹配，只在 "空白+评分" 之后的分隔符处切分，标题本身包含逗号时（如 "你好，李焕英"）不受影响
+_RATING_ITEM_PATTERN = re.compile(r'\s*(.+?)\s+(\d+(?:\.\d)?)\s*(?:[，,；;、\n]|$)')
+MAX_RATINGS_PER_MESSAGE = 10  # 一条消息最多评价的电影数
+
+def _parse_rating_items(text):
+    """
+    解析评价命令中的 "电影名 评分" 列表
+    
+    Args:
+        text (str): 去掉 "评价" 前缀后的内容，如 "肖申克的救赎 9.5，盗梦空间 9"
+        
+    Returns:
+        list: [(电影名, 评分字符串), ...]；格式不正确时返回None
+    """
+    items = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _RATING_ITEM_PATTERN.match(text, pos)
+        if not match:
+            return None
+        items.append((match.group(1).strip(), match.group(2)))
+        pos = match.end()
+    return items or None
+
+@STAGE_SECONDS.timed('rate.resolve_movie')
+def _resolve_movie_for_rating(movie_name):
+    """
+    查找要评价的电影：先精确匹配，找不到时容错匹配（错别字、繁简体、拼音首字母）
+    
+    Returns:
+        tuple: (同名电影列表, 纠正提示)；找不到或无法确定时返回 (None, 提示信息)
+    """
+    movies = movie_catalog.search_movies_by_title_exact(movie_name)
+    if movies:
+        return movies, ""
+    matches = movie_catalog.match_movie_title(movie_name, limit=MAX_SEARCH_RESULTS)
+    if not matches:
+        return None, f"未找到电影《{movie_name}》，无法评价。"
+    # 只有最接近的电影唯一时才直接评价，否则请用户确认
+    best_distance = matches[0][1]
+    best_matches = [movie for movie, distance in matches if distance == best_distance]
+    if len(best_matches) > 1:
+        candidates = "、".join(f"《{movie['title']}》" for movie, _ in matches)
+        return None, f"未找到电影《{movie_name}》，您是不是要评价：{candidates}？\n请使用完整的电影名重新评价。"
+    corrected_note = ""
+    if best_distance > 0:
+        corrected_note = f"（未找到《{movie_name}》，已按最接近的《{best_matches[0]['title']}》评价）"
+    return best_matches, corrected_note
+
 def handle_movie_rating(from_user_openid, content):
     """
     处理电影评分
     
     Args:
         from_user_openid: 用户OpenID
-        content: 评分消息内容，格式为 "评价 电影名 评分"
+        content: 评分消息内容，格式为 "评价 电影名 评分"，
+                 一次评价多部电影时用逗号分隔，如 "评价 肖申克的救赎 9.5，盗梦空间 9"
         
     Returns:
         评分结果提示字符串
@@ -216,13 +300,16 @@ def handle_movie_rating(from_user_openid, content):
         
         # 解析评分命令
         # 匹配格式 "评价 电影名 评分"，允许评分为整数或一位小数
-        pattern = r'^评价\s+(.+)\s+(\d+(\.\d)?)$'
-        match = re.match(pattern, content.strip())
+        match = re.match(r'^评价\s+(.+)$', content.strip(), re.S)
+        items = _parse_rating_items(match.group(1)) if match else None
         
-        if not match:
+        if not items:
             return "评价格式不正确。正确格式为：评价 电影名 评分\n例如：评价 肖申克的救赎 9.5"
         
-        movie_name = match.group(1).strip()
+        if len(items) > 1:
+            return _handle_multi_movie_rating(from_user_openid, items)
+        
+        movie_name, score_text = items[0]
         if not movie_name:
             return "电影名不能为空。正确格式为：评价 电影名 评分\n例如：评价 肖申克的救赎 9.5"
         
@@ -231,7 +318,7 @@ def handle_movie_rating(from_user_openid, content):
             return "电影名过长，请输入正确的电影名称。"
         
         try:
-            score = float(match.group(2))
+            score = float(score_text)
         except (ValueError, TypeError):
             return "评分必须是0-10之间的数字，可以包含一位小数。"
         
@@ -249,20 +336,22 @@ def handle_movie_rating(from_user_openid, content):
         user_id = db_manager.get_user_id_by_openid(from_user_openid)
         
         # 查找电影
-        movies = db_manager.search_movies_by_title_exact(movie_name)
-        
+        movies, corrected_note = _resolve_movie_for_rating(movie_name)
         if not movies:
-            return f"未找到电影《{movie_name}》，无法评价。"
+            return corrected_note
+        if corrected_note:
+            corrected_note = "\n" + corrected_note
+            movie_name = movies[0]['title']
         
         # 处理同名电影问题（目前简单处理，取第一个）
         movie = movies[0]
         movie_id = movie['id']
         
         # 添加或更新评分
-        success = db_manager.add_or_update_rating(user_id, movie_id, score)
+        result = db_manager.add_or_update_rating(user_id, movie_id, score)
         
-        if success:
-            response = f"《{movie_name}》评分成功！{note}"
+        if result:
+            response = f"《{movie_name}》评分成功！{note}{corrected_note}"
             # 如果有多部同名电影，添加提示
             if len(movies) > 1:
                 response += f"\n注意：该名称对应多部影片，已默认评价第一部。"
@@ -276,6 +365,55 @@ def handle_movie_rating(from_user_openid, content):
         logger.error(f"处理电影评分失败: {e}")
         return "评价电影时出现错误，请稍后再试。"
 
+def _handle_multi_movie_rating(from_user_openid, items):
+    """
+    一条消息评价多部电影，所有评分一次批量写入
+    
+    Args:
+        from_user_openid: 用户OpenID
+        items (list): [(电影名, 评分字符串), ...]
+        
+    Returns:
+        评分结果提示字符串
+    """
+    if len(items) > MAX_RATINGS_PER_MESSAGE:
+        return f"一次最多评价{MAX_RATINGS_PER_MESSAGE}部电影，请分多次发送。"
+    
+    user_id = db_manager.get_user_id_by_openid(from_user_openid)
+    
+    lines = []
+    ratings = []
+    for movie_name, score_text in items:
+        if len(movie_name) > 100:
+            lines.append("电影名过长，请输入正确的电影名称。")
+            continue
+        score = min(max(float(score_text), 0), 10)
+        movies, note = _resolve_movie_for_rating(movie_name)
+        if not movies:
+            lines.append(note)
+            continue
+        ratings.append((user_id, movies[0]['id'], score))
+        line = f"《{movies[0]['title']}》{score:g}分"
+        if note:
+            line += note
+        if len(movies) > 1:
+            line += "（该名称对应多部影片，已默认评价第一部）"
+        lines.append(line)
+    
+    if not ratings:
+        return "\n".join(lines)
+    
+    try:
+        result = db_manager.add_or_update_ratings(ratings)
+    except Exception as e:
+        logger.error(f"批量评分失败 (用户ID: {user_id}): {e}")
+        return "评价电影时出现错误，请稍后再试。"
+    
+    summary = f"评分成功！新增{result['inserted']}部，更新{result['updated']}部"
+    if result['failed']:
+        summary += f"，{result['failed']}部评价失败，请稍后再试"
+    return summary + "：\n" + "\n".join(lines)
+
 def handle_movie_recommendation(from_user_openid):
     """
     处理电影推荐请求
@@ -313,10 +451,11 @@ def handle_movie_recommendation(from_user_openid):
             )
         
         # 调用推荐引擎生成推荐电影ID列表
-        movie_ids = recommendation_engine.generate_recommendations(
-            user_id, 
-            DEFAULT_RECOMMENDATIONS_COUNT # 使用config中定义的推荐数量
-        )
+        with STAGE_SECONDS.time('recommend.engine'):
+            movie_ids = recommendation_engine.generate_recommendations(
+                user_id, 
+                DEFAULT_RECOMMENDATIONS_COUNT # 使用config中定义的推荐数量
+            )
         
         # 如果没有推荐结果
         if not movie_ids:
@@ -328,21 +467,19 @@ def handle_movie_recommendation(from_user_openid):
                 "您可以尝试评价更多热门电影，或稍后再试。"
             )
         
-        # 获取推荐电影的详细信息
-        movies_info = []
-        for movie_id in movie_ids:
-            movie = db_manager.get_movie_by_id(movie_id)
-            if movie:
-                movies_info.append(movie)
+        # 获取推荐电影的详细信息（从内存中的电影目录读取，保持推荐顺序）
+        with STAGE_SECONDS.time('recommend.catalog'):
+            movies_info = movie_catalog.get_movies_by_ids(movie_ids)
         
         # 格式化电影信息
         if movies_info:
             # 构建推荐结果消息
             # 调用更新后的 get_movie_details_for_display，传递推荐数量上限
-            recommendations_text = db_manager.get_movie_details_for_display(
-                movies_info, 
-                max_movies_to_display=DEFAULT_RECOMMENDATIONS_COUNT
-            )
+            with STAGE_SECONDS.time('recommend.format'):
+                recommendations_text = db_manager.get_movie_details_for_display(
+                    movies_info, 
+                    max_movies_to_display=DEFAULT_RECOMMENDATIONS_COUNT
+                )
             result = f"{recommendation_tip}为您推荐以下电影：\n\n{recommendations_text}"
             
             # 再次检查最终消息长度
@@ -364,6 +501,151 @@ def handle_movie_recommendation(from_user_openid):
         logger.error(f"电影推荐失败: {e}")
         return "生成电影推荐时出现内部错误，请稍后再试。"
 
+# 推荐在回复时限内未完成时的提示消息
+RECOMMENDATION_PENDING_MSG = "🎬 正在为您生成专属推荐，请稍等片刻后再发送「推荐」查看结果～"
+RECOMMENDATION_PUSH_MSG = "🎬 正在为您生成专属推荐，生成后会自动发送给您～"
+RECOMMENDATION_READY_TIP = "\n\n🎯 您之前请求的推荐已生成，发送「推荐」即可查看。"
+
+def _user_rating_version(from_user_openid):
+    """
+    用户当前的评分版本，与后台推荐结果一起保存；用户之后又评分时版本变化，已生成的推荐不再返回
+    """
+    return rating_versions.get_version(db_manager.get_user_id_by_openid(from_user_openid))
+
+def handle_recommendation_within_deadline(from_user_openid, deadline):
+    """
+    在回复时限内处理推荐请求
+
+    推荐计算交给后台线程，最多等待到deadline：
+    - 后台已生成的结果（上次请求超时）直接返回；生成后用户又评分过时丢弃，重新计算
+    - 时限内完成时返回推荐结果
+    - 超时时返回提示消息，结果在后台生成后保存，用户下次发送"推荐"时返回（或通过客服消息推送）
+
+    Args:
+        from_user_openid: 用户的OpenID
+        deadline: 回复时限（time.monotonic()时间）
+
+    Returns:
+        str: 回复内容
+    """
+    if not ASYNC_REPLY_CONFIG['enabled']:
+        return handle_movie_recommendation(from_user_openid)
+    try:
+        version = _user_rating_version(from_user_openid)
+        ready = async_replier.take_ready(from_user_openid, version)
+        if ready is not None:
+            return ready
+        done, result = async_replier.run(
+            from_user_openid, lambda: handle_movie_recommendation(from_user_openid), deadline, version
+        )
+    except Exception as e:
+        # 回复存储不可用时退回到同步计算
+        logger.error(f"异步推荐失败，改为同步计算: {e}")
+        return handle_movie_recommendation(from_user_openid)
+    if done:
+        return result
+    return RECOMMENDATION_PUSH_MSG if async_replier.sender is not None else RECOMMENDATION_PENDING_MSG
+
+def _reply_to_message(msg, from_user, to_user, msg_type, deadline):
+    """
+    按消息类型处理一条消息
+
+    Args:
+        msg: 解析后的消息字典
+        from_user: 用户OpenID
+        to_user: 公众号原始ID
+        msg_type: 消息类型
+        deadline: 回复时限（time.monotonic()时间）
+
+    Returns:
+        tuple: (统计耗时用的命令分类, XML格式的回复消息)
+    """
+    # 根据消息类型进行处理
+    if msg_type == 'text':
+        # 检查速率限制
+        with STAGE_SECONDS.time('rate_limit'):
+            allowed, rate_limit_msg = check_rate_limit(from_user)
+        if not allowed:
+            return 'rate_limited', build_text_response(from_user, to_user, rate_limit_msg)
+        
+        # 文本消息，提取内容
+        content = msg.get('Content', '').strip()
+        
+        # 内容长度限制
+        if len(content) > 200:
+            return 'too_long', build_text_response(from_user, to_user, "消息内容过长，请发送简短的指令。")
+        
+        # 根据内容判断是什么操作
+        # 1. 推荐命令
+        if content == "推荐":
+            command = 'recommend'
+            response_content = handle_recommendation_within_deadline(from_user, deadline)
+        
+        # 2. 评价命令
+        elif content.startswith("评价 "):
+            command = 'rate'
+            response_content = handle_movie_rating(from_user, content)
+        
+        # 3. 默认为电影搜索
+        else:
+            command = 'search'
+            response_content = handle_movie_search(from_user, content)
+        
+        # 上次超时的推荐已在后台生成时，提示用户发送"推荐"查看
+        if command != 'recommend' and ASYNC_REPLY_CONFIG['enabled']:
+            try:
+                if async_replier.has_ready(from_user, lambda: _user_rating_version(from_user)):
+                    response_content += RECOMMENDATION_READY_TIP
+            except Exception as e:
+                logger.error(f"查询用户 {from_user} 的异步推荐结果失败: {e}")
+        
+        # 构建并返回回复消息
+        return command, build_text_response(from_user, to_user, response_content)
+    
+    elif msg_type == 'event':
+        # 事件消息
+        event = msg.get('Event')
+        command = f"event.{event}" if event in ('subscribe', 'unsubscribe') else 'event.other'
+        
+        # 新用户关注
+        if event == 'subscribe':
+            # 获取用户ID（如不存在则创建）
+            db_manager.get_user_id_by_openid(from_user)
+            
+            # 欢迎语和使用说明
+            welcome_msg = (
+                "🎬✨ 欢迎来到刘鑫凯的智能电影推荐世界！✨\n\n"
+                "🎓 这是一个专为电影爱好者打造的AI推荐系统，"
+                "运用先进的协同过滤算法，为您量身定制专属观影清单！\n\n"
+                "🚀 三大核心功能，开启您的观影之旅：\n"
+                "🔍 电影搜索：想看什么直接说！\n"
+                "   例如：「肖申克的救赎」「复仇者联盟」\n"
+                "⭐ 电影评分：分享您的观影感受！\n"
+                "   例如：「评价 泰坦尼克号 9.5」\n"
+                "   一次评价多部：「评价 泰坦尼克号 9.5，盗梦空间 9」\n"
+                "🎯 智能推荐：发送「推荐」获取专属推荐！\n\n"
+                "💫 温馨提示：评价越多，推荐越精准！\n"
+                "让AI更懂您的电影品味～\n\n"
+                "📖 本系统为刘鑫凯毕业设计作品\n"
+                "《基于协同过滤算法的电影推荐系统研究与实现》"
+            )
+            return command, build_text_response(from_user, to_user, welcome_msg)
+        
+        # 用户取消关注
+        elif event == 'unsubscribe':
+            # 可选：标记用户不活跃或记录日志
+            logger.info(f"用户 {from_user} 取消关注")
+            # 微信规定取消关注事件不需要回复
+            return command, ""
+        
+        # 其他事件
+        else:
+            return command, build_text_response(from_user, to_user, "暂不支持此类型的事件")
+    
+    # 其他类型消息
+    else:
+        return 'unsupported', build_text_response(from_user, to_user, "暂只支持文本消息，请发送文字")
+
 def handle_wechat_message(xml_data):
     """
     处理微信消息主函数
@@ -374,6 +656,10 @@ def handle_wechat_message(xml_data):
     Returns:
         XML格式的回复消息
     """
+    start = time.perf_counter()
+    # 微信服务器等待被动回复的时限，从开始处理消息起计算
+    deadline = time.monotonic() + ASYNC_REPLY_CONFIG['reply_budget']
+    command = 'invalid'  # 统计耗时用的命令分类，在确定消息类别后更新
     try:
         # 输入验证
         if not xml_data:
@@ -396,78 +682,22 @@ def handle_wechat_message(xml_data):
             logger.error(f"消息缺少必要字段: FromUserName={from_user}, ToUserName={to_user}, MsgType={msg_type}")
             return ""
         
-        # 根据消息类型进行处理
-        if msg_type == 'text':
-            # 检查速率限制
-            allowed, rate_limit_msg = check_rate_limit(from_user)
-            if not allowed:
-                return build_text_response(from_user, to_user, rate_limit_msg)
-            
-            # 文本消息，提取内容
-            content = msg.get('Content', '').strip()
-            
-            # 内容长度限制
-            if len(content) > 200:
-                return build_text_response(from_user, to_user, "消息内容过长，请发送简短的指令。")
-            
-            # 根据内容判断是什么操作
-            # 1. 推荐命令
-            if content == "推荐":
-                response_content = handle_movie_recommendation(from_user)
-            
-            # 2. 评价命令
-            elif content.startswith("评价 "):
-                response_content = handle_movie_rating(from_user, content)
-            
-            # 3. 默认为电影搜索
-            else:
-                response_content = handle_movie_search(from_user, content)
-            
-            # 构建并返回回复消息
-            return build_text_response(from_user, to_user, response_content)
-        
-        elif msg_type == 'event':
-            # 事件消息
-            event = msg.get('Event')
-            
-            # 新用户关注
-            if event == 'subscribe':
-                # 获取用户ID（如不存在则创建）
-                db_manager.get_user_id_by_openid(from_user)
-                
-                # 欢迎语和使用说明
-                welcome_msg = (
-                    "🎬✨ 欢迎来到刘鑫凯的智能电影推荐世界！✨\n\n"
-                    "🎓 这是一个专为电影爱好者打造的AI推荐系统，"
-                    "运用先进的协同过滤算法，为您量身定制专属观影清单！\n\n"
-                    "🚀 三大核心功能，开启您的观影之旅：\n"
-                    "🔍 电影搜索：想看什么直接说！\n"
-                    "   例如：「肖申克的救赎」「复仇者联盟」\n"
-                    "⭐ 电影评分：分享您的观影感受！\n"
-                    "   例如：「评价 泰坦尼克号 9.5」\n"
-                    "🎯 智能推荐：发送「推荐」获取专属推荐！\n\n"
-                    "💫 温馨提示：评价越多，推荐越精准！\n"
-                    "让AI更懂您的电影品味～\n\n"
-                    "📖 本系统为刘鑫凯毕业设计作品\n"
-                    "《基于协同过滤算法的电影推荐系统研究与实现》"
-                )
-                return build_text_response(from_user, to_user, welcome_msg)
-            
-            # 用户取消关注
-            elif event == 'unsubscribe':
-                # 可选：标记用户不活跃或记录日志
-                logger.info(f"用户 {from_user} 取消关注")
-                # 微信规定取消关注事件不需要回复
-                return ""
-            
-            # 其他事件
-            else:
-                return build_text_response(from_user, to_user, "暂不支持此类型的事件")
-        
-        # 其他类型消息
-        else:
-            return build_text_response(from_user, to_user, "暂只支持文本消息，请发送文字")
+        # 微信服务器重试的消息不重复处理（也不计入速率限制），直接返回第一次处理的回复
+        def process():
+            nonlocal command
+            command, reply = _reply_to_message(msg, from_user, to_user, msg_type, deadline)
+            return reply
+
+        key = message_key(msg) if MESSAGE_DEDUP_CONFIG['enabled'] else None
+        if key is None:
+            return process()
+        reply, duplicate = message_deduplicator.run(key, process, deadline)
+        if duplicate:
+            command = 'duplicate'
+        return reply
     
     except Exception as e:
         logger.error(f"处理消息失败: {e}")
-        return "处理请求失败"
\ No newline at end of file
+        return "处理请求失败"
+    finally:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, command)
\ No newline at end of file
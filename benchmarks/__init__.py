@@ -0,0 +1,20 @@
+# Mindsnap团队的电影推荐系统分团队
+# 性能基准测试包
+
+############################################################
+# 使用说明
+############################################################
+# 基准测试脚本需要在项目根目录下以模块方式运行，例如：
+#   python -m benchmarks.bench_similarity
+#
+# benchmarks/
+#  ├── __init__.py          - 包初始化文件（当前文件）
+#  ├── synthetic.py         - 合成评分数据生成工具
+#  ├── bench_similarity.py  - 用户相似度计算：逐用户循环 vs 批量向量化
+#  ├── bench_item_cf.py     - 单次推荐耗时：User-CF（实时/索引） vs Item-CF
+#  ├── bench_title_search.py - 标题包含匹配：SQL LIKE vs 内存二元组倒排索引
+#  ├── check_user_upsert.py - 并发检查：openid解析不产生唯一键冲突或重复用户（需要MySQL）
+#  ├── bench_rating_loader.py - 加载全部评分的峰值内存：字典 vs 元组 vs 服务端游标分块数组（需要MySQL）
+#  ├── bench_rate_limiter.py - 10万用户下的速率限制检查：进程内存储 vs 多进程共享的SQLite存储
+#  ├── local_db.py          - 本地替身数据库：SQLite模拟MySQL，写入合成的电影、用户和评分
+#  └── bench_pipeline.py    - 推荐、搜索、评分和微信消息往返的p50/p95/p99耗时、吞吐量和峰值内存，结果写入JSON便于对比
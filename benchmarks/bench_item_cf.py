@@ -0,0 +1,96 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：单次推荐请求耗时，基于用户的协同过滤（实时计算邻居 / 查询邻居索引） vs 基于物品的协同过滤
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_item_cf
+#   python -m benchmarks.bench_item_cf --sizes 100000 --requests 50
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from app.rating_matrix import RatingMatrix
+from app.neighbor_index import build_neighbor_index
+from app.config import ITEM_SIMILARITY_TOP_K, ITEM_SIMILARITY_MIN_COMMON
+from app import rating_matrix, neighbor_index, item_similarity, recommendation_engine
+from benchmarks.synthetic import generate_ratings
+
+def _time_requests(func, user_ids, num_recommendations):
+    """依次为每个用户生成推荐，返回平均耗时（毫秒）和有结果的请求数"""
+    hits = 0
+    start = time.perf_counter()
+    for user_id in user_ids:
+        if func(user_id, num_recommendations):
+            hits += 1
+    return (time.perf_counter() - start) / len(user_ids) * 1000, hits
+
+def run(n_ratings, n_requests, num_recommendations, seed):
+    user_ids, movie_ids, scores = generate_ratings(n_ratings, seed=seed)
+    matrix = RatingMatrix.from_triples(user_ids, movie_ids, scores)
+    matrix.columns()
+
+    # 直接替换各模块的全局数据，推荐函数不再访问数据库
+    rating_matrix._matrix = matrix
+    neighbor_index._index = None
+
+    start = time.perf_counter()
+    item_similarity._table = build_neighbor_index(
+        matrix.transposed(), k=ITEM_SIMILARITY_TOP_K, min_common=ITEM_SIMILARITY_MIN_COMMON
+    )
+    item_build_seconds = time.perf_counter() - start
+
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(matrix.user_ids, size=min(n_requests, matrix.n_users), replace=False).tolist()
+
+    user_cf_live_ms, user_cf_hits = _time_requests(
+        recommendation_engine.get_user_cf_recommendations, targets, num_recommendations
+    )
+
+    start = time.perf_counter()
+    neighbor_index._index = build_neighbor_index(matrix)
+    user_build_seconds = time.perf_counter() - start
+    user_cf_indexed_ms, _ = _time_requests(
+        recommendation_engine.get_user_cf_recommendations, targets, num_recommendations
+    )
+
+    item_cf_ms, item_cf_hits = _time_requests(
+        recommendation_engine.get_item_cf_recommendations, targets, num_recommendations
+    )
+
+    return {
+        'ratings': n_ratings,
+        'users': matrix.n_users,
+        'movies': matrix.n_movies,
+        'user_cf_live_ms': user_cf_live_ms,
+        'user_cf_indexed_ms': user_cf_indexed_ms,
+        'item_cf_ms': item_cf_ms,
+        'user_index_build_s': user_build_seconds,
+        'item_table_build_s': item_build_seconds,
+        'user_cf_hits': user_cf_hits,
+        'item_cf_hits': item_cf_hits,
+        'requests': len(targets)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="User-CF与Item-CF单次推荐耗时基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help="评分条数")
+    parser.add_argument('--requests', type=int, default=20, help="每种规模的推荐请求数")
+    parser.add_argument('--count', type=int, default=5, help="每次推荐的电影数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    # 推荐函数每次请求都会输出INFO日志，基准测试中关闭
+    logging.disable(logging.INFO)
+
+    print(f"{'评分数':>10} {'用户数':>8} {'电影数':>8} {'User-CF实时(ms)':>16} {'User-CF索引(ms)':>16} "
+          f"{'Item-CF(ms)':>12} {'邻居索引构建(s)':>16} {'相似度表构建(s)':>16} {'有结果(U/I)':>12}")
+    for size in args.sizes:
+        r = run(size, args.requests, args.count, args.seed)
+        print(f"{r['ratings']:>10} {r['users']:>8} {r['movies']:>8} {r['user_cf_live_ms']:>16.2f} "
+              f"{r['user_cf_indexed_ms']:>16.2f} {r['item_cf_ms']:>12.2f} {r['user_index_build_s']:>16.2f} "
+              f"{r['item_table_build_s']:>16.2f} {r['user_cf_hits']:>5}/{r['item_cf_hits']:<5}")
+
+if __name__ == "__main__":
+    main()
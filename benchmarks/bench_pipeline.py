@@ -0,0 +1,373 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：推荐、搜索、评分和完整的微信消息处理流程，结果写入JSON文件，便于对比不同版本
+#
+# 合成的电影、用户和评分写入本地替身数据库（local_db.py，SQLite模拟MySQL），
+# db_manager、电影目录、评分矩阵、邻居索引、速率限制、消息去重、搜索记录写入等都使用实际的代码路径，不需要MySQL。
+#
+# 测试场景：
+#   recommend_cold    generate_recommendations，每次调用前清除该用户的推荐缓存
+#   recommend_cached  generate_recommendations，命中推荐缓存
+#   search            handle_movie_search：精确标题、标题片段、错一个字的标题、不存在的标题
+#   rating            handle_movie_rating：单部和一次评价多部电影（写入替身数据库并同步内存数据）
+#   wechat_message    handle_wechat_message：XML消息往返（推荐、搜索、评价、关注事件混合）
+#   wechat_retry      同上，重放wechat_message的消息（模拟微信服务器重试），直接返回去重表中保存的回复
+#   wechat_message_threads  同上，多个线程同时处理（--threads大于1时）
+# 每个场景报告p50/p95/p99耗时、吞吐量，以及单独重放一部分请求时tracemalloc统计的峰值内存增量；
+# meta中记录数据规模、准备耗时和进程峰值RSS，stages中为各阶段耗时指标（metrics模块）的汇总。
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_pipeline
+#   python -m benchmarks.bench_pipeline --ratings 1000000 --requests 2000 --output before.json
+#   python -m benchmarks.bench_pipeline --output after.json --baseline before.json   # 与上次结果对比
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app import db_manager, metrics, movie_catalog, neighbor_index, item_similarity, rating_matrix
+from app import async_reply, message_dedup, rate_limiter, rating_versions, recommendation_engine, search_log_writer
+from app import wechat_handler
+from app.config import ASYNC_REPLY_CONFIG, DEFAULT_RECOMMENDATIONS_COUNT, MESSAGE_DEDUP_CONFIG, RATE_LIMIT_CONFIG
+from app.config import RATING_VERSION_CONFIG, RECOMMENDATION_ALGORITHM
+from benchmarks import local_db
+
+# 每次请求都会输出多条INFO日志，测试时关闭，只保留警告和错误
+logging.disable(logging.INFO)
+
+OFFICIAL_ACCOUNT = 'gh_bench_account'
+
+############################################################
+# 准备数据
+############################################################
+def setup(directory, args):
+    """创建替身数据库并加载推荐数据，返回 (数据规模, 各步骤耗时)"""
+    timings = {}
+    start = time.perf_counter()
+    dataset = local_db.create_database(directory, args.ratings, args.users, args.movies, seed=args.seed)
+    timings['create_database_s'] = time.perf_counter() - start
+
+    db_manager.init_pool(connect_func=local_db.connector(dataset['path']))
+    # 速率限制使用临时目录中的SQLite存储（与生产配置相同的代码路径），上限足够大，测试请求不会被限制
+    rate_limiter.rate_limiter.backend = rate_limiter.create_backend(
+        dict(RATE_LIMIT_CONFIG, sqlite_path=os.path.join(directory, 'rate_limit.db'))
+    )
+    rate_limiter.rate_limiter.max_requests = sys.maxsize
+    async_reply.async_replier.store = async_reply.create_store(
+        dict(ASYNC_REPLY_CONFIG, sqlite_path=os.path.join(directory, 'async_reply.db'))
+    )
+    message_dedup.message_deduplicator.store = message_dedup.create_store(
+        dict(MESSAGE_DEDUP_CONFIG, sqlite_path=os.path.join(directory, 'message_dedup.db'))
+    )
+    rating_versions.store = rating_versions.create_store(
+        dict(RATING_VERSION_CONFIG, sqlite_path=os.path.join(directory, 'rating_versions.db'))
+    )
+    recommendation_engine.RECOMMENDATION_ALGORITHM = args.algorithm
+
+    start = time.perf_counter()
+    movie_catalog.load_movie_catalog()
+    timings['load_movie_catalog_s'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rating_matrix.load_rating_matrix()
+    timings['load_rating_matrix_s'] = time.perf_counter() - start
+
+    # 索引写入临时目录，不影响data/下的正式索引
+    start = time.perf_counter()
+    neighbor_index.rebuild_neighbor_index(os.path.join(directory, 'neighbor_index'))
+    timings['build_neighbor_index_s'] = time.perf_counter() - start
+    if args.algorithm == 'item_cf':
+        start = time.perf_counter()
+        item_similarity.rebuild_item_similarity(os.path.join(directory, 'item_similarity'))
+        timings['build_item_similarity_s'] = time.perf_counter() - start
+    return dataset, timings
+
+############################################################
+# 请求生成
+############################################################
+def _mutate_title(title, rng, chars):
+    """把标题中的一个字换成其他字（模拟错别字）"""
+    pos = int(rng.integers(len(title)))
+    return title[:pos] + str(rng.choice(chars)) + title[pos + 1:]
+
+def search_queries(titles, n, rng):
+    """标题搜索：40%精确标题，30%标题片段，20%错一个字的标题，10%不存在的标题"""
+    chars = sorted(set(''.join(titles)))
+    queries = []
+    for kind in rng.choice(4, size=n, p=[0.4, 0.3, 0.2, 0.1]).tolist():
+        title = titles[int(rng.integers(len(titles)))]
+        if kind == 0:
+            queries.append(title)
+        elif kind == 1:
+            length = min(len(title), 2 + int(rng.integers(2)))
+            start = int(rng.integers(len(title) - length + 1))
+            queries.append(title[start:start + length])
+        elif kind == 2:
+            queries.append(_mutate_title(title, rng, chars))
+        else:
+            queries.append('不存在的电影' + ''.join(str(c) for c in rng.choice(chars, size=4)))
+    return queries
+
+def rating_messages(titles, n, rng):
+    """评价命令：80%评价一部电影，20%一次评价三部电影"""
+    messages = []
+    for _ in range(n):
+        count = 1 if rng.random() < 0.8 else 3
+        items = [
+            f"{titles[int(rng.integers(len(titles)))]} {int(rng.integers(0, 101)) / 10:g}"
+            for _ in range(count)
+        ]
+        messages.append("评价 " + "，".join(items))
+    return messages
+
+def text_xml(openid, content, msg_id):
+    return (
+        f"<xml><ToUserName><![CDATA[{OFFICIAL_ACCOUNT}]]></ToUserName>"
+        f"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+        f"<CreateTime>{int(time.time())}</CreateTime><MsgType><![CDATA[text]]></MsgType>"
+        f"<Content><![CDATA[{content}]]></Content><MsgId>{msg_id}</MsgId></xml>"
+    ).encode('utf-8')
+
+def event_xml(openid, event):
+    return (
+        f"<xml><ToUserName><![CDATA[{OFFICIAL_ACCOUNT}]]></ToUserName>"
+        f"<FromUserName><![CDATA[{openid}]]></FromUserName>"
+        f"<CreateTime>{int(time.time())}</CreateTime><MsgType><![CDATA[event]]></MsgType>"
+        f"<Event><![CDATA[{event}]]></Event></xml>"
+    ).encode('utf-8')
+
+def wechat_messages(openids, titles, n, rng):
+    """消息混合：30%推荐，40%搜索，25%评价，5%关注事件（新用户）"""
+    searches = iter(search_queries(titles, n, rng))
+    ratings = iter(rating_messages(titles, n, rng))
+    messages = []
+    for i, kind in enumerate(rng.choice(4, size=n, p=[0.3, 0.4, 0.25, 0.05]).tolist()):
+        openid = openids[int(rng.integers(len(openids)))]
+        if kind == 0:
+            messages.append(text_xml(openid, "推荐", i))
+        elif kind == 1:
+            messages.append(text_xml(openid, next(searches), i))
+        elif kind == 2:
+            messages.append(text_xml(openid, next(ratings), i))
+        else:
+            messages.append(event_xml(f"oBenchNew{i:019d}", 'subscribe'))
+    return messages
+
+############################################################
+# 测量
+############################################################
+def measure(func, calls, before=None, threads=1, memory_sample=200):
+    """
+    依次（或用多个线程）执行func(*args)，返回耗时分布、吞吐量和峰值内存增量
+
+    Args:
+        func (callable): 被测函数
+        calls (list): 每次调用的参数元组
+        before (callable, optional): 每次调用前执行、不计入耗时的准备函数，参数与func相同
+        threads (int): 并发线程数
+        memory_sample (int): 在tracemalloc下重放的调用数（tracemalloc会显著拖慢执行，不与耗时测量同时进行）
+    """
+    def timed_call(args):
+        if before is not None:
+            before(*args)
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            latencies = np.fromiter(pool.map(timed_call, calls), dtype=np.float64, count=len(calls))
+    else:
+        latencies = np.fromiter((timed_call(args) for args in calls), dtype=np.float64, count=len(calls))
+    wall = time.perf_counter() - wall_start
+
+    sample = calls[:memory_sample]
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    for args in sample:
+        if before is not None:
+            before(*args)
+        func(*args)
+    peak_alloc = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        'requests': len(calls),
+        'threads': threads,
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'mean_ms': round(float(latencies.mean() * 1000), 4),
+        'max_ms': round(float(latencies.max() * 1000), 4),
+        'throughput_per_s': round(len(calls) / wall, 1),
+        'peak_alloc_kb': round(peak_alloc / 1024, 1),
+        'memory_sample': len(sample)
+    }
+
+def stage_breakdown():
+    """各阶段耗时指标的汇总：{指标{标签}: {'count': 次数, 'mean_ms': 平均耗时}}"""
+    result = {}
+    for name, metric in metrics.snapshot().items():
+        if metric['type'] != 'histogram':
+            continue
+        for labels, values in metric['series']:
+            count = sum(values[:-1])
+            label = ','.join(str(value) for value in labels)
+            key = f"{name}{{{label}}}" if label else name
+            result[key] = {'count': count, 'mean_ms': round(values[-1] / count * 1000, 4) if count else 0}
+    return result
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset, setup_timings = setup(tmp, args)
+        titles = [record.title for record in movie_catalog.get_movie_catalog().by_rating]
+        matrix = rating_matrix.get_rating_matrix()
+        rated_users = rng.choice(matrix.user_ids, size=args.requests).tolist()
+        openids = [local_db.openid_for(user_id) for user_id in range(1, dataset['users'] + 1)]
+
+        def forget_recommendations(user_id, count):
+            recommendation_engine.invalidate_recommendations(user_id)
+
+        def forget_message(xml):
+            # 删除去重记录，重放的消息按新消息处理
+            msg = {child.tag: child.text for child in ET.fromstring(xml)}
+            message_dedup.message_deduplicator.store.release(message_dedup.message_key(msg))
+
+        recommend_calls = [(user_id, DEFAULT_RECOMMENDATIONS_COUNT) for user_id in rated_users]
+        search_calls = [
+            (openids[int(rng.integers(len(openids)))], query)
+            for query in search_queries(titles, args.requests, rng)
+        ]
+        rating_calls = [
+            (openids[int(rng.integers(len(openids)))], message)
+            for message in rating_messages(titles, args.requests, rng)
+        ]
+        message_calls = [(xml,) for xml in wechat_messages(openids, titles, args.requests, rng)]
+
+        results = {}
+        results['recommend_cold'] = measure(
+            recommendation_engine.generate_recommendations, recommend_calls,
+            before=forget_recommendations, memory_sample=args.memory_sample
+        )
+        results['recommend_cached'] = measure(
+            recommendation_engine.generate_recommendations, recommend_calls,
+            memory_sample=args.memory_sample
+        )
+        results['search'] = measure(
+            wechat_handler.handle_movie_search, search_calls, memory_sample=args.memory_sample
+        )
+        results['rating'] = measure(
+            wechat_handler.handle_movie_rating, rating_calls, memory_sample=args.memory_sample
+        )
+        results['wechat_message'] = measure(
+            wechat_handler.handle_wechat_message, message_calls,
+            before=forget_message, memory_sample=args.memory_sample
+        )
+        results['wechat_retry'] = measure(
+            wechat_handler.handle_wechat_message, message_calls, memory_sample=args.memory_sample
+        )
+        if args.threads > 1:
+            results['wechat_message_threads'] = measure(
+                wechat_handler.handle_wechat_message, message_calls,
+                before=forget_message, threads=args.threads, memory_sample=0
+            )
+        search_log_writer.flush_and_stop()
+        db_manager.close_pool()
+
+    return {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'args': vars(args),
+            'dataset': {key: value for key, value in dataset.items() if key != 'path'},
+            'setup': {key: round(value, 3) for key, value in setup_timings.items()},
+            # Linux下ru_maxrss单位为KB
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        },
+        'results': results,
+        'stages': stage_breakdown()
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+############################################################
+# 输出
+############################################################
+def print_results(report, baseline=None):
+    meta = report['meta']
+    print(f"数据规模: {meta['dataset']['movies']} 部电影, {meta['dataset']['users']} 个用户, "
+          f"{meta['dataset']['ratings']} 条评分；进程峰值RSS {meta['peak_rss_mb']} MB")
+    print(f"{'场景':<24}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'次/秒':>10}{'峰值内存(KB)':>14}")
+    for name, r in report['results'].items():
+        print(f"{name:<24}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{r['throughput_per_s']:>10.0f}{r['peak_alloc_kb']:>14.1f}")
+    if baseline is None:
+        return
+    print(f"\n与基准结果对比（{baseline['meta'].get('git_commit')}，正数表示变慢/变少）:")
+    print(f"{'场景':<24}{'p50':>10}{'p95':>10}{'p99':>10}{'次/秒':>10}")
+    for name, r in report['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        changes = [_change(r[key], old[key]) for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_per_s')]
+        print(f"{name:<24}" + ''.join(f"{change:>10}" for change in changes))
+
+def _change(new, old):
+    return f"{(new - old) / old * 100:+.1f}%" if old else '-'
+
+def main():
+    parser = argparse.ArgumentParser(description="推荐、搜索、评分和微信消息处理流程基准测试")
+    parser.add_argument('--ratings', type=int, default=100_000, help="合成评分条数")
+    parser.add_argument('--users', type=int, default=None, help="用户数，默认平均每个用户约50条评分")
+    parser.add_argument('--movies', type=int, default=None, help="电影数，默认为评分条数的1/200（至少200部）")
+    parser.add_argument('--requests', type=int, default=500, help="每个场景的请求数")
+    parser.add_argument('--threads', type=int, default=4, help="并发场景的线程数，1表示跳过并发场景")
+    parser.add_argument('--algorithm', choices=['user_cf', 'item_cf'], default=RECOMMENDATION_ALGORITHM,
+                        help="协同过滤算法")
+    parser.add_argument('--memory-sample', type=int, default=200, help="每个场景在tracemalloc下重放的请求数")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=os.path.join('data', 'benchmarks', f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"),
+                        help="结果JSON文件")
+    parser.add_argument('--baseline', help="对比的上一次结果JSON文件")
+    args = parser.parse_args()
+
+    report = run(args)
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    print(f"\n结果已写入 {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：速率限制 RateLimiter.is_allowed 在10万个不同用户下的耗时和内存，进程内存储 vs 多进程共享的SQLite存储
+#
+# 每种存储依次测量：
+#   首次请求   - 每个用户请求一次（创建计数）
+#   重复请求   - 随机用户的请求（少数用户请求频繁），报告每次调用的p50/p99耗时
+#   内存/文件  - 进程内存储为tracemalloc统计的计数占用（单独重放一遍，不影响耗时），SQLite为数据库文件大小
+#   清理       - 时间窗口过后移除空闲用户的耗时，以及剩余的用户数
+# SQLite存储另外用多个进程同时请求，报告总吞吐量，并检查同一个用户在多个进程中的请求总数不超过限制
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_rate_limiter
+#   python -m benchmarks.bench_rate_limiter --users 100000 --requests 200000 --processes 4
+
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.rate_limiter import MemoryBackend, RateLimiter, SQLiteBackend
+
+MAX_REQUESTS = 10
+TIME_WINDOW = 60
+
+# 被限制的请求每次都会输出一条警告日志，测试时关闭
+logging.getLogger('app.rate_limiter').setLevel(logging.ERROR)
+
+def _openids(n_users):
+    return [f"oBench{i:022d}" for i in range(n_users)]
+
+def _request_order(openids, n_requests, seed):
+    """Zipf分布抽取请求的用户：少数用户请求很频繁（会被限制），多数用户只请求几次"""
+    rng = np.random.default_rng(seed)
+    ranks = rng.zipf(1.3, size=n_requests) % len(openids)
+    return [openids[i] for i in ranks.tolist()]
+
+def _timed_calls(limiter, keys):
+    latencies = np.empty(len(keys))
+    allowed = 0
+    for i, key in enumerate(keys):
+        start = time.perf_counter()
+        allowed += limiter.is_allowed(key)
+        latencies[i] = time.perf_counter() - start
+    return latencies, allowed
+
+def _memory_backend_mb(openids, requests):
+    backend = MemoryBackend(idle_timeout=TIME_WINDOW)
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, backend=backend)
+    tracemalloc.start()
+    for key in openids + requests:
+        limiter.is_allowed(key)
+    memory_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    tracemalloc.stop()
+    return memory_mb
+
+def run(name, backend, openids, requests):
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, backend=backend)
+    first, _ = _timed_calls(limiter, openids)
+    repeat, allowed = _timed_calls(limiter, requests)
+    if isinstance(backend, SQLiteBackend):
+        memory_mb = os.path.getsize(backend.path) / 1024 / 1024
+    else:
+        memory_mb = _memory_backend_mb(openids, requests)
+
+    keys_before = len(backend)
+    start = time.perf_counter()
+    backend.evict_idle(time.time() + 3 * TIME_WINDOW)
+    evict_ms = (time.perf_counter() - start) * 1000
+    return {
+        'name': name,
+        'first_us': first.mean() * 1e6,
+        'p50_us': np.percentile(repeat, 50) * 1e6,
+        'p99_us': np.percentile(repeat, 99) * 1e6,
+        'ops': len(requests) / repeat.sum(),
+        'rejected': len(requests) - allowed,
+        'memory_mb': memory_mb,
+        'keys': keys_before,
+        'evict_ms': evict_ms,
+        'keys_after': len(backend)
+    }
+
+def _process_worker(path, keys, results):
+    limiter = RateLimiter(MAX_REQUESTS, TIME_WINDOW, backend=SQLiteBackend(path))
+    start = time.perf_counter()
+    allowed = sum(limiter.is_allowed(key) for key in keys)
+    results.put((allowed, time.perf_counter() - start))
+
+def run_processes(path, requests, n_processes):
+    """多个进程同时请求同一个SQLite文件，返回 (总吞吐量, 同一个用户在所有进程中被允许的请求数)"""
+    chunks = [requests[i::n_processes] + ['oBenchShared'] * 20 for i in range(n_processes)]
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_process_worker, args=(path, chunk, results)) for chunk in chunks]
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+    for _ in processes:
+        results.get()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+    remaining = SQLiteBackend(path).remaining('oBenchShared', MAX_REQUESTS, TIME_WINDOW, time.time())
+    return sum(len(chunk) for chunk in chunks) / elapsed, MAX_REQUESTS - remaining
+
+def main():
+    parser = argparse.ArgumentParser(description="速率限制基准测试")
+    parser.add_argument('--users', type=int, default=100_000, help="不同用户数")
+    parser.add_argument('--requests', type=int, default=200_000, help="重复请求阶段的请求数")
+    parser.add_argument('--processes', type=int, default=4, help="SQLite多进程测试的进程数，0表示跳过")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    openids = _openids(args.users)
+    requests = _request_order(openids, args.requests, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        results = [
+            run('memory', MemoryBackend(idle_timeout=TIME_WINDOW), openids, requests),
+            run('sqlite', SQLiteBackend(os.path.join(tmp, 'rate_limit.db'), idle_timeout=TIME_WINDOW),
+                openids, requests),
+        ]
+        print(f"{args.users} 个用户, {args.requests} 次重复请求 (每个用户每 {TIME_WINDOW} 秒最多 {MAX_REQUESTS} 次)")
+        print(f"{'存储':<8}{'首次(us)':>10}{'p50(us)':>10}{'p99(us)':>10}{'次/秒':>10}{'被限制':>8}"
+              f"{'内存/文件(MB)':>15}{'用户数':>8}{'清理(ms)':>10}{'清理后':>8}")
+        for r in results:
+            print(f"{r['name']:<8}{r['first_us']:>10.1f}{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['ops']:>10.0f}"
+                  f"{r['rejected']:>8}{r['memory_mb']:>15.1f}{r['keys']:>8}{r['evict_ms']:>10.1f}{r['keys_after']:>8}")
+
+        if args.processes:
+            path = os.path.join(tmp, 'rate_limit_processes.db')
+            ops, shared_allowed = run_processes(path, requests, args.processes)
+            print(f"sqlite {args.processes} 个进程: 总计 {ops:.0f} 次/秒；同一用户在 {args.processes} 个进程中各请求20次，"
+                  f"共允许 {shared_allowed} 次（限制 {MAX_REQUESTS} 次）")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：加载全部评分的峰值内存，get_all_user_ratings（字典） vs fetchall元组 vs 服务端游标分块加载为数组
+#
+# 需要连接config.py中DB_CONFIG配置的MySQL数据库（已执行database_schema.sql，movies表中已有电影）。
+# 每种加载方式在单独的子进程中运行，峰值内存（ru_maxrss）互不影响，报告的是相对导入完成后的增量。
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_rating_loader                 # 使用ratings表中已有的评分
+#   python -m benchmarks.bench_rating_loader --seed 1000000  # 先写入100万条合成评分，结束后删除
+#
+# --seed 写入的评分属于 "bench-loader-" 前缀的临时用户，对应到movies表中已有的电影，
+# 结束后删除这些用户（评分随外键级联删除），--keep 保留这些数据以便重复运行。
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+import uuid
+
+LOADERS = ('dict', 'tuples', 'stream')
+LOADER_NAMES = {
+    'dict': 'get_all_user_ratings (DictCursor + fetchall + 每条评分一个字典)',
+    'tuples': 'fetch_rating_triples (元组游标 + fetchall) + np.array',
+    'stream': 'load_rating_arrays (SSCursor分块 -> int32/float64数组)',
+}
+
+def _current_rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+def fetch_rating_triples():
+    """
+    对比基线：用元组游标一次fetchall全部评分，返回[(user_id, movie_id, score), ...]
+
+    评分矩阵改为load_rating_arrays分块加载之前的做法，只在本基准测试中使用
+    """
+    import pymysql
+    from app import db_manager
+    with db_manager.db_connection() as conn:
+        with conn.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute("SELECT user_id, movie_id, score FROM ratings")
+            return list(cursor.fetchall())
+
+def measure(loader):
+    """在当前进程中运行一种加载方式，输出JSON：评分数、耗时、导入后RSS和峰值RSS（KB）"""
+    import numpy as np
+    from app import db_manager
+    from app.rating_matrix import load_rating_arrays
+    db_manager.init_pool(max_size=1)
+
+    baseline = _current_rss_kb()
+    start = time.perf_counter()
+    if loader == 'dict':
+        ratings = db_manager.get_all_user_ratings()
+        rows = sum(len(user_ratings) for user_ratings in ratings.values())
+    elif loader == 'tuples':
+        triples = fetch_rating_triples()
+        arrays = np.array(triples, dtype=np.float64)
+        rows = len(arrays)
+    else:
+        user_ids, movie_ids, scores = load_rating_arrays()
+        rows = len(user_ids)
+    seconds = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # Linux下单位为KB
+    print(json.dumps({'rows': rows, 'seconds': seconds, 'baseline_kb': baseline, 'peak_kb': peak}))
+
+def seed(n_ratings, prefix):
+    """写入n_ratings条合成评分，返回写入的评分数"""
+    from app import db_manager
+    from benchmarks.synthetic import generate_ratings
+
+    with db_manager.db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT id FROM movies ORDER BY id")
+            movie_ids = [row['id'] for row in cursor.fetchall()]
+    if len(movie_ids) < 200:
+        raise SystemExit(f"movies表中只有 {len(movie_ids)} 部电影，至少需要200部")
+
+    user_ids, synthetic_movies, scores = generate_ratings(n_ratings, n_movies=len(movie_ids))
+    openids = {user_id: f"{prefix}{user_id}" for user_id in set(user_ids.tolist())}
+    real_user_ids = db_manager.upsert_users(openids.values())
+
+    written = 0
+    chunk = 50000
+    for start in range(0, n_ratings, chunk):
+        batch = [
+            (real_user_ids[openids[user_id]], movie_ids[movie - 1], score)
+            for user_id, movie, score in zip(
+                user_ids[start:start + chunk].tolist(),
+                synthetic_movies[start:start + chunk].tolist(),
+                scores[start:start + chunk].tolist()
+            )
+        ]
+        result = db_manager.add_or_update_ratings(batch)
+        written += result['inserted'] + result['updated']
+        print(f"  已写入 {written}/{n_ratings}", end='\r', flush=True)
+    print()
+    return written
+
+def cleanup(prefix):
+    from app import db_manager
+    with db_manager.db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("DELETE FROM users WHERE openid LIKE %s", (prefix + '%',))
+
+def main():
+    parser = argparse.ArgumentParser(description="评分加载峰值内存对比")
+    parser.add_argument('--seed', type=int, default=0, help="先写入的合成评分条数（0表示使用已有数据）")
+    parser.add_argument('--keep', action='store_true', help="保留--seed写入的数据")
+    parser.add_argument('--loaders', default=','.join(LOADERS), help="要比较的加载方式，逗号分隔")
+    parser.add_argument('--measure', choices=LOADERS, help=argparse.SUPPRESS)  # 子进程内部使用
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    prefix = f"bench-loader-{uuid.uuid4().hex[:8]}-"
+    if args.seed:
+        print(f"写入 {args.seed} 条合成评分 ...")
+        seed(args.seed, prefix)
+    try:
+        print(f"{'加载方式':<60}{'评分数':>10}{'耗时(秒)':>10}{'峰值内存增量(MB)':>18}")
+        for loader in args.loaders.split(','):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_rating_loader', '--measure', loader],
+                check=True, capture_output=True, text=True
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            delta_mb = (r['peak_kb'] - r['baseline_kb']) / 1024
+            print(f"{LOADER_NAMES[loader]:<60}{r['rows']:>10}{r['seconds']:>10.2f}{delta_mb:>18.1f}")
+    finally:
+        if args.seed and not args.keep:
+            cleanup(prefix)
+
+if __name__ == "__main__":
+    main()
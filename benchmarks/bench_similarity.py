@@ -0,0 +1,92 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：用户相似度计算，逐用户循环（原实现） vs 批量向量化（similarity.user_similarities）
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_similarity
+#   python -m benchmarks.bench_similarity --sizes 10000 100000 --targets 5
+
+import argparse
+import time
+
+import numpy as np
+
+from app.config import MIN_COMMON_RATINGS, SIMILAR_USERS_COUNT
+from app.rating_matrix import RatingMatrix
+from app import similarity
+from benchmarks.synthetic import generate_ratings, to_user_rating_dict
+
+def legacy_similarities(target_user_id, all_user_ratings):
+    """
+    原get_user_cf_recommendations中的相似度循环（保留作为对照）
+
+    Returns:
+        dict: {user_id: similarity}
+    """
+    target_user_ratings_dict = {r['movie_id']: r['score'] for r in all_user_ratings[target_user_id]}
+    user_similarity = {}
+    for other_user_id, other_user_ratings in all_user_ratings.items():
+        if other_user_id == target_user_id:
+            continue
+        other_user_ratings_dict = {r['movie_id']: r['score'] for r in other_user_ratings}
+        common_movies = set(target_user_ratings_dict.keys()) & set(other_user_ratings_dict.keys())
+        if len(common_movies) < MIN_COMMON_RATINGS:
+            continue
+        sum_squared_diff = 0
+        for movie_id in common_movies:
+            sum_squared_diff += (target_user_ratings_dict[movie_id] - other_user_ratings_dict[movie_id]) ** 2
+        area = sum_squared_diff / len(common_movies)
+        user_similarity[other_user_id] = 1 / (1 + area)
+    return user_similarity
+
+def run(n_ratings, n_targets, seed):
+    user_ids, movie_ids, scores = generate_ratings(n_ratings, seed=seed)
+    all_user_ratings = to_user_rating_dict(user_ids, movie_ids, scores)
+    matrix = RatingMatrix.from_triples(user_ids, movie_ids, scores)
+    matrix.columns()  # 按列存储的矩阵在服务中只构建一次，不计入单次请求耗时
+
+    rng = np.random.default_rng(seed)
+    targets = rng.choice(np.unique(user_ids), size=n_targets, replace=False).tolist()
+
+    legacy_time = 0.0
+    vector_time = 0.0
+    max_error = 0.0
+    for target in targets:
+        start = time.perf_counter()
+        expected = legacy_similarities(target, all_user_ratings)
+        legacy_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows, sims, _ = similarity.user_similarities(matrix, matrix.user_index[target])
+        similarity.top_neighbors(rows, sims, SIMILAR_USERS_COUNT)
+        vector_time += time.perf_counter() - start
+
+        # 结果校验：邻居集合和相似度数值必须与原实现一致
+        actual = dict(zip(matrix.user_ids[rows].tolist(), sims.tolist()))
+        assert set(actual) == set(expected), f"用户 {target} 的邻居集合不一致"
+        for user_id, value in expected.items():
+            max_error = max(max_error, abs(actual[user_id] - value))
+
+    return {
+        'ratings': n_ratings,
+        'users': len(all_user_ratings),
+        'legacy_ms': legacy_time / n_targets * 1000,
+        'vectorized_ms': vector_time / n_targets * 1000,
+        'max_abs_error': max_error
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="用户相似度计算基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help="评分条数")
+    parser.add_argument('--targets', type=int, default=3, help="每种规模测试的目标用户数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"{'评分数':>10} {'用户数':>8} {'原循环(ms)':>12} {'向量化(ms)':>12} {'加速比':>8} {'最大误差':>10}")
+    for size in args.sizes:
+        result = run(size, args.targets, args.seed)
+        speedup = result['legacy_ms'] / result['vectorized_ms'] if result['vectorized_ms'] else float('inf')
+        print(f"{result['ratings']:>10} {result['users']:>8} {result['legacy_ms']:>12.2f} "
+              f"{result['vectorized_ms']:>12.2f} {speedup:>8.1f} {result['max_abs_error']:>10.1e}")
+
+if __name__ == "__main__":
+    main()
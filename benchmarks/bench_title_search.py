@@ -0,0 +1,94 @@
+# Mindsnap团队的电影推荐系统分团队
+# 基准测试：电影标题包含匹配，SQL LIKE '%关键词%' 全表扫描 vs 内存二元组倒排索引（title_index.TitleIndex）
+#
+# SQL一侧使用内存SQLite数据库代替MySQL执行同样的查询语句：
+# 两者在LIKE以%开头时都无法使用标题索引，只能全表扫描，耗时随电影数线性增长；
+# 实际MySQL还要加上网络往返和读取SELECT *大字段的开销，这里的SQL耗时只是下限
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.bench_title_search
+#   python -m benchmarks.bench_title_search --sizes 10000 100000 --queries 500
+
+import argparse
+import sqlite3
+import time
+
+import numpy as np
+
+from app.movie_catalog import MovieCatalog, MovieRecord
+from benchmarks.synthetic import generate_titles
+
+def _build_sqlite(titles, ratings):
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE movies (id INTEGER PRIMARY KEY, title TEXT NOT NULL, douban_rating REAL)")
+    conn.execute("CREATE INDEX idx_movies_title ON movies (title)")
+    conn.execute("CREATE INDEX idx_movies_douban_rating ON movies (douban_rating)")
+    conn.executemany(
+        "INSERT INTO movies (id, title, douban_rating) VALUES (?, ?, ?)",
+        [(i + 1, title, rating) for i, (title, rating) in enumerate(zip(titles, ratings.tolist()))]
+    )
+    conn.commit()
+    return conn
+
+def _make_queries(titles, n_queries, rng):
+    """一半查询取自已有标题的子串（能找到结果），一半为随机组合（大多找不到）"""
+    queries = []
+    for _ in range(n_queries // 2):
+        title = titles[rng.integers(len(titles))]
+        start = int(rng.integers(0, len(title) - 1))
+        length = int(rng.integers(2, len(title) - start + 1))
+        queries.append(title[start:start + length])
+    for _ in range(n_queries - len(queries)):
+        a, b = rng.choice(len(titles), size=2)
+        queries.append(titles[a][:2] + titles[b][-2:])
+    return queries
+
+def run(n_movies, n_queries, limit, seed):
+    titles, ratings = generate_titles(n_movies, seed=seed)
+    conn = _build_sqlite(titles, ratings)
+    catalog = MovieCatalog(
+        MovieRecord({'id': i + 1, 'title': title, 'douban_rating': rating})
+        for i, (title, rating) in enumerate(zip(titles, ratings.tolist()))
+    )
+    start = time.perf_counter()
+    index = catalog.title_index
+    build_seconds = time.perf_counter() - start
+
+    queries = _make_queries(titles, n_queries, np.random.default_rng(seed))
+
+    # 评分相同时按ID排序，使两边的结果可以逐项比较
+    sql = "SELECT id FROM movies WHERE title LIKE ? ORDER BY douban_rating DESC, id LIMIT ?"
+    start = time.perf_counter()
+    expected = [[row[0] for row in conn.execute(sql, (f'%{q}%', limit))] for q in queries]
+    sql_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [[record.id for record in index.search_substring(q, limit)] for q in queries]
+    index_time = time.perf_counter() - start
+
+    assert actual == expected, "倒排索引与SQL的查询结果不一致"
+    return {
+        'movies': n_movies,
+        'sql_ms': sql_time / n_queries * 1000,
+        'index_ms': index_time / n_queries * 1000,
+        'build_s': build_seconds,
+        'hits': sum(1 for result in expected if result)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="电影标题包含匹配基准测试")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help="电影数")
+    parser.add_argument('--queries', type=int, default=200, help="查询次数")
+    parser.add_argument('--limit', type=int, default=6, help="每次查询返回的最大结果数")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+
+    print(f"{'电影数':>8} {'SQL LIKE(ms)':>14} {'倒排索引(ms)':>14} {'加速比':>8} {'索引构建(s)':>12} {'有结果查询':>10}")
+    for size in args.sizes:
+        r = run(size, args.queries, args.limit, args.seed)
+        speedup = r['sql_ms'] / r['index_ms'] if r['index_ms'] else float('inf')
+        print(f"{r['movies']:>8} {r['sql_ms']:>14.3f} {r['index_ms']:>14.3f} {speedup:>8.1f} "
+              f"{r['build_s']:>12.2f} {r['hits']:>6}/{args.queries}")
+
+if __name__ == "__main__":
+    main()
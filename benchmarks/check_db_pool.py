@@ -0,0 +1,239 @@
+# Mindsnap团队的电影推荐系统分团队
+# 连接池检查：用替身连接（不需要MySQL）验证连接池的容量、耗尽、复用和故障恢复
+#
+# 替身连接只记录是否被关闭，健康检查函数按替身连接上的标记决定是否失败，
+# connect_func可以设置为下一次调用时抛出异常（模拟数据库不可用）。检查的情况：
+#   exhaustion     连接数达到max_size后，acquire在acquire_timeout后抛出PoolExhaustedError
+#   reuse          归还的连接被下一次acquire复用，不新建连接
+#   wait_release   连接池已满时等待的线程在其他线程归还连接后取得连接
+#   ping_failure   健康检查失败的空闲连接被关闭并替换为新连接
+#   connect_error  connect_func抛出异常时释放占用的名额，之后仍能建立max_size个连接
+#   discard        release(discard=True)和代码块内回滚失败的连接被关闭，名额释放
+#   reap_idle      reap()回收空闲超过max_idle_time的连接
+#   reap_lifetime  reap()回收存活超过max_lifetime的连接，超龄的使用中连接在归还时关闭
+#   closed         close()后关闭空闲连接，acquire抛出PoolExhaustedError
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.check_db_pool
+
+import threading
+import time
+
+from app.db_pool import ConnectionPool, PoolExhaustedError
+
+class FakeConnection:
+    """替身连接：记录编号、是否关闭，broken为True时健康检查失败"""
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.broken = False
+        self.rollback_fails = False
+
+    def rollback(self):
+        if self.rollback_fails:
+            raise ConnectionError("连接已断开")
+
+    def close(self):
+        self.closed = True
+
+class FakeConnector:
+    """替身connect_func：按顺序编号创建连接，fail_next次调用抛出异常"""
+
+    def __init__(self):
+        self.created = []
+        self.fail_next = 0
+
+    def __call__(self):
+        if self.fail_next:
+            self.fail_next -= 1
+            raise ConnectionError("无法连接到数据库")
+        conn = FakeConnection(len(self.created))
+        self.created.append(conn)
+        return conn
+
+def fake_ping(conn):
+    if conn.broken:
+        raise ConnectionError("ping失败")
+
+def make_pool(**options):
+    connector = FakeConnector()
+    options.setdefault('max_size', 2)
+    options.setdefault('acquire_timeout', 0.1)
+    # 检查中直接调用reap()，不启动后台回收线程
+    pool = ConnectionPool(connector, reap_interval=0, ping_func=fake_ping, **options)
+    return pool, connector
+
+############################################################
+# 检查项，每项返回失败原因列表（空列表表示通过）
+############################################################
+def check_exhaustion():
+    pool, _ = make_pool()
+    a, b = pool.acquire(), pool.acquire()
+    start = time.monotonic()
+    try:
+        pool.acquire()
+        return ["连接池已满时acquire没有抛出PoolExhaustedError"]
+    except PoolExhaustedError:
+        pass
+    problems = []
+    if time.monotonic() - start < pool.acquire_timeout * 0.9:
+        problems.append("没有等待acquire_timeout就抛出了PoolExhaustedError")
+    stats = pool.stats()
+    if stats['timeouts'] != 1 or stats['size'] != 2:
+        problems.append(f"统计信息不正确: {stats}")
+    pool.release(a)
+    pool.release(b)
+    return problems
+
+def check_reuse():
+    pool, connector = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    again = pool.acquire()
+    pool.release(again)
+    problems = []
+    if again is not conn:
+        problems.append("归还的连接没有被复用")
+    if len(connector.created) != 1:
+        problems.append(f"新建了 {len(connector.created)} 个连接，应为1个")
+    return problems
+
+def check_wait_release():
+    pool, _ = make_pool(max_size=1, acquire_timeout=2)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    pool.release(held)
+    waiter.join(2)
+    if got != [held]:
+        return ["等待中的线程没有取得归还的连接"]
+    pool.release(got[0])
+    return []
+
+def check_ping_failure():
+    pool, connector = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.broken = True
+    replacement = pool.acquire()
+    problems = []
+    if replacement is conn or not conn.closed:
+        problems.append("健康检查失败的连接没有被关闭和替换")
+    stats = pool.stats()
+    if stats['health_failures'] != 1 or stats['size'] != 1:
+        problems.append(f"统计信息不正确: {stats}")
+    pool.release(replacement)
+    if len(connector.created) != 2:
+        problems.append(f"新建了 {len(connector.created)} 个连接，应为2个")
+    return problems
+
+def check_connect_error():
+    pool, connector = make_pool()
+    connector.fail_next = 2
+    problems = []
+    for _ in range(2):
+        try:
+            pool.acquire()
+            problems.append("connect_func抛出的异常没有传给调用方")
+        except ConnectionError:
+            pass
+    if pool.stats()['size'] != 0:
+        problems.append(f"建立连接失败后名额没有释放: {pool.stats()}")
+    try:
+        conns = [pool.acquire(), pool.acquire()]
+    except PoolExhaustedError:
+        return problems + ["建立连接失败后无法再取得max_size个连接"]
+    for conn in conns:
+        pool.release(conn)
+    return problems
+
+def check_discard():
+    pool, _ = make_pool(max_size=1)
+    problems = []
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    if not conn.closed or pool.stats()['size'] != 0:
+        problems.append("release(discard=True)没有关闭连接并释放名额")
+    try:
+        with pool.connection() as conn:
+            conn.rollback_fails = True
+            raise ValueError("查询出错")
+    except ValueError:
+        pass
+    if not conn.closed or pool.stats()['size'] != 0:
+        problems.append("回滚失败的连接没有被丢弃")
+    return problems
+
+def check_reap_idle():
+    pool, _ = make_pool(max_idle_time=0.05, max_lifetime=0)
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    time.sleep(0.1)
+    pool.release(b)  # 刚归还，未超过空闲时间
+    reaped = pool.reap()
+    problems = []
+    if reaped != 1 or not a.closed or b.closed:
+        problems.append(f"reap()应只回收空闲超时的连接，实际回收 {reaped} 个")
+    stats = pool.stats()
+    if stats['size'] != 1 or stats['idle'] != 1:
+        problems.append(f"统计信息不正确: {stats}")
+    return problems
+
+def check_reap_lifetime():
+    pool, _ = make_pool(max_idle_time=0, max_lifetime=0.05)
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    time.sleep(0.1)
+    problems = []
+    if pool.reap() != 1 or not a.closed:
+        problems.append("reap()没有回收超龄的空闲连接")
+    pool.release(b)  # 使用中超龄的连接在归还时关闭
+    if not b.closed:
+        problems.append("超龄的使用中连接归还时没有被关闭")
+    if pool.stats()['size'] != 0:
+        problems.append(f"统计信息不正确: {pool.stats()}")
+    return problems
+
+def check_closed():
+    pool, _ = make_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+    pool.close()
+    problems = []
+    if not conn.closed:
+        problems.append("close()没有关闭空闲连接")
+    try:
+        pool.acquire()
+        problems.append("关闭后acquire没有抛出PoolExhaustedError")
+    except PoolExhaustedError:
+        pass
+    return problems
+
+CHECKS = [
+    ('exhaustion', check_exhaustion),
+    ('reuse', check_reuse),
+    ('wait_release', check_wait_release),
+    ('ping_failure', check_ping_failure),
+    ('connect_error', check_connect_error),
+    ('discard', check_discard),
+    ('reap_idle', check_reap_idle),
+    ('reap_lifetime', check_reap_lifetime),
+    ('closed', check_closed),
+]
+
+def main():
+    failed = 0
+    for name, check in CHECKS:
+        problems = check()
+        print(f"{name:<15} {'通过' if not problems else '失败'}")
+        for problem in problems:
+            print(f"  {problem}")
+        failed += bool(problems)
+    print("通过" if not failed else f"失败: {failed} 项")
+    raise SystemExit(0 if not failed else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Mindsnap团队的电影推荐系统分团队
+# 并发检查：多个线程同时为同一批新用户解析openid，验证不会出现唯一键冲突或重复用户
+#
+# 需要连接config.py中DB_CONFIG配置的MySQL数据库（已执行database_schema.sql）。
+# 检查使用 "bench-upsert-" 前缀的临时openid，结束后删除这些用户。
+#
+# 运行方式（项目根目录下）：
+#   python -m benchmarks.check_user_upsert
+#   python -m benchmarks.check_user_upsert --threads 32 --users 200
+#   python -m benchmarks.check_user_upsert --legacy   # 对照：原来的先查询再插入，会出现唯一键冲突
+
+import argparse
+import threading
+import time
+import uuid
+
+from app import db_manager
+
+def legacy_get_user_id_by_openid(openid):
+    """原get_user_id_by_openid的实现：先SELECT，不存在再INSERT（两次往返，存在竞争）"""
+    user = db_manager.get_user_by_openid(openid)
+    if user:
+        return user['id']
+    return db_manager.create_user(openid)
+
+def run(n_threads, n_users, legacy=False):
+    prefix = f"bench-upsert-{uuid.uuid4().hex[:8]}-"
+    openids = [f"{prefix}{i}" for i in range(n_users)]
+    resolve = legacy_get_user_id_by_openid if legacy else db_manager.upsert_user
+    db_manager.init_pool(max_size=n_threads)
+
+    results = [dict() for _ in range(n_threads)]
+    errors = []
+    barrier = threading.Barrier(n_threads)
+
+    def worker(slot):
+        barrier.wait()  # 所有线程同时开始，最大化同一openid的并发
+        for openid in openids:
+            try:
+                results[slot][openid] = resolve(openid)
+            except Exception as e:
+                errors.append(f"{openid}: {e}")
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # 同一openid在所有线程中必须解析为同一个用户ID
+    inconsistent = [
+        openid for openid in openids
+        if len({result[openid] for result in results if openid in result}) > 1
+    ]
+    with db_manager.db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT openid, COUNT(*) AS n FROM users WHERE openid LIKE %s GROUP BY openid",
+                (prefix + '%',)
+            )
+            rows = cursor.fetchall()
+            cursor.execute("DELETE FROM users WHERE openid LIKE %s", (prefix + '%',))
+    duplicates = [row['openid'] for row in rows if row['n'] > 1]
+
+    return {
+        'calls': n_threads * n_users,
+        'errors': errors,
+        'inconsistent': inconsistent,
+        'rows': len(rows),
+        'duplicates': duplicates,
+        'elapsed': elapsed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="openid解析并发检查")
+    parser.add_argument('--threads', type=int, default=16, help="并发线程数")
+    parser.add_argument('--users', type=int, default=100, help="新用户数")
+    parser.add_argument('--legacy', action='store_true', help="检查原来的先查询再插入实现")
+    args = parser.parse_args()
+
+    r = run(args.threads, args.users, args.legacy)
+    print(f"实现: {'先查询再插入' if args.legacy else 'INSERT ... ON DUPLICATE KEY UPDATE'}")
+    print(f"调用次数: {r['calls']}, 耗时: {r['elapsed']:.2f} 秒")
+    print(f"异常数: {len(r['errors'])}, ID不一致的openid: {len(r['inconsistent'])}, "
+          f"用户记录数: {r['rows']}/{args.users}, 重复用户: {len(r['duplicates'])}")
+    for error in r['errors'][:5]:
+        print(f"  {error}")
+    ok = not r['errors'] and not r['inconsistent'] and not r['duplicates'] and r['rows'] == args.users
+    print("通过" if ok else "失败")
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
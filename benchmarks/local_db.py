@@ -0,0 +1,294 @@
+# Mindsnap团队的电影推荐系统分团队
+# 本地替身数据库：用SQLite文件模拟MySQL，基准测试不需要MySQL服务器即可运行db_manager的全部数据函数
+#
+# 提供db_manager用到的PyMySQL接口子集：
+#   连接  cursor(cursorclass)、commit、rollback、begin、ping、close
+#   游标  execute、executemany、fetchone、fetchall、fetchmany、rowcount、lastrowid，支持with语句
+# 默认游标返回字典（对应DictCursor），指定pymysql.cursors.Cursor/SSCursor等游标类时返回元组。
+# db_manager中的MySQL专有写法在执行前转换为SQLite的等价写法，见 _translate。
+#
+# 用法：
+#   path = local_db.create_database(directory, n_ratings=100000)
+#   db_manager.init_pool(connect_func=local_db.connector(path))
+
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from benchmarks.synthetic import generate_ratings, generate_titles
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    douban_rating REAL,
+    rating_count INTEGER,
+    release_date TEXT,
+    actors TEXT,
+    directors TEXT,
+    genres TEXT,
+    plot_summary TEXT,
+    poster_url TEXT,
+    douban_url TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_movies_title ON movies (title);
+CREATE INDEX IF NOT EXISTS idx_movies_douban_rating ON movies (douban_rating);
+
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    openid TEXT NOT NULL UNIQUE,
+    nickname TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    last_active_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    movie_id INTEGER NOT NULL REFERENCES movies (id) ON DELETE CASCADE,
+    score REAL NOT NULL,
+    rated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, movie_id)
+);
+CREATE INDEX IF NOT EXISTS idx_ratings_movie_id ON ratings (movie_id);
+
+CREATE TABLE IF NOT EXISTS search_logs (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+    search_query TEXT NOT NULL,
+    search_time TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+_GENRES = ('剧情', '喜剧', '动作', '爱情', '科幻', '动画', '悬疑', '惊悚', '犯罪', '冒险', '家庭', '传记')
+
+def openid_for(user_id):
+    """合成用户的openid，与create_database写入users表的一致"""
+    return f"oBench{user_id:022d}"
+
+############################################################
+# 合成数据
+############################################################
+def create_database(directory, n_ratings, n_users=None, n_movies=None, seed=42):
+    """
+    在directory下创建SQLite数据库并写入合成的电影、用户和评分
+
+    评分由synthetic.generate_ratings生成（电影热门程度为长尾分布），
+    电影标题和豆瓣评分由synthetic.generate_titles生成，其余字段为固定格式的填充内容
+
+    Args:
+        directory (str): 数据库文件所在目录
+        n_ratings (int): 评分条数
+        n_users (int, optional): 用户数
+        n_movies (int, optional): 电影数
+        seed (int): 随机种子，相同参数生成相同数据
+
+    Returns:
+        dict: {'path': 数据库文件路径, 'movies': 电影数, 'users': 用户数, 'ratings': 评分条数}
+    """
+    user_ids, movie_ids, scores = generate_ratings(n_ratings, n_users=n_users, n_movies=n_movies, seed=seed)
+    n_users = n_users or int(user_ids.max())
+    n_movies = n_movies or int(movie_ids.max())
+    titles, douban_ratings = generate_titles(n_movies, seed=seed)
+    rng = np.random.default_rng(seed)
+    rating_counts = rng.integers(100, 2_000_000, size=n_movies).tolist()
+    years = rng.integers(1950, 2025, size=n_movies).tolist()
+
+    path = os.path.join(directory, 'movie_recommendation_system.db')
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(_SCHEMA)
+        conn.executemany(
+            "INSERT INTO movies (id, title, douban_rating, rating_count, release_date, actors, directors, genres, "
+            "plot_summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    i + 1, title, rating, rating_counts[i], str(years[i]),
+                    f"演员{i % 97},演员{i % 89},演员{i % 83}", f"导演{i % 211}",
+                    f"{_GENRES[i % len(_GENRES)]},{_GENRES[(i * 7 + 3) % len(_GENRES)]}",
+                    f"《{title}》的剧情简介。" + "故事发生在一个普通的城市，主人公经历了一系列意想不到的事情。" * 3
+                )
+                for i, (title, rating) in enumerate(zip(titles, douban_ratings.tolist()))
+            )
+        )
+        conn.executemany(
+            "INSERT INTO users (id, openid) VALUES (?, ?)",
+            ((user_id, openid_for(user_id)) for user_id in range(1, n_users + 1))
+        )
+        conn.executemany(
+            "INSERT INTO ratings (user_id, movie_id, score) VALUES (?, ?, ?)",
+            zip(user_ids.tolist(), movie_ids.tolist(), scores.tolist())
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return {'path': path, 'movies': n_movies, 'users': n_users, 'ratings': len(user_ids)}
+
+############################################################
+# PyMySQL接口
+############################################################
+def connector(path, busy_timeout=5.0):
+    """
+    返回创建替身数据库连接的函数，作为db_manager.init_pool的connect_func
+
+    Args:
+        path (str): create_database创建的数据库文件
+        busy_timeout (float): 等待其他连接释放写锁的最长时间（秒）
+    """
+    def connect():
+        return Connection(path, busy_timeout)
+    return connect
+
+# MySQL专有写法 -> SQLite写法
+_USER_UPSERT = re.compile(r"ON DUPLICATE KEY UPDATE id = LAST_INSERT_ID\(id\)", re.I)
+_RATING_UPSERT = re.compile(r"ON DUPLICATE KEY UPDATE score = VALUES\(score\), rated_at = NOW\(\)", re.I)
+_INSERT_IGNORE = re.compile(r"^\s*INSERT IGNORE", re.I)
+_LEFT = re.compile(r"\bLEFT\((\w+), (\d+)\)", re.I)  # SQLite中LEFT是关键字，改用substr
+
+def _translate(sql):
+    """
+    转换db_manager使用的MySQL语句
+
+    Returns:
+        tuple: (SQLite语句, 模拟MySQL返回值的方式：None / 'user_upsert' / 'rating_upsert')
+    """
+    mode = None
+    if _USER_UPSERT.search(sql):
+        sql = _USER_UPSERT.sub("ON CONFLICT (openid) DO NOTHING", sql)
+        mode = 'user_upsert'
+    elif _RATING_UPSERT.search(sql):
+        sql = _RATING_UPSERT.sub(
+            "ON CONFLICT (user_id, movie_id) DO UPDATE SET score = excluded.score, rated_at = CURRENT_TIMESTAMP", sql
+        )
+        mode = 'rating_upsert'
+    sql = _INSERT_IGNORE.sub("INSERT OR IGNORE", sql)
+    sql = _LEFT.sub(r"substr(\1, 1, \2)", sql)
+    return sql.replace('%s', '?'), mode
+
+class Connection:
+    """SQLite连接，提供db_manager用到的PyMySQL连接接口"""
+
+    def __init__(self, path, busy_timeout=5.0):
+        # 连接池可能在一个线程中创建连接、在另一个线程中使用
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self.open = True
+
+    def cursor(self, cursorclass=None):
+        # 未指定游标类时使用连接的默认游标（DictCursor），返回字典
+        return Cursor(self, as_dict=cursorclass is None)
+
+    def begin(self):
+        self._conn.execute("BEGIN")
+
+    def commit(self):
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def rollback(self):
+        if self._conn.in_transaction:
+            self._conn.execute("ROLLBACK")
+
+    def ping(self, reconnect=False):
+        if not self.open:
+            raise sqlite3.ProgrammingError("连接已关闭")
+
+    def close(self):
+        self.open = False
+        self._conn.close()
+
+class Cursor:
+    """SQLite游标，提供db_manager用到的PyMySQL游标接口"""
+
+    def __init__(self, connection, as_dict):
+        self._connection = connection
+        self._as_dict = as_dict
+        self._cursor = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        if self._cursor is not None:
+            self._cursor.close()
+            self._cursor = None
+
+    def execute(self, query, args=None):
+        sql, mode = _translate(query)
+        params = tuple(args) if args is not None else ()
+        conn = self._connection._conn
+        if mode == 'rating_upsert':
+            # MySQL的影响行数：新插入为1，更新为2
+            self.rowcount = 2 if self._rating_exists(params[0], params[1]) else 1
+            self._cursor = conn.execute(sql, params)
+            return self.rowcount
+        self._cursor = conn.execute(sql, params)
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        if mode == 'user_upsert':
+            # MySQL中已存在的用户通过LAST_INSERT_ID(id)返回其ID，影响行数为0
+            if self.rowcount == 0:
+                self.lastrowid = conn.execute("SELECT id FROM users WHERE openid = ?", params).fetchone()[0]
+        return self.rowcount
+
+    def executemany(self, query, args):
+        sql, mode = _translate(query)
+        rows = [tuple(row) for row in args]
+        conn = self._connection._conn
+        # 与PyMySQL合并为一条多行INSERT一样，整批在一个事务中写入
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            if mode == 'rating_upsert':
+                self.rowcount = sum(2 if self._rating_exists(row[0], row[1]) else 1 for row in rows)
+                conn.executemany(sql, rows)
+            else:
+                self._cursor = conn.executemany(sql, rows)
+                self.rowcount = self._cursor.rowcount
+            if own_transaction:
+                conn.execute("COMMIT")
+        except BaseException:
+            if own_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return self.rowcount
+
+    def _rating_exists(self, user_id, movie_id):
+        return self._connection._conn.execute(
+            "SELECT 1 FROM ratings WHERE user_id = ? AND movie_id = ?", (user_id, movie_id)
+        ).fetchone() is not None
+
+    def _convert(self, row):
+        if row is None or not self._as_dict:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._convert(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._convert(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        if not self._as_dict:
+            return self._cursor.fetchall()
+        columns = [column[0] for column in self._cursor.description]
+        return [dict(zip(columns, row)) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
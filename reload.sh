@@ -0,0 +1,25 @@
+#!/bin/bash
+# Mindsnap团队的电影推荐系统分团队 - 平滑重载脚本
+# 多进程模式下通知主进程重新加载推荐数据并替换工作进程，正在处理的请求不受影响
+
+# 设置颜色输出
+echogreen() { echo -e "\033[0;32m$1\033[0m"; }
+echored() { echo -e "\033[0;31m$1\033[0m"; }
+
+# 配置变量
+PROJECT_DIR="$PWD"
+PID_FILE="$PROJECT_DIR/app.pid"
+
+if [ ! -f "$PID_FILE" ]; then
+  echored "未找到PID文件，服务可能未运行。"
+  exit 1
+fi
+
+PID=$(cat "$PID_FILE")
+if ! ps -p "$PID" > /dev/null; then
+  echored "服务进程 $PID 未运行。"
+  exit 1
+fi
+
+kill -HUP "$PID"
+echogreen "已通知服务进程 $PID 平滑重载，查看日志确认重载完成: tail -f $PROJECT_DIR/app.log"
@@ -75,14 +75,14 @@ if [ -f "$PID_FILE" ]; then
     echo "确认服务正在运行，准备停止..."
     kill "$PID"
     
-    # 等待进程结束
-    for i in {1..5}; do
+    # 等待进程结束（多进程模式下工作进程会先处理完正在处理的请求，最长约15秒）
+    for i in {1..15}; do
       if ! ps -p "$PID" > /dev/null; then
         echogreen "服务已成功停止"
         rm -f "$PID_FILE"
         break
       fi
-      echo "等待服务停止... ($i/5)"
+      echo "等待服务停止... ($i/15)"
       sleep 1
     done
     